@@ -0,0 +1,165 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from rna_clique.find_homologs import HomologFinder, highest_bitscores
+
+def handle_arguments():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare two-pass and single-pass selection of reciprocal best "
+            "matches."
+        )
+    )
+    parser.add_argument("--genes", type=int, default=1_000_000)
+    parser.add_argument(
+        "--matches",
+        type=int,
+        default=3,
+        help="Average number of best matches per query gene."
+    )
+    parser.add_argument("--keep-all", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--checks",
+        type=int,
+        default=200,
+        help="Number of small random pairs on which to compare results."
+    )
+    parser.add_argument("--seed", type=int, default=486)
+    return parser.parse_args()
+
+def generate(genes: int, matches: int, rng: np.random.Generator):
+    rows = genes * matches
+    qgenes = rng.integers(0, genes, rows)
+    # Make most matches reciprocal, as they are for closely related samples.
+    sgenes = np.where(
+        rng.random(rows) < 0.8,
+        qgenes,
+        rng.integers(0, genes, rows)
+    )
+    return pd.DataFrame(
+        {
+            "qgene": qgenes.astype(np.int32),
+            "qiso": rng.integers(0, 4, rows, dtype=np.int32),
+            "sgene": sgenes.astype(np.int32),
+            "siso": rng.integers(0, 4, rows, dtype=np.int32),
+            "bitscore": np.round(rng.gamma(2, 100, rows), 1),
+            "evalue": rng.random(rows),
+        }
+    )
+
+def baseline_combine_matches(
+        forward_matches: pd.DataFrame,
+        backward_matches: pd.DataFrame,
+        keep_all: bool
+) -> pd.DataFrame:
+    # The two-pass implementation formerly used by HomologFinder.
+    merge_columns = HomologFinder.merge_columns
+    forward_matches = forward_matches.reset_index(drop=True)
+    backward_matches = backward_matches.reset_index(drop=True)
+    forward_matches["reverse"] = False
+    backward_matches["reverse"] = True
+    backward_matches.rename(
+        columns={
+            a+v : b+v
+            for (a, b) in [("q", "s"), ("s", "q")]
+            for v in ["seqid", "gene", "iso"]
+        },
+        inplace=True
+    )
+    if forward_matches.empty or backward_matches.empty:
+        intersection = pd.DataFrame(
+            columns=merge_columns + ["index_x", "index_y"]
+        )
+    else:
+        # pd.merge does not specify the order of the rows for each left key,
+        # and it differs between pandas versions, so the rows are sorted by
+        # their positions in the left and then the right dataframe.
+        intersection = pd.merge(
+            forward_matches[merge_columns].reset_index(),
+            backward_matches[merge_columns].reset_index(),
+            how="inner",
+            on=merge_columns
+        ).sort_values(["index_x", "index_y"])
+    return highest_bitscores(
+        highest_bitscores(
+            pd.concat(
+                [
+                    forward_matches.loc[
+                        intersection["index_x"].drop_duplicates()
+                    ],
+                    backward_matches.loc[
+                        intersection["index_y"].drop_duplicates()
+                    ],
+                ]
+            ).reset_index(drop=True),
+            groupby=merge_columns,
+            keep="all"
+        ),
+        keep=["first", "all"][keep_all]
+    )
+
+def check(
+        finder: HomologFinder,
+        checks: int,
+        rng: np.random.Generator
+):
+    # Small pairs with few genes have many ties and repeated gene pairs, and
+    # their rows have arbitrary labels, as rows selected from BLAST hits do.
+    for _ in range(checks):
+        genes = int(rng.integers(1, 30))
+        forward, backward = (
+            generate(genes, int(rng.integers(1, 5)), rng)
+            for _ in range(2)
+        )
+        for df in [forward, backward]:
+            df["bitscore"] = np.round(df["bitscore"], -2)
+            df.index = rng.permutation(3 * len(df))[:len(df)]
+        pd.testing.assert_frame_equal(
+            finder.combine_matches(forward.copy(), backward.copy()),
+            baseline_combine_matches(
+                forward.copy(),
+                backward.copy(),
+                finder.keep_all
+            )
+        )
+    print(f"{checks} small pairs match.")
+
+def bench(name: str, repeat: int, f) -> pd.DataFrame:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = f()
+        best = min(best, time.perf_counter() - start)
+    print("{:<20} {:>10} rows {:>8.3f} s".format(name, len(res), best))
+    return res
+
+def main():
+    args = handle_arguments()
+    rng = np.random.default_rng(args.seed)
+    forward = generate(args.genes, args.matches, rng)
+    backward = generate(args.genes, args.matches, rng)
+    finder = HomologFinder.__new__(HomologFinder)
+    finder.keep_all = args.keep_all
+    check(finder, args.checks, rng)
+    expected = bench(
+        "two passes",
+        args.repeat,
+        lambda: baseline_combine_matches(
+            forward.copy(),
+            backward.copy(),
+            args.keep_all
+        )
+    )
+    res = bench(
+        "single pass",
+        args.repeat,
+        lambda: finder.combine_matches(forward.copy(), backward.copy())
+    )
+    pd.testing.assert_frame_equal(res, expected)
+
+if __name__ == "__main__":
+    main()
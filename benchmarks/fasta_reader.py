@@ -0,0 +1,73 @@
+import argparse
+import random
+import time
+
+import Bio.SeqIO
+
+from pathlib import Path
+
+from rna_clique.fasta import read_fasta, fasta_record_spans
+
+def handle_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compare FASTA parsing throughput."
+    )
+    parser.add_argument("path", type=Path)
+    parser.add_argument(
+        "--generate",
+        type=float,
+        metavar="GB",
+        help="Write a synthetic Trinity-style FASTA of about this size first."
+    )
+    parser.add_argument("--seed", type=int, default=486)
+    return parser.parse_args()
+
+def generate(path: Path, size: int, seed: int):
+    rng = random.Random(seed)
+    written = 0
+    i = 0
+    with open(path, "w") as f:
+        while written < size:
+            seq = "".join(rng.choices("ACGT", k=rng.randint(200, 4000)))
+            header = ">NODE_{}_length_{}_cov_{:.6f}_g{}_i{}\n".format(
+                i,
+                len(seq),
+                rng.uniform(1, 500),
+                i // 3,
+                i % 3
+            )
+            f.write(header)
+            for j in range(0, len(seq), 60):
+                f.write(seq[j:j + 60])
+                f.write("\n")
+            written += len(header) + len(seq) + len(seq) // 60 + 1
+            i += 1
+
+def bench(name: str, size: int, f):
+    start = time.perf_counter()
+    count = sum(1 for _ in f())
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<20} {:>10} records {:>8.2f} s {:>8.1f} MB/s".format(
+            name,
+            count,
+            elapsed,
+            size / elapsed / 1e6
+        )
+    )
+
+def main():
+    args = handle_arguments()
+    if args.generate:
+        generate(args.path, int(args.generate * 1e9), args.seed)
+    size = args.path.stat().st_size
+    bench("read_fasta", size, lambda: read_fasta(args.path))
+    bench("fasta_record_spans", size, lambda: fasta_record_spans(args.path))
+    bench(
+        "Bio.SeqIO.parse",
+        size,
+        lambda: Bio.SeqIO.parse(args.path, "fasta")
+    )
+
+if __name__ == "__main__":
+    main()
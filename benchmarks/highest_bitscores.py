@@ -0,0 +1,77 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from rna_clique.find_homologs import (
+    array_highest_bitscores,
+    pandas_highest_bitscores
+)
+
+def handle_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compare top-N selection of hits by bitscore."
+    )
+    parser.add_argument("--hits", type=int, default=5_000_000)
+    parser.add_argument("--genes", type=int, default=200_000)
+    parser.add_argument("-n", type=int, default=1)
+    parser.add_argument(
+        "--keep",
+        choices=["first", "all"],
+        default="first"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=486)
+    return parser.parse_args()
+
+def generate(hits: int, genes: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "qgene": rng.integers(0, genes, hits),
+            "sgene": rng.integers(0, genes, hits),
+            # Round bitscores so that ties occur, as they do in real output.
+            "bitscore": np.round(rng.gamma(2, 100, hits), 1),
+        }
+    )
+
+def bench(name: str, repeat: int, f) -> pd.DataFrame:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = f()
+        best = min(best, time.perf_counter() - start)
+    print("{:<30} {:>10} rows {:>8.3f} s".format(name, len(res), best))
+    return res
+
+def main():
+    args = handle_arguments()
+    df = generate(args.hits, args.genes, args.seed)
+    for groupby in ["qgene", ["qgene", "sgene"]]:
+        label = groupby if isinstance(groupby, str) else "+".join(groupby)
+        expected = bench(
+            f"pandas ({label})",
+            args.repeat,
+            lambda: pandas_highest_bitscores(
+                df,
+                args.n,
+                groupby,
+                keep=args.keep
+            )
+        )
+        res = bench(
+            f"array ({label})",
+            args.repeat,
+            lambda: array_highest_bitscores(
+                df,
+                args.n,
+                groupby,
+                keep=args.keep
+            )
+        )
+        if not res.index.equals(expected.index):
+            print("Results differ!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import pandas as pd
+
+from more_itertools import consume
+
+from rna_clique.find_all_pairs import find_all_pairs
+from rna_clique.gene_matches_tables import read_table
+from rna_clique.transcripts import TranscriptID, default_gene_re
+
+def handle_arguments():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare gene matches tables from pooled and per-pair BLAST "
+            "searches."
+        )
+    )
+    parser.add_argument(
+        "inputs",
+        type=Path,
+        nargs="+",
+        help="Top genes FASTA files of the samples."
+    )
+    parser.add_argument("--evalue", type=float, default=1e-99)
+    parser.add_argument("--top-matches", type=int, default=1)
+    parser.add_argument("--keep-all", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1)
+    return parser.parse_args()
+
+def run(
+        name: str,
+        inputs: list[Path],
+        root: Path,
+        hf_args: list,
+        jobs: int,
+        pooled: bool
+) -> dict[str, Path]:
+    out_dir = root / name
+    cache_dir = root / (name + "_cache")
+    out_dir.mkdir()
+    cache_dir.mkdir()
+    start = time.perf_counter()
+    tables, paths, _ = find_all_pairs(
+        inputs,
+        out_dir,
+        cache_dir,
+        lambda p: p.stem,
+        hf_args=hf_args,
+        jobs=jobs,
+        pooled=pooled
+    )
+    consume(tables)
+    print("{:<10} {:>8.3f} s".format(name, time.perf_counter() - start))
+    return {p.name: p for p in paths}
+
+def main():
+    args = handle_arguments()
+    hf_args = [
+        TranscriptID.parser_from_re(default_gene_re),
+        args.top_matches,
+        args.evalue,
+        args.keep_all
+    ]
+    differ = 0
+    with tempfile.TemporaryDirectory() as root:
+        root = Path(root)
+        expected = run("per-pair", args.inputs, root, hf_args, args.jobs, False)
+        res = run("pooled", args.inputs, root, hf_args, args.jobs, True)
+        for name, path in expected.items():
+            try:
+                pd.testing.assert_frame_equal(
+                    read_table(res[name]).reset_index(drop=True),
+                    read_table(path).reset_index(drop=True),
+                    check_categorical=False
+                )
+            except AssertionError as e:
+                differ += 1
+                print(f"{name}: tables differ.\n{e}")
+    print(f"{differ} of {len(expected)} tables differ.")
+    if differ:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from collections.abc import Sequence
+from typing import Optional
+
+from . import config as config_module
+from .app import eprint, set_except_hook
+from .filtered_distance import SampleSimilarity
+from .gene_matches_tables import get_table_files
+from .pair_stats import ComponentPairStats, pair_stats_path
+
+# Methods of resampling the ideal components.
+methods = ["bootstrap", "jackknife"]
+
+def build_parser():
+    arg_config = config_module.RNACliqueConfigArgumentManager(
+        description=(
+            "Compute distance matrices for resampled ideal components."
+        ),
+    )
+    arg_config.expose_fields_with_default_aliases(
+        "graph",
+        "tables_dir",
+        required=True
+    )
+    arg_config.expose_fields_with_default_aliases(
+        "output_dir",
+    )
+    arg_config.add_argument(
+        "-o",
+        "--replicates-file",
+        type=Path,
+        required=True,
+        help="output file for the stacked matrices (.h5 or .npz)"
+    )
+    arg_config.add_argument(
+        "-B",
+        "--replicates",
+        type=int,
+        default=100,
+        help="number of replicates"
+    )
+    arg_config.add_argument(
+        "--method",
+        choices=methods,
+        default="bootstrap",
+        help="how to resample the ideal components"
+    )
+    arg_config.add_argument(
+        "--jackknife-fraction",
+        type=float,
+        default=0.5,
+        help="fraction of components to delete in each jackknife replicate"
+    )
+    arg_config.add_argument(
+        "--seed",
+        type=int,
+        help="seed for the random number generator"
+    )
+    arg_config.add_argument(
+        "--pair-stats",
+        action="store_true",
+        help="save per-component statistics next to the graph"
+    )
+    return arg_config
+
+def bootstrap_weights(
+        components: int,
+        replicates: int,
+        rng: np.random.Generator
+) -> np.ndarray:
+    """Draw components with replacement for bootstrap replicates.
+
+    Parameters:
+        components (int): Number of ideal components.
+        replicates (int): Number of replicates.
+        rng:              Random number generator.
+
+    Returns:
+        The number of times each component was drawn in each replicate.
+    """
+    if components == 0:
+        return np.zeros((replicates, 0), dtype=np.int64)
+    return rng.multinomial(
+        components,
+        np.full(components, 1 / components),
+        size=replicates
+    )
+
+def jackknife_weights(
+        components: int,
+        replicates: int,
+        rng: np.random.Generator,
+        fraction: float = 0.5
+) -> np.ndarray:
+    """Delete a random subset of the components in each jackknife replicate.
+
+    Parameters:
+        components (int): Number of ideal components.
+        replicates (int): Number of replicates.
+        rng:              Random number generator.
+        fraction (float): Fraction of the components to delete.
+
+    Returns:
+        1 for each component kept in each replicate and 0 for each deleted.
+    """
+    keep = components - round(components * fraction)
+    ranks = np.argsort(rng.random((replicates, components)), axis=1)
+    return (ranks < keep).astype(np.int64)
+
+def replicate_matrices(
+        stats: ComponentPairStats,
+        replicates: int,
+        method: str = "bootstrap",
+        seed: Optional[int] = None,
+        fraction: float = 0.5
+) -> np.ndarray:
+    """Compute distance matrices for resampled ideal components.
+
+    Parameters:
+        stats:            Statistics for each ideal component and pair.
+        replicates (int): Number of replicates.
+        method (str):     "bootstrap" or "jackknife".
+        seed (int):       Seed for the random number generator.
+        fraction (float): Fraction of components deleted by the jackknife.
+
+    Returns:
+        The distance matrices (replicates x samples x samples), with samples
+        in order of stats.sorted_samples.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(stats.components)
+    if method == "bootstrap":
+        weights = bootstrap_weights(count, replicates, rng)
+    elif method == "jackknife":
+        weights = jackknife_weights(count, replicates, rng, fraction)
+    else:
+        raise ValueError(f"Unknown resampling method {method}.")
+    return stats.replicate_dissimilarities(weights)
+
+def save_replicates(
+        path: Path,
+        samples: Sequence[str],
+        matrices: np.ndarray
+):
+    """Save stacked distance matrices to an HDF5 or NPZ file.
+
+    Files ending in .npz contain a matrices array (replicates x samples x
+    samples) and a samples array. Otherwise, the matrices are stored in HDF5
+    format under the key "replicates" as one dataframe, indexed by replicate
+    and sample, with a column for each sample.
+
+    Parameters:
+        path:     Path to which to save the matrices.
+        samples:  Names of the samples, in order of rows and columns.
+        matrices: The stacked distance matrices.
+    """
+    path = Path(path)
+    samples = [str(s) for s in samples]
+    if path.suffix == ".npz":
+        np.savez(path, matrices=matrices, samples=np.array(samples))
+        return
+    pd.DataFrame(
+        matrices.reshape(-1, len(samples)),
+        index=pd.MultiIndex.from_product(
+            [range(len(matrices)), samples],
+            names=["replicate", "sample"]
+        ),
+        columns=samples
+    ).to_hdf(path, key="replicates", mode="w")
+
+def load_replicates(path: Path) -> tuple[list[str], np.ndarray]:
+    """Load stacked distance matrices saved by save_replicates.
+
+    Parameters:
+        path: Path to the saved matrices.
+
+    Returns:
+        The names of the samples and the stacked distance matrices.
+    """
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path) as f:
+            return list(f["samples"]), f["matrices"]
+    df = pd.read_hdf(path, key="replicates")
+    samples = list(df.columns)
+    return samples, df.to_numpy().reshape(-1, len(samples), len(samples))
+
+def main():
+    with set_except_hook():
+        parser = build_parser()
+        _, args, config = parser.get_arguments_and_config()
+    with set_except_hook(config.verbose):
+        if args.replicates < 1:
+            parser.parser.error("Number of replicates must be positive.")
+        if not 0 <= args.jackknife_fraction < 1:
+            parser.parser.error("Jackknife fraction must be in [0, 1).")
+        # Saved pair statistics are used if present; otherwise, the tables
+        # are read once to compute them.
+        sim = SampleSimilarity.from_filenames(
+            config.graph,
+            get_table_files(config.tables_dir),
+            store_dfs=False
+        )
+        stats = sim.pair_stats
+        if args.pair_stats:
+            stats.save(pair_stats_path(config.graph))
+        if len(stats.components) == 0:
+            eprint("No ideal components found. Cannot report distances!")
+            sys.exit(1)
+        matrices = replicate_matrices(
+            stats,
+            args.replicates,
+            args.method,
+            args.seed,
+            args.jackknife_fraction
+        )
+        save_replicates(args.replicates_file, stats.sorted_samples, matrices)
+
+if __name__ == "__main__":
+    main()
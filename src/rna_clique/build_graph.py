@@ -1,22 +1,18 @@
-import functools
-import operator
-import pickle
 
 
 from . import config as config_module
 from .app import eprint, set_except_hook
+from .compact_graph import CompactGraph, CompactGraphBuilder, save_graph
 from .gene_matches_tables import get_table_files, read_table
 
 from collections.abc import Iterable
+from typing import Optional
 
 import pandas as pd
 import networkx as nx
 
 from tqdm import tqdm
 
-# Since sum doesn't work on all objects.
-sum_ = functools.partial(functools.reduce, operator.add)
-
 def build_parser():
     arg_config = config_module.RNACliqueConfigArgumentManager(
         description=(
@@ -30,14 +26,48 @@ def build_parser():
     )
     arg_config.expose_fields_with_default_aliases(
         "output_dir",
+        "edge_stats",
     )
     arg_config.add_output_config_argument()
     return arg_config
 
-def make_edge(r):
-    return (r[0], r[1]), (r[2], r[3])
+def build_compact_graph(
+        dfs: Iterable[pd.DataFrame],
+        graph: Optional[CompactGraph] = None,
+        edge_stats: bool = False
+) -> CompactGraph:
+    """Build a CompactGraph from gene matches tables (dataframes).
+
+    The graph has the same vertices and edges as the graph built by
+    build_graph. Each table is ingested with a few array operations by a
+    CompactGraphBuilder, and duplicate vertices and edges are removed once all
+    tables have been ingested.
+
+    If edge_stats is True, the graph also stores the alignment statistics of
+    each edge, from which the filtered similarities can be computed without
+    reading the tables again (see CompactGraph.ideal_pair_sums). An existing
+    graph without edge statistics gives a graph without them.
+
+    Parameters:
+        dfs:               The gene matches tables for the samples under
+                           consideration.
+        graph:             Existing gene matches graph to which to add the
+                           tables.
+        edge_stats (bool): Store alignment statistics for each edge.
 
-def build_graph(dfs : Iterable[pd.DataFrame]) -> nx.Graph:
+    Returns:
+        The gene matches graph constructed from the given gene matches tables.
+    """
+    eprint("Building graph.")
+    builder = CompactGraphBuilder(graph, edge_stats=edge_stats)
+    for df in dfs:
+        builder.add_table(df)
+    return builder.build()
+
+def build_graph(
+        dfs : Iterable[pd.DataFrame],
+        graph: Optional[nx.Graph] = None
+) -> nx.Graph:
     """Build a gene matches graph from gene matches tables (dataframes).
 
     Each vertex in the gene matches graph is a tuple (s, g), where s is an
@@ -48,24 +78,22 @@ def build_graph(dfs : Iterable[pd.DataFrame]) -> nx.Graph:
     table together with s1sample = s1, s1gene = g1, s2sample = s2, g2sample =
     g2, OR s1sample = s2, s1gene = g2, s2sample = s1, s2gene = g1.
 
+    If an existing graph is provided, the vertices and edges from the given
+    tables are added to it in place. This allows a gene matches graph to be
+    updated with the tables for newly added samples without reading the tables
+    it was originally built from.
+
+    The tables are ingested by build_compact_graph, and the resulting vertices
+    and edges are added to the networkx Graph all at once.
+
     Parameters:
-        dfs: The gene matches tables for the samples under consideration.
+        dfs:   The gene matches tables for the samples under consideration.
+        graph: Existing gene matches graph to which to add the tables.
 
     Returns:
         The gene matches graph constructed from the given gene matches tables.
     """
-    graph = nx.Graph()
-    eprint("Building graph.")
-    for df in dfs:
-        all_cols = [[t + c for c in ["sample", "gene"]] for t in ["s", "q"]]
-        for cols in all_cols:
-            graph.add_nodes_from(
-                tuple(s) for s in df[cols].itertuples(index=False)
-            )
-        graph.add_edges_from(
-            make_edge(r) for r in df[sum_(all_cols)].itertuples(index=False)
-        )
-    return graph
+    return build_compact_graph(dfs).to_networkx(graph)
 
 def main():
     with set_except_hook():
@@ -79,11 +107,11 @@ def main():
                     config.tables_dir
                 )
             )
-        graph = build_graph(
-            read_table(f) for f in tqdm(tables)
+        graph = build_compact_graph(
+            (read_table(f) for f in tqdm(tables)),
+            edge_stats=config.edge_stats
         )
-        with open(config.graph, "wb") as f:
-            pickle.dump(graph, f, pickle.HIGHEST_PROTOCOL)
+        save_graph(graph, config.graph)
         config.mark_finish()
         if args.output_config:
             config.yaml_save(args.output_config)
@@ -0,0 +1,821 @@
+import itertools
+import json
+import os
+import pickle
+import tempfile
+
+from functools import cached_property
+from pathlib import Path
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+from .keys import pack_gene_pairs
+from .gene_matches_tables import read_table, write_table
+
+# Identifies files in the compact gene matches graph format.
+graph_magic = b"RCGRAPH\0"
+graph_format_version = 1
+# Arrays in the compact format start at multiples of this many bytes.
+graph_alignment = 64
+# Alignment statistics that can be stored for each edge.
+edge_stat_columns = ["nident", "length", "gaps"]
+
+def node_keys(samples: np.ndarray, genes: np.ndarray) -> np.ndarray:
+    """Pack sample indices and gene IDs into 64-bit vertex keys.
+
+    Keys sort in the same order as (sample, gene) pairs with nonnegative genes.
+    """
+    return pack_gene_pairs(samples, genes)
+
+def sorted_unique(keys: np.ndarray) -> np.ndarray:
+    """Get the sorted unique values of an integer array.
+
+    This is equivalent to np.unique, but sorting and comparing neighbours is
+    much faster than np.unique for large arrays of 64-bit keys.
+    """
+    keys = np.sort(keys)
+    if len(keys):
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+    return keys
+
+def sum_by_key(
+        keys: np.ndarray,
+        values: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get the sorted unique keys and the sums of the values for each key.
+
+    Parameters:
+        keys:   Integer keys, possibly repeated.
+        values: Values for each key (along the first axis).
+
+    Returns:
+        The sorted unique keys and the sum of the values for each of them.
+    """
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = values[order]
+    if len(keys) == 0:
+        return keys, values
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(values, starts, axis=0)
+
+def connected_component_labels(n: int, edges: np.ndarray) -> np.ndarray:
+    """Label the connected components of a graph given as an edge array.
+
+    The components are found by a vectorized union-find. In each round, the
+    root of every edge's endpoint with the larger root is linked to the
+    smaller root, and then every node is pointed directly at its root. Since a
+    node is only ever linked to a smaller node, the root of each component is
+    its smallest node, and edges whose endpoints already share a root are
+    dropped from later rounds.
+
+    Parameters:
+        n (int): The number of nodes in the graph.
+        edges:   An array of shape (m, 2) containing node indices.
+
+    Returns:
+        An array giving the component of each node, numbered from 0 in order of
+        the components' smallest nodes.
+    """
+    parent = np.arange(n, dtype=np.int64)
+    u = np.asarray(edges[:, 0], dtype=np.int64)
+    v = np.asarray(edges[:, 1], dtype=np.int64)
+    while True:
+        pu = parent[u]
+        pv = parent[v]
+        differ = pu != pv
+        if not differ.any():
+            break
+        u, v, pu, pv = u[differ], v[differ], pu[differ], pv[differ]
+        np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    roots = parent == np.arange(n)
+    return (np.cumsum(roots) - 1)[parent]
+
+class CompactGraph:
+    """A gene matches graph stored in NumPy arrays.
+
+    A gene matches graph stored as a networkx Graph uses a Python tuple for
+    every vertex and a dict entry for every edge, which takes tens of gigabytes
+    for large analyses, and traversing it to find connected components takes
+    minutes. A CompactGraph stores the same graph in a few arrays.
+
+    The samples are stored once in the samples list, and each vertex is given
+    by the index of its sample in that list and its gene ID, both 32-bit
+    integers. Every sample in the list has at least one vertex, and vertices
+    are sorted by sample and gene. Each edge is stored as a
+    pair of vertex indices, with the smaller index first, and edges are sorted
+    and unique.
+
+    The connected components are computed with a vectorized union-find, and
+    the numbers of vertices, edges, and distinct samples in every component are
+    computed together with a few array operations, so ideal components can be
+    found without constructing a subgraph for each component.
+
+    Optionally, a CompactGraph can also store the sums of the nident, length,
+    and gaps columns (see edge_stat_columns) over the table rows that gave each
+    edge. Every row of a table restricted to the ideal components gives an
+    edge inside an ideal component, so the filtered similarities can then be
+    computed from the edges alone (see ideal_pair_sums), without reading the
+    gene matches tables again.
+
+    Conversions from and to networkx are provided for code that requires a
+    networkx Graph. The edge statistics are not converted.
+
+    Attributes:
+        samples (list): Names of the samples.
+        node_samples:   Sample index of each vertex.
+        node_genes:     Gene ID of each vertex.
+        edges:          Vertex indices of the endpoints of each edge.
+        edge_stats:     Alignment statistics of each edge, or None.
+    """
+    # Graphs pickled before edge statistics were added have no edge_stats.
+    edge_stats: Optional[np.ndarray] = None
+
+    def __init__(
+            self,
+            samples: Sequence[str],
+            node_samples: np.ndarray,
+            node_genes: np.ndarray,
+            edges: np.ndarray,
+            edge_stats: Optional[np.ndarray] = None
+    ):
+        """Construct a CompactGraph from its arrays.
+
+        The arrays must already be in the canonical form described in the
+        class documentation; use from_node_keys to construct a CompactGraph
+        from arbitrary vertices and edges.
+
+        Parameters:
+            samples:      Names of the samples.
+            node_samples: Sample index of each vertex.
+            node_genes:   Gene ID of each vertex.
+            edges:        Vertex indices of the endpoints of each edge.
+            edge_stats:   Alignment statistics of each edge (m, 3), if known.
+        """
+        self.samples = list(samples)
+        self.node_samples = np.asarray(node_samples, dtype=np.int32)
+        self.node_genes = np.asarray(node_genes, dtype=np.int32)
+        self.edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        if edge_stats is not None:
+            self.edge_stats = np.asarray(edge_stats, dtype=np.int32).reshape(
+                -1,
+                len(edge_stat_columns)
+            )
+
+    @classmethod
+    def from_node_keys(
+            cls,
+            samples: Sequence[str],
+            keys: np.ndarray,
+            u_keys: np.ndarray,
+            v_keys: np.ndarray,
+            edge_stats: Optional[np.ndarray] = None
+    ) -> "CompactGraph":
+        """Construct a CompactGraph from vertices and edges given as keys.
+
+        Each vertex is given by a 64-bit key packing its sample index and gene
+        ID (see node_keys). Vertices and edges may be repeated, and the
+        endpoints of edges are added as vertices. If edge statistics are
+        given, the statistics of repeated edges are summed.
+
+        Parameters:
+            samples:    Names of the samples.
+            keys:       Keys of vertices.
+            u_keys:     Keys of the first endpoints of the edges.
+            v_keys:     Keys of the second endpoints of the edges.
+            edge_stats: Alignment statistics of the edges (optional).
+
+        Returns:
+            A CompactGraph with the given vertices and edges.
+        """
+        u_keys = np.asarray(u_keys, dtype=np.int64)
+        v_keys = np.asarray(v_keys, dtype=np.int64)
+        keys = sorted_unique(
+            np.concatenate([np.asarray(keys, dtype=np.int64), u_keys, v_keys])
+        )
+        u = np.searchsorted(keys, u_keys)
+        v = np.searchsorted(keys, v_keys)
+        edge_keys = pack_gene_pairs(np.minimum(u, v), np.maximum(u, v))
+        if edge_stats is None:
+            edge_keys = sorted_unique(edge_keys)
+        else:
+            edge_keys, edge_stats = sum_by_key(
+                edge_keys,
+                np.asarray(edge_stats, dtype=np.int64).reshape(
+                    -1,
+                    len(edge_stat_columns)
+                )
+            )
+        node_samples = keys >> 32
+        # Drop samples without vertices, so every sample has a vertex.
+        used = sorted_unique(node_samples)
+        if len(used) < len(samples):
+            samples = [samples[i] for i in used]
+            node_samples = np.searchsorted(used, node_samples)
+        return cls(
+            samples,
+            node_samples.astype(np.int32),
+            (keys & 0xFFFFFFFF).astype(np.uint32).view(np.int32),
+            np.column_stack([edge_keys >> 32, edge_keys & 0xFFFFFFFF]),
+            edge_stats
+        )
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph) -> "CompactGraph":
+        """Construct a CompactGraph from a networkx gene matches graph.
+
+        Parameters:
+            graph: Graph whose vertices are (sample, gene) pairs.
+
+        Returns:
+            A CompactGraph with the same vertices and edges.
+        """
+        samples = sorted({s for (s, _) in graph.nodes})
+        codes = {s: i for (i, s) in enumerate(samples)}
+
+        def keys(nodes: Iterable[tuple[str, int]]) -> np.ndarray:
+            nodes = list(nodes)
+            return node_keys(
+                np.fromiter((codes[s] for (s, _) in nodes), dtype=np.int64),
+                np.fromiter((g for (_, g) in nodes), dtype=np.int64)
+            )
+        edges = list(graph.edges)
+        return cls.from_node_keys(
+            samples,
+            keys(graph.nodes),
+            keys(u for (u, _) in edges),
+            keys(v for (_, v) in edges)
+        )
+
+    def to_networkx(self, graph: Optional[nx.Graph] = None) -> nx.Graph:
+        """Get an equivalent networkx Graph with (sample, gene) vertices.
+
+        Parameters:
+            graph: Existing networkx Graph to which to add vertices and edges.
+
+        Returns:
+            A networkx Graph containing the vertices and edges of this graph.
+        """
+        if graph is None:
+            graph = nx.Graph()
+        nodes = self.nodes()
+        graph.add_nodes_from(nodes)
+        graph.add_edges_from(
+            (nodes[u], nodes[v]) for (u, v) in self.edges.tolist()
+        )
+        return graph
+
+    def nodes(
+            self,
+            indices: Optional[np.ndarray] = None
+    ) -> list[tuple[str, int]]:
+        """Get vertices as (sample, gene) pairs.
+
+        Parameters:
+            indices: Indices of the vertices to get (all vertices by default).
+
+        Returns:
+            A list of (sample, gene) pairs.
+        """
+        if indices is None:
+            indices = slice(None)
+        return [
+            (self.samples[s], g) for (s, g) in zip(
+                self.node_samples[indices].tolist(),
+                self.node_genes[indices].tolist()
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self.node_samples)
+
+    def number_of_nodes(self) -> int:
+        """Get the number of vertices in the graph."""
+        return len(self)
+
+    def number_of_edges(self) -> int:
+        """Get the number of edges in the graph."""
+        return len(self.edges)
+
+    @property
+    def sample_count(self) -> int:
+        """The number of distinct samples among the vertices."""
+        return len(self.samples)
+
+    @cached_property
+    def components(self) -> np.ndarray:
+        """The connected component to which each vertex belongs."""
+        return connected_component_labels(len(self), self.edges)
+
+    @cached_property
+    def component_stats(self) -> pd.DataFrame:
+        """The numbers of vertices, edges, and samples in each component."""
+        labels = self.components
+        count = labels.max(initial=-1) + 1
+        nodes = np.bincount(labels, minlength=count)
+        edges = np.bincount(labels[self.edges[:, 0]], minlength=count)
+        # Count distinct (component, sample) pairs for each component.
+        pairs = sorted_unique(node_keys(labels, self.node_samples))
+        samples = np.bincount(pairs >> 32, minlength=count)
+        return pd.DataFrame(
+            {"nodes": nodes, "edges": edges, "samples": samples}
+        )
+
+    def component_summary(self, samples: Optional[int] = None) -> pd.DataFrame:
+        """Get component_stats with a column indicating ideal components.
+
+        Parameters:
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            A dataframe with nodes, edges, samples, and ideal columns.
+        """
+        summary = self.component_stats.copy()
+        summary["ideal"] = False
+        summary.loc[self.ideal_components(samples), "ideal"] = True
+        summary.index.name = "component"
+        return summary
+
+    def ideal_components(self, samples: Optional[int] = None) -> np.ndarray:
+        """Get the ideal components, assuming a given number of samples.
+
+        A component is ideal if it has exactly one vertex for each sample and
+        is a complete graph.
+
+        Parameters:
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            The indices of the ideal components.
+        """
+        if samples is None:
+            samples = self.sample_count
+        stats = self.component_stats
+        nodes = stats["nodes"].to_numpy()
+        return np.flatnonzero(
+            (nodes == samples) & (2 * stats["edges"] == nodes * (nodes - 1))
+        )
+
+    def component_nodes(self, components: np.ndarray) -> np.ndarray:
+        """Get the indices of the vertices in the given components."""
+        return np.flatnonzero(np.isin(self.components, components))
+
+    def ideal_pair_sums(
+            self,
+            samples: Optional[int] = None
+    ) -> Iterator[tuple[frozenset[str], int, int]]:
+        """Yield similarity sums for pairs of samples from the edge statistics.
+
+        The numerator and denominator for a pair of samples are the sums of
+        nident and of length minus gaps over the edges between their genes in
+        ideal components. These are the same as the sums over their gene
+        matches table restricted to genes in ideal components (see
+        similarity_arrays.table_sums), so the tables need not be read. Pairs
+        with no such edges are yielded with a denominator of zero.
+
+        Parameters:
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            The pair, numerator, and denominator for each pair of samples.
+        """
+        if self.edge_stats is None:
+            raise ValueError("The graph has no edge statistics.")
+        ideal = np.zeros(self.components.max(initial=-1) + 1, dtype=bool)
+        ideal[self.ideal_components(samples)] = True
+        selected = ideal[self.components[self.edges[:, 0]]]
+        edges = self.edges[selected]
+        stats = dict(zip(edge_stat_columns, self.edge_stats[selected].T))
+        a = self.node_samples[edges[:, 0]].astype(np.int64)
+        b = self.node_samples[edges[:, 1]].astype(np.int64)
+        n = len(self.samples)
+        pairs = np.minimum(a, b) * n + np.maximum(a, b)
+        # The sums are integers well below 2**53, so float64 weights are exact.
+        num = np.bincount(pairs, weights=stats["nident"], minlength=n * n)
+        den = np.bincount(
+            pairs,
+            weights=stats["length"].astype(np.int64) - stats["gaps"],
+            minlength=n * n
+        )
+        for i, j in itertools.combinations(range(n), 2):
+            yield (
+                frozenset((self.samples[i], self.samples[j])),
+                int(num[i * n + j]),
+                int(den[i * n + j])
+            )
+
+    def ideal_nodes(self, samples: Optional[int] = None) -> pd.DataFrame:
+        """Get a dataframe of the samples and genes in ideal components.
+
+        Parameters:
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            A dataframe with sample and gene columns.
+        """
+        nodes = self.component_nodes(self.ideal_components(samples))
+        return pd.DataFrame(
+            {
+                "sample": np.asarray(self.samples, dtype=object)[
+                    self.node_samples[nodes]
+                ],
+                "gene": self.node_genes[nodes].astype(np.int64),
+            }
+        )
+
+    def component_subgraphs(
+            self,
+            components: Optional[Iterable[int]] = None
+    ) -> Iterator[nx.Graph]:
+        """Yield the given components as networkx Graphs.
+
+        Parameters:
+            components: Indices of the components (all components by default).
+        """
+        labels = self.components
+        node_order = np.argsort(labels, kind="stable")
+        node_bounds = np.searchsorted(
+            labels[node_order],
+            np.arange(len(self.component_stats) + 1)
+        )
+        edge_labels = labels[self.edges[:, 0]]
+        edge_order = np.argsort(edge_labels, kind="stable")
+        edge_bounds = np.searchsorted(
+            edge_labels[edge_order],
+            np.arange(len(self.component_stats) + 1)
+        )
+        if components is None:
+            components = range(len(self.component_stats))
+        for c in components:
+            subgraph = nx.Graph()
+            nodes = node_order[node_bounds[c]:node_bounds[c + 1]]
+            subgraph.add_nodes_from(self.nodes(nodes))
+            edges = self.edges[edge_order[edge_bounds[c]:edge_bounds[c + 1]]]
+            subgraph.add_edges_from(
+                zip(self.nodes(edges[:, 0]), self.nodes(edges[:, 1]))
+            )
+            yield subgraph
+
+class CompactGraphBuilder:
+    """Builds a CompactGraph from gene matches tables.
+
+    Each table is added with a few array operations: the sample columns are
+    mapped to integer sample codes, and the edges given by the table's rows are
+    appended to a list of blocks of vertex keys. Duplicate vertices and edges
+    are only removed when the graph is built, so adding a table takes time
+    proportional to the size of the table, not of the graph.
+
+    If edge_stats is True, the nident, length, and gaps columns of each table
+    are also kept, and the built graph stores their sums for each edge (see
+    CompactGraph). An existing graph without edge statistics cannot provide
+    them, so adding one turns edge_stats off.
+
+    Attributes:
+        samples (list):    Names of the samples seen so far, in order of codes.
+        edge_stats (bool): Whether to store statistics for each edge.
+    """
+    def __init__(
+            self,
+            graph: Optional[CompactGraph] = None,
+            edge_stats: bool = False
+    ):
+        """Construct a CompactGraphBuilder.
+
+        Parameters:
+            graph:             Existing graph whose vertices and edges to
+                               include.
+            edge_stats (bool): Store alignment statistics for each edge.
+        """
+        self.samples = []
+        self.edge_stats = edge_stats
+        self._codes = {}
+        self._nodes = []
+        self._u = []
+        self._v = []
+        self._stats = []
+        if graph is not None:
+            self.add_graph(graph)
+
+    def sample_codes(self, values: pd.Series) -> np.ndarray:
+        """Get the sample code of each sample name, adding new samples."""
+        codes, uniques = pd.factorize(values)
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, sample in enumerate(uniques):
+            sample = str(sample)
+            if sample not in self._codes:
+                self._codes[sample] = len(self.samples)
+                self.samples.append(sample)
+            mapping[i] = self._codes[sample]
+        return mapping[codes]
+
+    def add_table(self, df: pd.DataFrame):
+        """Add the edges given by a gene matches table.
+
+        Parameters:
+            df: Gene matches table with sample and gene columns.
+        """
+        self._u.append(
+            node_keys(
+                self.sample_codes(df["ssample"]),
+                df["sgene"].to_numpy(dtype=np.int64)
+            )
+        )
+        self._v.append(
+            node_keys(
+                self.sample_codes(df["qsample"]),
+                df["qgene"].to_numpy(dtype=np.int64)
+            )
+        )
+        if self.edge_stats:
+            self._stats.append(df[edge_stat_columns].to_numpy(dtype=np.int64))
+
+    def add_graph(self, graph: CompactGraph):
+        """Add the vertices and edges of a CompactGraph."""
+        mapping = self.sample_codes(pd.Series(graph.samples))
+        keys = node_keys(mapping[graph.node_samples], graph.node_genes)
+        self._nodes.append(keys)
+        self._u.append(keys[graph.edges[:, 0]])
+        self._v.append(keys[graph.edges[:, 1]])
+        if graph.edge_stats is None:
+            self.edge_stats = False
+            self._stats = []
+        elif self.edge_stats:
+            self._stats.append(graph.edge_stats)
+
+    def build(self) -> CompactGraph:
+        """Build a CompactGraph from everything added so far."""
+        empty = np.empty(0, dtype=np.int64)
+        stats = None
+        if self.edge_stats:
+            stats = np.concatenate(
+                [np.empty((0, len(edge_stat_columns)), dtype=np.int64)]
+                + self._stats
+            )
+        return CompactGraph.from_node_keys(
+            self.samples,
+            np.concatenate([empty] + self._nodes),
+            np.concatenate([empty] + self._u),
+            np.concatenate([empty] + self._v),
+            stats
+        )
+
+def _aligned(offset: int) -> int:
+    return -(-offset // graph_alignment) * graph_alignment
+
+def _data_offset(magic: bytes, header_len: int) -> int:
+    return _aligned(len(magic) + 8 + header_len)
+
+def write_array_file(
+        path: Path,
+        magic: bytes,
+        header: dict,
+        arrays: dict[str, np.ndarray]
+):
+    """Write arrays to a file that can be memory-mapped by read_array_file.
+
+    The file starts with the magic bytes and the length of a JSON header,
+    followed by the header itself. The given header is extended with the
+    dtype, shape, and offset of each array, relative to the first aligned
+    position after the header. The arrays follow, uncompressed and aligned.
+
+    Like gene matches tables, the file is written to a temporary file that is
+    then renamed to the specified path.
+
+    Parameters:
+        path:   Path to which to write the file.
+        magic:  Bytes identifying the kind of file.
+        header: JSON-serializable metadata to store in the header.
+        arrays: Arrays to store, by name.
+    """
+    path = Path(path)
+    header = header | {"arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    start = _data_offset(magic, len(header_bytes))
+    fd, tmp = tempfile.mkstemp(
+        prefix=f".{path.name}.",
+        suffix=".tmp",
+        dir=path.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(magic)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(start + header["arrays"][name]["offset"])
+                array.tofile(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def read_array_file(
+        path: Path,
+        magic: bytes,
+        version: int,
+        mmap: bool = True
+) -> tuple[dict, dict[str, np.ndarray]]:
+    """Read a file written by write_array_file.
+
+    Parameters:
+        path:          Path to the file.
+        magic:         Bytes identifying the kind of file.
+        version (int): Latest supported format version.
+        mmap (bool):   Memory-map the arrays instead of reading them.
+
+    Returns:
+        The header and the arrays, by name.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not in the expected format.")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    if header["version"] > version:
+        raise ValueError(
+            "Unsupported format version {} in {}.".format(
+                header["version"],
+                path
+            )
+        )
+    start = _data_offset(magic, header_len)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        offset = start + spec["offset"]
+        shape = tuple(spec["shape"])
+        if mmap and np.prod(shape):
+            arrays[name] = np.memmap(
+                path,
+                dtype=np.dtype(spec["dtype"]),
+                mode="r",
+                offset=offset,
+                shape=shape
+            )
+        else:
+            arrays[name] = np.fromfile(
+                path,
+                dtype=np.dtype(spec["dtype"]),
+                count=int(np.prod(shape)),
+                offset=offset
+            ).reshape(shape)
+    return header, arrays
+
+def component_summary_path(path: Path) -> Path:
+    """Get the path of the component summary for the graph at path."""
+    path = Path(path)
+    return path.with_name(path.stem + ".components.h5")
+
+def save_component_summary(graph: CompactGraph, path: Path):
+    """Save the component summary for a graph saved at the given path.
+
+    The component summary is a table with a row for each connected component
+    of the gene matches graph. It gives the number of vertices, edges, and
+    distinct samples in the component and whether the component is ideal.
+
+    Parameters:
+        graph: The gene matches graph.
+        path:  The path at which the graph is saved.
+    """
+    write_table(graph.component_summary(), component_summary_path(path))
+
+def load_component_summary(path: Path) -> Optional[pd.DataFrame]:
+    """Load the component summary for the graph at path, if it is current.
+
+    A summary is only used if it was written after the graph, since a graph
+    written by another tool (or an earlier version of RNA-clique) may have
+    replaced the graph for which the summary was written.
+
+    Parameters:
+        path: The path at which the graph is saved.
+
+    Returns:
+        The component summary, or None if there is no current summary.
+    """
+    summary_path = component_summary_path(path)
+    try:
+        if summary_path.stat().st_mtime_ns < Path(path).stat().st_mtime_ns:
+            return None
+        return read_table(summary_path)
+    except FileNotFoundError:
+        return None
+
+def save_graph(
+        graph: CompactGraph | nx.Graph,
+        path: Path,
+        components: bool = True,
+        summary: bool = True
+):
+    """Save a gene matches graph in the compact binary format.
+
+    The file starts with the graph_magic bytes and the length of a JSON header,
+    followed by the header itself. The header contains the sample names and the
+    dtype, shape, and offset of each array, relative to the first aligned
+    position after the header. The arrays (node_samples, node_genes, edges, and
+    optionally components and edge_stats) follow, uncompressed and aligned, so
+    they can be memory-mapped by load_graph (see write_array_file).
+
+    Like gene matches tables, the graph is written to a temporary file that is
+    then renamed to the specified path.
+
+    Unless summary is False, a component summary is also saved next to the
+    graph (see save_component_summary), so the sizes and kinds of the
+    components can be read without loading the graph.
+
+    Parameters:
+        graph:             The graph to save.
+        path:              Path to which to save the graph.
+        components (bool): Also save the connected component labels.
+        summary (bool):    Also save a component summary.
+    """
+    path = Path(path)
+    if not isinstance(graph, CompactGraph):
+        graph = CompactGraph.from_networkx(graph)
+    arrays = {
+        "node_samples": graph.node_samples,
+        "node_genes": graph.node_genes,
+        "edges": graph.edges,
+    }
+    if components:
+        arrays["components"] = graph.components
+    if graph.edge_stats is not None:
+        arrays["edge_stats"] = graph.edge_stats
+    write_array_file(
+        path,
+        graph_magic,
+        {"version": graph_format_version, "samples": graph.samples},
+        arrays
+    )
+    if summary:
+        save_component_summary(graph, path)
+
+def is_compact_graph_file(path: Path) -> bool:
+    """Return whether the file at path is in the compact graph format."""
+    with open(path, "rb") as f:
+        return f.read(len(graph_magic)) == graph_magic
+
+def load_graph(path: Path, mmap: bool = True) -> CompactGraph:
+    """Load a gene matches graph, detecting its format.
+
+    Graphs in the compact binary format written by save_graph are loaded
+    directly, and their arrays are memory-mapped unless mmap is False, so only
+    the parts of the graph that are used are read from disk. If the file
+    contains component labels, they are used instead of computing the
+    components again, and if a current component summary was saved with the
+    graph, it is used for the component statistics.
+
+    Older analyses store the gene matches graph as a pickled networkx Graph.
+    Such graphs are unpickled and converted to CompactGraphs.
+
+    Parameters:
+        path:        Path to the gene matches graph.
+        mmap (bool): Memory-map the arrays of a compact graph.
+
+    Returns:
+        The gene matches graph as a CompactGraph.
+    """
+    path = Path(path)
+    if not is_compact_graph_file(path):
+        with open(path, "rb") as f:
+            graph = pickle.load(f)
+        if isinstance(graph, CompactGraph):
+            return graph
+        return CompactGraph.from_networkx(graph)
+    header, arrays = read_array_file(
+        path,
+        graph_magic,
+        graph_format_version,
+        mmap=mmap
+    )
+    graph = CompactGraph(
+        header["samples"],
+        arrays["node_samples"],
+        arrays["node_genes"],
+        arrays["edges"],
+        arrays.get("edge_stats")
+    )
+    if "components" in arrays:
+        # Fill the cached properties with the stored labels and statistics.
+        graph.components = arrays["components"]
+        summary = load_component_summary(path)
+        if summary is not None and summary["nodes"].sum() == len(graph):
+            graph.component_stats = summary[
+                ["nodes", "edges", "samples"]
+            ].reset_index(drop=True)
+    return graph
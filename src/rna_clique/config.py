@@ -62,6 +62,8 @@ class RNACliqueConfig:
         "description": "Directory containing gene matches tables."})
     cache_dir: Optional[Path] = marshalling_field(str, metadata={
         "description": "Directory containing BLAST DB caches."})
+    hits_dir: Optional[Path] = marshalling_field(str, metadata={
+        "description": "Directory containing archived raw BLAST hits."})
     output_dir: Optional[Path] = marshalling_field(str, metadata={
         "description": "RNA-clique analysis output root directory."})
     graph: Optional[Path] = marshalling_field(str, metadata={
@@ -80,6 +82,26 @@ class RNACliqueConfig:
         "description": "e-value threshold to use for BLASTn searches."})
     keep_all: Optional[bool] = marshalling_field(default=True, metadata={
         "description": "Keep all matches between genes in the case of ties."})
+    pooled_blast: Optional[bool] = marshalling_field(default=False, metadata={
+        "description": "Search each sample's DB once with pooled queries."})
+    recalibrate_schedule: Optional[bool] = marshalling_field(
+        default=False,
+        metadata={
+            "description": "Refit pair cost estimates to observed durations."
+        }
+    )
+    edge_stats: Optional[bool] = marshalling_field(default=False, metadata={
+        "description": "Compute distances from statistics stored in graph."})
+    db_store_dir: Optional[Path] = marshalling_field(str, metadata={
+        "description": "Directory of BLAST DBs shared by analyses."})
+    table_cache_dir: Optional[Path] = marshalling_field(str, metadata={
+        "description": "Directory of gene matches tables shared by analyses."})
+    table_cache_size: Optional[float] = marshalling_field(
+        default=100.0,
+        metadata={
+            "description": "Maximum size of the table cache in gigabytes."
+        }
+    )
     jobs: Optional[int] = marshalling_field(
         default=multiprocessing.cpu_count() - 1,
         metadata={
@@ -0,0 +1,311 @@
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from pathlib import Path
+from collections.abc import Iterable
+from typing import BinaryIO, Optional
+
+from . import config as config_module
+from .app import eprint, set_except_hook
+from .table_cache import content_sha256
+
+def build_parser():
+    arg_config = config_module.RNACliqueConfigArgumentManager(
+        description="Remove old BLAST DBs from a shared DB store."
+    )
+    arg_config.expose_fields_with_default_aliases(
+        "db_store_dir",
+        required=True
+    )
+    arg_config.add_argument(
+        "--max-size",
+        type=float,
+        metavar="GB",
+        help="remove least recently used DBs until the store is this small"
+    )
+    arg_config.add_argument(
+        "--max-age",
+        type=float,
+        metavar="DAYS",
+        help="remove DBs that have not been used for this many days"
+    )
+    return arg_config
+
+class BlastDBStore:
+    """Shares BLAST databases between analyses, keyed by FASTA contents.
+
+    Every analysis ordinarily makes its own BLAST database for each sample in
+    its cache_dir, even when another analysis has already made a database for
+    exactly the same top genes file. A BlastDBStore keeps the databases in a
+    directory that can be shared by any number of analyses. Each database is
+    stored under the SHA-256 digest of the FASTA file from which it was made,
+    so makeblastdb is only run for FASTA contents that are not already in the
+    store.
+
+    Analyses may use the same store concurrently. Each database has two lock
+    files. The build lock is held exclusively while the database is made, so
+    two analyses never make the same database at once; the second waits and
+    then uses the database made by the first. Databases are made in a
+    temporary directory and renamed into place, so a database directory in the
+    store is always complete. The use lock is held (shared) by every analysis
+    using the database, and the prune method skips databases whose use locks
+    are held. Lock files are small and are never deleted, since deleting a
+    lock file that another process has open would silently break the lock.
+
+    The time at which each database was last used is recorded as the
+    modification time of its metadata file, which the prune method uses to
+    remove the least recently used databases.
+
+    Attributes:
+        directory: Directory containing the stored databases.
+    """
+    metadata_name = "store.json"
+    db_name = "db"
+
+    def __init__(self, directory: Path):
+        """Construct a BlastDBStore stored in the given directory.
+
+        Parameters:
+            directory: Directory containing the stored databases.
+        """
+        self.directory = Path(directory)
+        self._held = {}
+
+    @classmethod
+    def from_config(cls, config) -> Optional["BlastDBStore"]:
+        """Get the BlastDBStore configured for an analysis, if any."""
+        if not config.db_store_dir:
+            return None
+        return cls(config.db_store_dir)
+
+    def __enter__(self) -> "BlastDBStore":
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Locks held by one process are not inherited by workers.
+        state["_held"] = {}
+        return state
+
+    def path(self, key: str) -> Path:
+        """Get the directory of the database with the given key."""
+        return self.directory / key[:2] / key
+
+    def _lock_file(self, key: str, kind: str) -> BinaryIO:
+        locks = self.directory / "locks"
+        locks.mkdir(parents=True, exist_ok=True)
+        return open(locks / f"{key}.{kind}", "a+b")
+
+    def _touch(self, key: str):
+        try:
+            os.utime(self.path(key) / type(self).metadata_name)
+        except FileNotFoundError:
+            pass
+
+    def acquire(self, fasta_paths: Iterable[Path]):
+        """Mark the databases for the given FASTA files as in use.
+
+        The databases are protected from pruning until release is called (or
+        the process exits). The databases need not exist yet.
+
+        Parameters:
+            fasta_paths: Paths to the FASTA files whose databases will be used.
+        """
+        for path in fasta_paths:
+            key = content_sha256(path)
+            if key not in self._held:
+                f = self._lock_file(key, "use")
+                fcntl.flock(f, fcntl.LOCK_SH)
+                self._held[key] = f
+
+    def release(self):
+        """Release the use locks of all databases acquired by this object."""
+        for f in self._held.values():
+            f.close()
+        self._held = {}
+
+    def makedb(self, fasta_path: Path) -> str:
+        """Get the database for a FASTA file, making it if it is not stored.
+
+        Parameters:
+            fasta_path: Path to the FASTA file.
+
+        Returns:
+            The name of the database, as used in a BLAST command.
+        """
+        key = content_sha256(fasta_path)
+        final = self.path(key)
+        name = str(final / type(self).db_name)
+        if final.exists():
+            self._touch(key)
+            return name
+        with self._lock_file(key, "build") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have made the database while we waited.
+            if final.exists():
+                self._touch(key)
+                return name
+            final.parent.mkdir(parents=True, exist_ok=True)
+            tmp = Path(
+                tempfile.mkdtemp(prefix=f".tmp-{key}-", dir=self.directory)
+            )
+            try:
+                subprocess.run(
+                    [
+                        "makeblastdb",
+                        "-in",
+                        str(fasta_path),
+                        "-out",
+                        str(tmp / type(self).db_name),
+                        "-dbtype",
+                        "nucl",
+                        "-hash_index"
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=True
+                )
+                with open(tmp / type(self).metadata_name, "w") as f:
+                    json.dump(
+                        {
+                            "sha256": key,
+                            "source": str(fasta_path),
+                            "created": time.time(),
+                        },
+                        f
+                    )
+                os.rename(tmp, final)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+        return name
+
+    def entries(self) -> list[tuple[str, int, float]]:
+        """Get the key, size in bytes, and last use time of each database."""
+        res = []
+        for meta in self.directory.glob(f"*/*/{type(self).metadata_name}"):
+            try:
+                used = meta.stat().st_mtime
+                size = sum(
+                    p.stat().st_size for p in meta.parent.iterdir()
+                )
+            except FileNotFoundError:
+                continue
+            res.append((meta.parent.name, size, used))
+        return res
+
+    def _try_lock(self, key: str, kind: str) -> Optional[BinaryIO]:
+        f = self._lock_file(key, kind)
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    def remove(self, key: str) -> bool:
+        """Remove a database from the store unless it is in use or being made.
+
+        Parameters:
+            key (str): The key of the database to remove.
+
+        Returns:
+            Whether the database was removed.
+        """
+        locks = []
+        try:
+            for kind in ["use", "build"]:
+                lock = self._try_lock(key, kind)
+                if lock is None:
+                    return False
+                locks.append(lock)
+            trash = Path(
+                tempfile.mkdtemp(prefix=f".tmp-{key}-", dir=self.directory)
+            )
+            try:
+                # Renaming first ensures no process sees a partial database.
+                os.rename(self.path(key), trash / key)
+            except FileNotFoundError:
+                return False
+            finally:
+                shutil.rmtree(trash, ignore_errors=True)
+            try:
+                self.path(key).parent.rmdir()
+            except OSError:
+                pass
+            return True
+        finally:
+            for lock in locks:
+                lock.close()
+
+    def prune(
+            self,
+            max_size: Optional[int] = None,
+            max_age: Optional[float] = None
+    ) -> list[tuple[str, int]]:
+        """Remove least recently used databases that exceed the given limits.
+
+        Databases not used for more than max_age seconds are removed, and then
+        the least recently used databases are removed until the total size of
+        the store is at most max_size bytes. Databases that are in use or being
+        made are never removed. Temporary directories left behind by processes
+        that were killed while making a database are also removed.
+
+        Parameters:
+            max_size (int):  Maximum total size of the store, in bytes.
+            max_age (float): Maximum time since a database was used, in seconds.
+
+        Returns:
+            The keys and sizes of the removed databases.
+        """
+        for tmp in self.directory.glob(".tmp-*"):
+            key = tmp.name.split("-")[1]
+            lock = self._try_lock(key, "build")
+            if lock is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+                lock.close()
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for (_, size, _) in entries)
+        now = time.time()
+        removed = []
+        for key, size, used in entries:
+            too_old = max_age is not None and now - used > max_age
+            too_big = max_size is not None and total > max_size
+            if not (too_old or too_big):
+                continue
+            if self.remove(key):
+                total -= size
+                removed.append((key, size))
+        return removed
+
+def main():
+    with set_except_hook():
+        parser = build_parser()
+        _, args, config = parser.get_arguments_and_config()
+    with set_except_hook(config.verbose):
+        if args.max_size is None and args.max_age is None:
+            parser.parser.error("Must provide --max-size or --max-age.")
+        store = BlastDBStore(config.db_store_dir)
+        removed = store.prune(
+            max_size=None if args.max_size is None else int(
+                args.max_size * 1e9
+            ),
+            max_age=None if args.max_age is None else args.max_age * 86400
+        )
+        eprint(
+            "Removed {} BLAST DBs ({:.2f} GB).".format(
+                len(removed),
+                sum(size for (_, size) in removed) / 1e9
+            )
+        )
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 import json
 import io
 import sys
-import pickle
 
 import networkx as nx
 
@@ -12,6 +11,7 @@ from contextlib import ExitStack
 from . import config as config_module
 from . import app
 from .app import set_except_hook, eprint, get_format_from_extension
+from .compact_graph import load_graph
 
 def write_cytoscape(graph: nx.Graph, out_file: io.TextIOBase):
     """Export the given graph as a Cytoscape.js JSON file.
@@ -90,8 +90,7 @@ def main():
             )
             raise
     with set_except_hook(args.verbose):
-        with open(config.graph, "rb") as graph_pickle:
-            graph = pickle.load(graph_pickle)
+        graph = load_graph(config.graph).to_networkx()
         with ExitStack() as stack:
             if args.export_out:
                 f = open(args.export_out, "wb")
@@ -23,7 +23,6 @@ from pathlib import Path
 
 from simple_blast import TabularBlastnSearch
 from tqdm import tqdm
-from joblib import Parallel, delayed
 
 from . import config as config_module
 from . import app
@@ -40,7 +39,9 @@ from .path_to_sample import (
     dict_path_to_sample
 )
 from .graph import component_subgraphs
+from .scheduling import QueueScheduler, run_scheduled
 from .strand_sat import sat_assign_strands
+from .fasta import FastaIndex, FastaRecord, read_fasta, write_fasta
 from .transcripts import TranscriptID, TranscriptIDParseError
 from .gene_matches_tables import get_table_files
 from .app import set_except_hook, eprint
@@ -172,17 +173,25 @@ def renamed_seqs(
 
 def seq_tuples(
         sample: str | Path,
-        parse_transcript_id: Callable[[str], TranscriptID]
+        parse_transcript_id: Callable[[str], TranscriptID],
+        keep: Optional[Callable[[str | Path, int], bool]] = None
 ) -> Iterator[tuple[str | Path, int, int, Bio.SeqRecord]]:
     """Iterate over tuples of sample path, gene, isoform, and sequence in file.
 
+    The FASTA file is read with rna_clique.fasta.read_fasta, so Bio.SeqRecord
+    objects are only constructed for the transcripts that are actually
+    yielded. When a keep predicate is provided, only transcripts whose sample
+    and gene IDs satisfy the predicate are yielded.
+
     Parameters:
         sample:              Path to FASTA file containing sample transcripts.
         parse_transcript_id: Function to parse transcript FASTA IDs.
+        keep:                Predicate on sample and gene IDs to yield.
     """
-    for seq in Bio.SeqIO.parse(sample, "fasta"):
-        _, gene, isoform = parse_transcript_id(seq.id)
-        yield (sample, gene, isoform, seq)
+    for record in read_fasta(sample):
+        _, gene, isoform = parse_transcript_id(record.id)
+        if keep is None or keep(sample, gene):
+            yield (sample, gene, isoform, record.to_seq_record())
 
 def concat_names(
         rename: Callable[[str, int, int], str],
@@ -283,7 +292,8 @@ def is_mismatch(
             g.nodes[e[1]]["strand"] * g.edges[e]["weight"]
 
 def blast_pairwise_get_strands(
-        isoforms: Iterable[tuple[int, Bio.SeqRecord]]
+        isoforms: Iterable[tuple[int, Bio.SeqRecord]],
+        threads: Optional[int] = None
 ) -> Iterator[tuple[tuple[int, str], tuple[int, str], int]]:
     """Get the relative orientations of isotigs using BLAST.
 
@@ -304,7 +314,8 @@ def blast_pairwise_get_strands(
     when relying on this function.
 
     Parameters:
-        isoforms: Itereable of isoform ID and corresponding SeqRecord pairs.
+        isoforms:      Itereable of isoform ID and corresponding SeqRecord pairs.
+        threads (int): Number of threads BLAST should use.
     """
     if len(isoforms) <= 1:
         return
@@ -314,7 +325,8 @@ def blast_pairwise_get_strands(
             seqs,
             seqs,
             evalue=1e-5,
-            additional_columns=["sstrand"]
+            additional_columns=["sstrand"],
+            threads=threads
     ) as search:
         hits = search.hits.loc[search.hits["qseqid"] > search.hits["sseqid"]]
         #print(hits[["qseqid", "sseqid"]])
@@ -344,7 +356,7 @@ def parallel_get_strands(
 
     This function also requires an index, which should map FASTA sequence IDs of
     isoforms to SeqRecord objects. Such an index can be created using
-    Bio.SeqIO.index.
+    rna_clique.fasta.FastaIndex or Bio.SeqIO.index.
 
     This function returns a rather complicated object---it is an Iterable of
     lists. Each list contains all elements yielded from
@@ -359,6 +371,12 @@ def parallel_get_strands(
     are in the same orientation, and it is -1 if the two isoforms are in reverse
     complement orientation.
 
+    The isoform sets are searched largest first, and the jobs' cores are
+    split between concurrent searches and their BLAST threads as in
+    find_all_pairs.find_all_pairs, so that the last few large sets do not run
+    single-threaded while the other cores are idle. The lists are produced in
+    the order in which the searches complete.
+
     Parameters:
         gene_to_isoforms (dict): Mapping from gene IDs to lists of isoforms.
         index:                   Mapping to retrieve SeqRecords from FASTA IDs.
@@ -367,12 +385,24 @@ def parallel_get_strands(
     Returns:
         Pairwise relative orientations for all provided isotigs sets.
     """
-    return Parallel(n_jobs=jobs)(
-        delayed(lambda x: list(blast_pairwise_get_strands(x)))(
-            [(i[0], index[i[1]]) for i in isoforms]
-        )
-        for (gene, isoforms) in tqdm(gene_to_isoforms.items())
+    sets = [
+        [(i[0], index[i[1]]) for i in isoforms]
+        for isoforms in gene_to_isoforms.values()
         if len(isoforms) > 1
+    ]
+    return tqdm(
+        run_scheduled(
+            QueueScheduler(
+                [(x,) for x in sets],
+                [sum(len(r) for (_, r) in x) ** 2 for x in sets]
+            ),
+            lambda x, threads: list(
+                blast_pairwise_get_strands(x, threads=threads)
+            ),
+            jobs,
+            cores=jobs
+        ),
+        total=len(sets)
     )
 
 def build_strand_graph(
@@ -425,12 +455,18 @@ def build_strand_graph(
         Strand graph and dict from sample, gene, isoform IDs to meta-components.
     """
     strand_graph = nx.Graph()
+    parse_transcript_ids = TranscriptID.batch_parser(parse_transcript_id)
     # Add edges for isoform-isoform strands.
     for sample in sim.samples:
-        index = Bio.SeqIO.index(sample, "fasta")
+        index = FastaIndex(sample)
         gene_to_isoforms = defaultdict(list)
-        for s in index:
-            _, gene, isoform = parse_transcript_id(s)
+        seq_ids = list(index)
+        parsed = parse_transcript_ids(seq_ids)
+        for s, gene, isoform in zip(
+                seq_ids,
+                parsed["gene"].tolist(),
+                parsed["isoform"].tolist()
+        ):
             if (sample, gene) in component_sample_genes:
                 gene_to_isoforms[gene].append((isoform, s))
         strand_graph.add_nodes_from(
@@ -663,7 +699,9 @@ class OrthologExporter:
             debug (bool):              Enable debug behavior.
         """
         self.samples = sim.samples
-        self.ideal = list(get_ideal_components(sim.graph, sim.sample_count))
+        self.ideal = list(
+            get_ideal_components(sim.compact_graph, sim.sample_count)
+        )
         self.sample_gene_to_component = get_sample_gene_to_component(self.ideal)
         #print(self.sample_gene_to_component)
         self.parse_transcript_id = parse_transcript_id
@@ -671,17 +709,14 @@ class OrthologExporter:
         self.path_to_sample = path_to_sample
         if not non_contributing:
             print("Filtering non-contributing.")
-            total_distances = [0]*len(self.ideal)
-            for samples, df in sim.restricted_comparison_dfs():
-                for ix, row in df.iterrows():
-                    dist = row["length"] - row["gaps"] - row["nident"]
-                    assert dist >= 0
-                    total_distances[
-                        self.sample_gene_to_component[
-                            row["qsample"],
-                            row["qgene"]
-                        ]
-                    ] += dist
+            # Rows of the pair statistics are the ideal components in order.
+            stats = sim.pair_stats
+            total_distances = (
+                stats.length.sum(axis=1, dtype=np.int64)
+                - stats.gaps.sum(axis=1, dtype=np.int64)
+                - stats.nident.sum(axis=1, dtype=np.int64)
+            )
+            assert (total_distances >= 0).all()
             if debug:
                 for (i, d) in enumerate(total_distances):
                     if not d:
@@ -861,10 +896,12 @@ class OrthologExporter:
                                 self._orient(t)
                                 for t in seq_tuples(
                                     sample,
-                                    self.parse_transcript_id
+                                    self.parse_transcript_id,
+                                    lambda s, g: \
+                                    self.sample_gene_to_component.get(
+                                        (s, g)
+                                    ) in self.ideal_ids
                                 )
-                                if self.sample_gene_to_component.get(t[:-2])
-                                in self.ideal_ids
                             ),
                             key=lambda x: self.sample_gene_to_component[x[:-2]]
                         ),
@@ -957,23 +994,17 @@ class OrthologExporter:
                     #from IPython import embed; embed()
                     for _, gene, isoform, seq in renamed_seqs(
                             rename,
-                            (
-                                t for t in seq_tuples(
-                                    sample,
-                                    self.parse_transcript_id
-                                )
-                                if t[:-2] in self.sample_gene_to_component
+                            seq_tuples(
+                                sample,
+                                self.parse_transcript_id,
+                                lambda s, g: (s, g) in \
+                                    self.sample_gene_to_component
                             )
                     ):
                         Bio.SeqIO.write(
                             self._orient((sample, gene, isoform, seq))[-1],
                             component_files[
-                                self.sample_gene_to_component[
-                                    (
-                                        sample,
-                                        self.parse_transcript_id(seq.id).gene
-                                    )
-                                ]
+                                self.sample_gene_to_component[(sample, gene)]
                             ],
                             "fasta"
                         )
@@ -1010,17 +1041,16 @@ class OrthologExporter:
             export_out_dir: Directory in which to create combined file.
 
         """
-        def seqs():            
+        def seqs():
             for path in paths.values():
-                for seq in Bio.SeqIO.parse(path, "fasta"):
-                    seq.description = ""
-                    seq.title = ""
-                    seq.name = ""
-                    seq.id = "{}:{}".format(seq.id, path.stem)
-                    #from IPython import embed; embed()
-                    yield seq
-        all_ideal_path = export_out_dir / "all_ideal.fasta"        
-        Bio.SeqIO.write(seqs(), all_ideal_path, "fasta")
+                for record in read_fasta(path):
+                    yield FastaRecord(
+                        "{}:{}".format(record.id, path.stem),
+                        record.seq
+                    )
+        all_ideal_path = export_out_dir / "all_ideal.fasta"
+        with open(all_ideal_path, "wb") as f:
+            write_fasta(seqs(), f)
         #from IPython import embed; embed()        
 
 def main():
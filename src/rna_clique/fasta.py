@@ -0,0 +1,274 @@
+import os
+
+import Bio
+import Bio.Seq
+import Bio.SeqRecord
+
+from collections import namedtuple
+from collections.abc import Iterable, Mapping
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Iterator, BinaryIO
+
+class FastaRecord(namedtuple("FastaRecord", ["header", "seq"])):
+    """A lightweight FASTA record consisting of a header and raw sequence.
+
+    The header is the text of the header line, without the leading '>' and
+    trailing newline. The seq is the sequence as bytes, with line breaks
+    removed.
+
+    Unlike Bio.SeqRecord objects, FastaRecords are plain tuples and are cheap to
+    construct. They can be converted to Bio.SeqRecord objects with the
+    to_seq_record method when a Bio API requires one.
+    """
+    __slots__ = ()
+
+    @property
+    def id(self) -> str:
+        """The ID of the record (the first word of the header)."""
+        return (self.header.split(None, 1) or [""])[0]
+
+    def to_seq_record(self) -> Bio.SeqRecord.SeqRecord:
+        """Convert the record to a Bio.SeqRecord like Bio.SeqIO would make."""
+        id_ = self.id
+        return Bio.SeqRecord.SeqRecord(
+            Bio.Seq.Seq(self.seq),
+            id=id_,
+            name=id_,
+            description=self.header
+        )
+
+_WHITESPACE = b" \t\r\n\v\f"
+
+def raw_records(
+        handle: BinaryIO,
+        block_size: int = 1 << 22
+) -> Iterator[tuple[int, bytes]]:
+    """Yield the byte offset and raw bytes of each record in a FASTA file.
+
+    The file is read in large blocks, and records are located by searching for
+    header lines within each block, so no per-line Python work is done. Each
+    raw record begins with its '>' and includes everything up to (and
+    including) the newline preceding the next record's header. Offsets are
+    relative to the position of the handle when this function is called. Any
+    text preceding the first header line is ignored.
+
+    Parameters:
+        handle:           Binary file from which to read records.
+        block_size (int): Number of bytes to read at once.
+    """
+    pending = b""
+    pending_offset = 0
+    started = False
+    while True:
+        block = handle.read(block_size)
+        buf = pending + block
+        if not started:
+            if buf.startswith(b">"):
+                start = 0
+            else:
+                start = buf.find(b"\n>")
+                start = -1 if start < 0 else start + 1
+            if start < 0:
+                # Keep a trailing newline in case the next block starts with >.
+                keep = 1 if buf.endswith(b"\n") else 0
+                pending_offset = pending_offset + len(buf) - keep
+                pending = buf[len(buf) - keep:]
+                if not block:
+                    return
+                continue
+            started = True
+            pending_offset += start
+            buf = buf[start:]
+        pos = 0
+        while True:
+            nxt = buf.find(b"\n>", pos + 1)
+            if nxt < 0:
+                break
+            yield pending_offset + pos, buf[pos:nxt + 1]
+            pos = nxt + 1
+        pending = buf[pos:]
+        pending_offset += pos
+        if not block:
+            if pending:
+                yield pending_offset, pending
+            return
+
+def parse_raw_record(raw: bytes) -> FastaRecord:
+    """Parse the raw bytes of a single FASTA record into a FastaRecord."""
+    header, _, body = raw.partition(b"\n")
+    return FastaRecord(
+        header[1:].rstrip().decode(),
+        body.translate(None, _WHITESPACE)
+    )
+
+def read_fasta(source: str | os.PathLike | BinaryIO) -> Iterator[FastaRecord]:
+    """Yield the records of a FASTA file as FastaRecords.
+
+    The source may be a path or a binary file-like object. Any text preceding
+    the first header line is ignored.
+
+    Parameters:
+        source: Path to or binary file containing FASTA records.
+    """
+    with ExitStack() as stack:
+        if isinstance(source, (str, os.PathLike)):
+            source = stack.enter_context(open(source, "rb"))
+        for _, raw in raw_records(source):
+            yield parse_raw_record(raw)
+
+def write_fasta(
+        records: Iterable[FastaRecord],
+        handle: BinaryIO,
+        width: int = 60
+):
+    """Write FastaRecords to a binary file, wrapping sequences to given width.
+
+    Parameters:
+        records:     The records to write.
+        handle:      Binary file-like object to which to write.
+        width (int): Maximum number of sequence characters per line.
+    """
+    for header, seq in records:
+        handle.write(b">" + header.encode() + b"\n")
+        for i in range(0, len(seq), width):
+            handle.write(seq[i:i + width])
+            handle.write(b"\n")
+
+def fasta_record_spans(
+        path: str | os.PathLike
+) -> Iterator[tuple[str, int, int]]:
+    """Yield the ID, byte offset, and byte length of each record in a FASTA.
+
+    The ID of a record is the first whitespace-delimited word of its header
+    line, which is the same ID Bio.SeqIO would assign to the record. The span of
+    a record begins at its header line and ends just before the next record's
+    header line (or at the end of the file). Any text preceding the first
+    header line is ignored.
+
+    Parameters:
+        path: Path to the FASTA file to scan.
+    """
+    with open(path, "rb") as f:
+        for offset, raw in raw_records(f):
+            id_ = (raw[1:raw.find(b"\n")].split(None, 1) or [b""])[0]
+            yield id_.decode(), offset, len(raw)
+
+def copy_spans(
+        src: BinaryIO,
+        dest: BinaryIO,
+        spans: Iterable[tuple[int, int]],
+        buffer_size: int = 1 << 20
+):
+    """Copy the given byte ranges of one file to another.
+
+    Adjacent spans are merged so that runs of consecutive records are copied
+    with as few reads as possible. If the last byte copied is not a newline, a
+    newline is appended so that the output remains a valid FASTA file.
+
+    Parameters:
+        src:               Binary file from which to copy.
+        dest:              Binary file to which to write.
+        spans:             (offset, length) pairs to copy, in order.
+        buffer_size (int): Maximum number of bytes to read at once.
+    """
+    merged = []
+    for offset, length in spans:
+        if merged and merged[-1][0] + merged[-1][1] == offset:
+            merged[-1][1] += length
+        else:
+            merged.append([offset, length])
+    last = b"\n"
+    for offset, length in merged:
+        src.seek(offset)
+        while length > 0:
+            chunk = src.read(min(length, buffer_size))
+            if not chunk:
+                break
+            dest.write(chunk)
+            length -= len(chunk)
+            last = chunk[-1:]
+        if last != b"\n":
+            dest.write(b"\n")
+            last = b"\n"
+
+class FastaIndex(Mapping):
+    """Read-only mapping from FASTA IDs to records, backed by byte offsets.
+
+    A FastaIndex serves the same purpose as the dict-like object returned by
+    Bio.SeqIO.index, but it is built from a single scan of the file with
+    fasta_record_spans and can return records in several forms. Indexing a
+    FastaIndex returns a Bio.SeqRecord, the record method returns a
+    FastaRecord, and the raw method returns the record's bytes exactly as they
+    appear in the file. The copy method copies records to another file without
+    parsing them at all.
+
+    Attributes:
+        path: Path to the indexed FASTA file.
+    """
+    def __init__(self, path: str | os.PathLike):
+        """Index the FASTA file at the given path.
+
+        Like Bio.SeqIO.index, this raises a ValueError if two records in the
+        file have the same ID.
+
+        Parameters:
+            path: Path to the FASTA file to index.
+        """
+        self.path = Path(path)
+        self._spans = {}
+        for id_, offset, length in fasta_record_spans(path):
+            if id_ in self._spans:
+                raise ValueError(f"Duplicate key '{id_}'")
+            self._spans[id_] = (offset, length)
+        self._handle = None
+
+    def _file(self) -> BinaryIO:
+        if self._handle is None:
+            self._handle = open(self.path, "rb")
+        return self._handle
+
+    def close(self):
+        """Close the underlying file handle, if open."""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_handle"] = None
+        return state
+
+    def raw(self, id_: str) -> bytes:
+        """Get the raw bytes of the record with the given ID."""
+        offset, length = self._spans[id_]
+        f = self._file()
+        f.seek(offset)
+        return f.read(length)
+
+    def record(self, id_: str) -> FastaRecord:
+        """Get the record with the given ID as a FastaRecord."""
+        return parse_raw_record(self.raw(id_))
+
+    def __getitem__(self, id_: str) -> Bio.SeqRecord.SeqRecord:
+        return self.record(id_).to_seq_record()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._spans)
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __contains__(self, id_) -> bool:
+        return id_ in self._spans
+
+    def copy(self, ids: Iterable[str], dest: BinaryIO):
+        """Copy the records with the given IDs verbatim to a binary file.
+
+        Records are copied in the order in which they appear in the file.
+
+        Parameters:
+            ids:  IDs of the records to copy.
+            dest: Binary file to which to write the records.
+        """
+        copy_spans(self._file(), dest, sorted(self._spans[i] for i in ids))
@@ -1,24 +1,30 @@
-import pickle
 import functools
 import sys
 
+import numpy as np
 import pandas as pd
 import networkx as nx
 
 from functools import cached_property
 from fractions import Fraction
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
 from typing import Optional, Any
-from collections.abc import Iterable, Iterator
+from collections.abc import Iterable, Iterator, Sequence
 
+from joblib import Parallel, delayed
 from multiset_key_dict import FrozenMultiset
 
 from . import config as config_module
 from .graph import component_subgraphs
+from .compact_graph import CompactGraph, load_graph
+from .pair_stats import ComponentPairStats, pair_stats_path
+from .restriction import KeyRestrictor
+from .similarity_arrays import SimilarityArrays
 from .gene_matches_tables import get_table_files
 from .similarity_computer import (
     ComparisonSimilarityComputer,
-    similarities_from_dfs
+    similarity_sums_from_dfs
 )
 from .app import eprint, set_except_hook
 
@@ -28,10 +34,13 @@ def is_complete(g : nx.Graph) -> bool:
     return 2*len(g.edges) == v*(v-1)
 
 def get_ideal_components(
-        g : nx.Graph,
+        g : nx.Graph | CompactGraph,
         samples: Optional[int] = None
 ) -> Iterator[nx.Graph]:
     """Yields the ideal components of g, assuming a given number of samples."""
+    if isinstance(g, CompactGraph):
+        yield from g.component_subgraphs(g.ideal_components(samples))
+        return
     if samples is None:
         samples = g.samples
     for s in component_subgraphs(g):
@@ -52,6 +61,12 @@ def build_parser():
     )
     arg_config.expose_fields_with_default_aliases(
         "output_dir",
+        "jobs",
+    )
+    arg_config.add_argument(
+        "--pair-stats",
+        action="store_true",
+        help="save per-component statistics next to the graph"
     )
 
     # arg_config.add_argument(
@@ -123,6 +138,62 @@ def restrict_multi(
     """
     return functools.reduce(functools.partial(restrict_to, df2), columns, df1)
 
+# KeyRestrictors attached to shared memory in this (worker) process, by the
+# name of the shared memory block.
+_shared_restrictors = {}
+
+def _attach_restrictor(
+        name: str,
+        size: int,
+        samples: Sequence[str]
+) -> KeyRestrictor:
+    """Get a KeyRestrictor for keys in shared memory, attaching only once."""
+    try:
+        return _shared_restrictors[name][1]
+    except KeyError:
+        pass
+    # Blocks of earlier computations are no longer needed.
+    while _shared_restrictors:
+        _shared_restrictors.popitem()[1][0].close()
+    # Workers share the parent's resource tracker, so attaching does not
+    # change who unlinks the block.
+    shm = SharedMemory(name=name)
+    keys = np.ndarray((size,), dtype=np.int64, buffer=shm.buf)
+    restrictor = KeyRestrictor(samples, keys, presorted=True)
+    _shared_restrictors[name] = (shm, restrictor)
+    return restrictor
+
+def _restricted_table_sums(
+        cls: type,
+        name: str,
+        size: int,
+        samples: Sequence[str],
+        table_path: Path,
+        remove_seqids: bool = True,
+        convert_to_categorical: bool = True
+) -> tuple[frozenset[str], int, int]:
+    """Read and restrict a table and get its similarity fraction (in a worker).
+
+    Parameters:
+        cls:                           The SampleSimilarity class to use.
+        name (str):                    Name of the shared memory block.
+        size (int):                    Number of valid keys in the block.
+        samples:                       Names of the samples, in code order.
+        table_path:                    Path to the gene matches table.
+        remove_seqids (bool):          Delete seqid columns.
+        convert_to_categorical (bool): Make certain columns categorical.
+
+    Returns:
+        The pair of samples and the numerator and denominator of similarity.
+    """
+    restrictor = _attach_restrictor(name, size, samples)
+    df = cls._read_table(table_path, remove_seqids, convert_to_categorical)
+    (pair, df), = cls.mapping_from_dfs([df])
+    (_, num, den), = similarity_sums_from_dfs(
+        [(pair, restrictor.restrict(df, cls.sample_gene_columns))]
+    )
+    return pair, num, den
+
 class NoIdealComponentsError(Exception):
     pass
     
@@ -140,13 +211,46 @@ class SampleSimilarity(ComparisonSimilarityComputer):
     Edges in the gene matches graph should exist between pairs of genes inferred
     to be orthologs.
 
-    If the graph is saved in a pickle, and the comparison dataframes are stored
+    The graph may be a networkx Graph or a CompactGraph. Either way, the sample
+    count and valid genes are found from a CompactGraph (see compact_graph)
+    with array operations instead of by traversing subgraphs, which is much
+    faster for large analyses.
+
+    If the graph is saved to a file, and the comparison dataframes are stored
     in pickles or HDF files, the from_filenames classmethod may provide a more
     convenient way of constructing a SampleSimilarity object.
 
+    When the paths to the tables are given as table_paths and jobs is greater
+    than 1, the similarities are computed in parallel. The valid keys (see
+    KeyRestrictor) are copied once into shared memory, and each worker
+    process reads and restricts its tables and returns only the numerator and
+    denominator of each pair's similarity. The comparison_dfs are then not
+    used to compute the similarities.
+
+    The similarities for a subset of the ideal components can be computed
+    from a ComponentPairStats (see pair_stats) without restricting the tables
+    again. The statistics may be given as pair_stats; otherwise, they are
+    computed from the tables when they are first needed.
+
+    Tables read from table_paths (by worker processes or to compute the
+    pair_stats) are read with the remove_seqids and convert_to_categorical
+    options given to the constructor (see _read_table).
+
+    If the graph is a CompactGraph with edge statistics (see
+    CompactGraphBuilder), the similarities and pair_stats are computed from
+    the edges inside ideal components, and the tables are not read at all.
+
     Attributes:
-        graph:          The gene matches graph representing gene orthologies.
-        comparison_dfs: An iterable mapping sample pairs to comparisons.
+        graph:                         The gene matches graph representing
+                                       gene orthologies.
+        comparison_dfs:                An iterable mapping sample pairs to
+                                       comparisons.
+        table_paths:                   Paths to the comparison tables, if
+                                       known.
+        jobs (int):                    Number of parallel jobs to use.
+        remove_seqids (bool):          Delete seqid columns of read tables.
+        convert_to_categorical (bool): Make certain columns of read tables
+                                       categorical.
     """
 
     # List of lists of columns corresponding to sample and gene IDs for subject
@@ -161,45 +265,121 @@ class SampleSimilarity(ComparisonSimilarityComputer):
     
     def __init__(
             self,
-            graph: nx.Graph,
+            graph: nx.Graph | CompactGraph,
             comparison_dfs: Iterable[tuple[frozenset[str, str], pd.DataFrame]],
-            sample_count: Optional[int] = None
+            sample_count: Optional[int] = None,
+            table_paths: Optional[Iterable[Path]] = None,
+            jobs: int = 1,
+            pair_stats: Optional[ComponentPairStats] = None,
+            remove_seqids: bool = True,
+            convert_to_categorical: bool = True
     ):
         super().__init__(comparison_dfs, sample_count)
         self.graph = graph
+        self.table_paths = None if table_paths is None else list(table_paths)
+        self.jobs = jobs
+        self.remove_seqids = remove_seqids
+        self.convert_to_categorical = convert_to_categorical
+        if pair_stats is not None:
+            self.pair_stats = pair_stats
             
     @property
     def sample_count(self):
         """The number of samples in the similarity matrix."""
         if self._sample_count is None:
-             self._sample_count = len(
-                set(
-                    n[0] for comp in component_subgraphs(
-                        self.graph
-                    ) for n in comp.nodes
-                )
-             )
+            self._sample_count = self.compact_graph.sample_count
         return self._sample_count
 
+    @cached_property
+    def compact_graph(self) -> CompactGraph:
+        """The gene matches graph as a CompactGraph."""
+        if isinstance(self.graph, CompactGraph):
+            return self.graph
+        return CompactGraph.from_networkx(self.graph)
+
     @cached_property
     def valid(self):
         """A dataframe containing all genes found in ideal components."""
-        #from IPython import embed; embed()
-        return pd.DataFrame(
-            (
-                n for comp in get_ideal_components(
-                    self.graph,
-                    self.sample_count
-                ) for n in comp.nodes
-            ),
-            columns=["sample", "gene"]
+        return self.compact_graph.ideal_nodes(self.sample_count)
+
+    @cached_property
+    def restrictor(self) -> KeyRestrictor:
+        """A KeyRestrictor for the genes found in ideal components."""
+        return KeyRestrictor.from_graph(self.compact_graph, self.sample_count)
+
+    @cached_property
+    def pair_stats(self) -> ComponentPairStats:
+        """Statistics for each ideal component and pair of samples."""
+        if self.compact_graph.edge_stats is not None:
+            return ComponentPairStats.from_graph(
+                self.compact_graph,
+                self.sample_count
+            )
+        if self.table_paths is not None:
+            tables = map(
+                functools.partial(
+                    self._read_table,
+                    remove_seqids=self.remove_seqids,
+                    convert_to_categorical=self.convert_to_categorical
+                ),
+                self.table_paths
+            )
+        elif hasattr(self.comparison_dfs, "values"):
+            tables = self.comparison_dfs.values()
+        else:
+            tables = (df for (_, df) in self._comparison_df_iter)
+        return ComponentPairStats.from_tables(
+            self.compact_graph,
+            tables,
+            self.sample_count
         )
 
+    def component_similarity_arrays(
+            self,
+            components: Optional[Iterable[int]] = None
+    ) -> SimilarityArrays:
+        """Get similarities computed from only the given ideal components.
+
+        The components are given by their labels in the gene matches graph
+        (see CompactGraph.components). Since the similarities are computed
+        from pair_stats, the tables are not read again.
+
+        Parameters:
+            components: Labels of the ideal components to use (default: all).
+
+        Returns:
+            The similarities computed from the given components.
+        """
+        try:
+            return self.pair_stats.similarity_arrays(components)
+        except ZeroDivisionError:
+            raise NoIdealComponentsError()
+
+    def get_component_dissimilarity_df(
+            self,
+            components: Optional[Iterable[int]] = None
+    ) -> pd.DataFrame:
+        """Get the dissimilarity matrix for only the given ideal components.
+
+        Parameters:
+            components: Labels of the ideal components to use (default: all).
+
+        Returns:
+            A Pandas dataframe giving pairwise dissimilarities for all samples.
+        """
+        arrays = self.component_similarity_arrays(components)
+        return pd.DataFrame(
+            arrays.dissimilarity_matrix(),
+            index=arrays.samples,
+            columns=arrays.samples
+        )
 
     def restricted(self, comp_df: pd.DataFrame) -> pd.DataFrame:
         """Returns the provided dataframe, restricted to valid genes.
 
-        Valid genes are those that are found in some ideal component.
+        Valid genes are those that are found in some ideal component. The
+        dataframe is restricted by a KeyRestrictor, which gives the same
+        result as restrict_multi with the valid dataframe.
 
         Parameters:
             comp_df: The dataframe to restrict to valid genes.
@@ -207,7 +387,7 @@ class SampleSimilarity(ComparisonSimilarityComputer):
         Returns:
             comp_df, restricted to genes appearing in ideal components.
         """
-        return restrict_multi(self.valid, comp_df, self.sample_gene_columns)
+        return self.restrictor.restrict(comp_df, self.sample_gene_columns)
 
     def restricted_comparison_dfs(
             self
@@ -239,12 +419,53 @@ class SampleSimilarity(ComparisonSimilarityComputer):
         table for that sample pair is an empty dataframe. In that case, the
         similarity could be considered undefined or unknown.
         """
-        try:
-            yield from similarities_from_dfs(
+        for pair, num, den in self._similarity_sum_helper():
+            yield pair, Fraction(num, den)
+
+    def _similarity_sum_helper(
+            self
+    ) -> Iterator[tuple[frozenset[str], int, int]]:
+        """Yield similarity fractions for pairs of samples using filtered tables.
+
+        Like _similarity_helper, this function raises a NoIdealComponentsError
+        if the filtered gene matches table for some pair of samples is empty.
+        """
+        if self.compact_graph.edge_stats is not None:
+            sums = self.compact_graph.ideal_pair_sums(self.sample_count)
+        elif self.jobs > 1 and self.table_paths is not None:
+            sums = self._parallel_similarity_sums()
+        else:
+            sums = similarity_sums_from_dfs(
                 (k, self.restricted(v)) for (k, v) in self._comparison_df_iter
             )
-        except ZeroDivisionError:
-            raise NoIdealComponentsError()
+        for pair, num, den in sums:
+            if den == 0:
+                raise NoIdealComponentsError()
+            yield pair, num, den
+
+    def _parallel_similarity_sums(
+            self
+    ) -> Iterator[tuple[frozenset[str], int, int]]:
+        """Yield similarity fractions for table_paths using worker processes."""
+        keys = self.restrictor.keys
+        shm = SharedMemory(create=True, size=max(keys.nbytes, 1))
+        try:
+            np.ndarray(keys.shape, dtype=np.int64, buffer=shm.buf)[:] = keys
+            yield from Parallel(n_jobs=self.jobs)(
+                delayed(_restricted_table_sums)(
+                    type(self),
+                    shm.name,
+                    len(keys),
+                    self.restrictor.samples,
+                    path,
+                    self.remove_seqids,
+                    self.convert_to_categorical
+                )
+                for path in self.table_paths
+            )
+        finally:
+            shm.close()
+            shm.unlink()
 
     @classmethod
     def _constructor_args_from_filenames(
@@ -273,18 +494,33 @@ class SampleSimilarity(ComparisonSimilarityComputer):
             store_dfs (bool):               Store the dataframes loaded.
             remove_seqids (bool):           Delete seqid columns.
             convert_to_categorical (bool):  Make certain columns categorical.
+            jobs (int):                     Number of parallel jobs to use.
 
         Returns:
             The positional and keyword constructor arguments.
         """        
+        if kwargs.get("jobs", 1) > 1:
+            comparison_fns = list(comparison_fns)
+            kwargs.setdefault("table_paths", comparison_fns)
+        kwargs.setdefault("remove_seqids", remove_seqids)
+        kwargs.setdefault("convert_to_categorical", convert_to_categorical)
         args, kwargs = super()._constructor_args_from_filenames(
             comparison_fns,
             store_dfs,
             *args,
+            read_options={
+                "remove_seqids": remove_seqids,
+                "convert_to_categorical": convert_to_categorical
+            },
             **kwargs
         )
-        with open(graph_fn, "rb") as f:
-            graph = pickle.load(f)
+        graph = load_graph(graph_fn)
+        try:
+            stats = ComponentPairStats.load(pair_stats_path(graph_fn))
+            if stats.matches(graph, kwargs.get("sample_count")):
+                kwargs.setdefault("pair_stats", stats)
+        except FileNotFoundError:
+            pass
         args = [graph] + args
         return args, kwargs
 
@@ -305,11 +541,20 @@ class SampleSimilarity(ComparisonSimilarityComputer):
         cateogrical_columns attribute) can be made Pandas categorical columns,
         which can further reduce the memory footprint.        
 
+        If statistics for the ideal components were saved next to the graph
+        (see pair_stats.pair_stats_path) and match the graph, they are loaded
+        (memory-mapped) as the pair_stats.
+
+        When jobs is greater than 1, the similarities are computed by worker
+        processes that read the tables themselves, so store_dfs should usually
+        be False to avoid also reading every table in this process.
+
         Parameters:
             comparison_fns:                 Paths to stored gene matches tables.
             store_dfs (bool):               Store the dataframes loaded.
             remove_seqids (bool):           Delete seqid columns.
             convert_to_categorical (bool):  Make certain columns categorical.
+            jobs (int):                     Number of parallel jobs to use.
 
         Returns:
             A SampleSimilarity using the given gene matches graph and tables.        
@@ -330,9 +575,16 @@ def main():
         sim = SampleSimilarity.from_filenames(
             config.graph,
             tables,
+            store_dfs=False,
+            jobs=config.jobs
         )
         try:
-            mat = sim.get_dissimilarity_df()
+            if args.pair_stats:
+                # The statistics give the same matrix in the same pass.
+                sim.pair_stats.save(pair_stats_path(config.graph))
+                mat = sim.get_component_dissimilarity_df()
+            else:
+                mat = sim.get_dissimilarity_df()
             mat.to_hdf(config.matrix, key="matrix", mode="w")
             config.mark_finish()
         except NoIdealComponentsError:
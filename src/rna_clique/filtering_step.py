@@ -1,14 +1,12 @@
 import multiprocessing
 import itertools
-import pickle
 
-from typing import Iterable
+from typing import Iterable, Mapping
 
-import networkx as nx
 import pandas as pd
 
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Optional
 
 from joblib import Parallel, delayed
 from tqdm import tqdm
@@ -16,11 +14,15 @@ from tqdm import tqdm
 from . import app
 from . import config as config_module
 from .transcripts import default_gene_re, TranscriptID, TranscriptIDParseError
-from .select_top_genes_all import select_top_and_save
-from .find_all_pairs import find_all_pairs
-from .build_graph import build_graph
+from .select_top_genes_all import select_top_and_save, top_genes_path
+from .find_all_pairs import find_all_pairs, make_output_path
+from .pipeline import find_all_pairs_pipelined
+from .build_graph import build_compact_graph
+from .compact_graph import CompactGraph, load_graph, save_graph
 from .similarity_computer import ComparisonSimilarityComputer
-from .app import set_except_hook, validate_input_dirs
+from .db_store import BlastDBStore
+from .table_cache import TableCache
+from .app import eprint, set_except_hook, validate_input_dirs
 
 def build_parser():
     arg_config = config_module.RNACliqueConfigArgumentManager(
@@ -39,13 +41,36 @@ def build_parser():
         "graph",
         required=True
     )
-    arg_config.expose_fields_with_default_aliases("output_dir", "title")
+    arg_config.expose_fields_with_default_aliases(
+        "output_dir",
+        "title",
+        "pooled_blast",
+        "hits_dir",
+        "recalibrate_schedule",
+        "edge_stats",
+        "db_store_dir",
+        "table_cache_dir",
+        "table_cache_size"
+    )
     arg_config.add_argument(
         "--no-keep-all",
         dest="keep_all",
         action="store_false",
         help="Do not keep all matches in case of a tie."
     )
+    arg_config.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Add new input directories to the analysis described by the input "
+            "config instead of starting over."
+        )
+    )
+    arg_config.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip pairs whose tables were already completed and verified."
+    )
     arg_config.add_output_config_argument()
     arg_config.expose_config_field(
         "input_dirs",
@@ -74,7 +99,15 @@ def filtering_step(
         evalue: float = 1e-99,
         keep_all: bool = True,
         jobs: int = multiprocessing.cpu_count() - 1,
-) -> tuple[Iterable[pd.DataFrame], Iterable[Path], nx.Graph]:
+        pooled: bool = False,
+        hits_dir: Optional[Path] = None,
+        existing: Optional[Mapping[Path, str]] = None,
+        resume: bool = False,
+        recalibrate: bool = False,
+        table_cache: Optional[TableCache] = None,
+        db_store: Optional[BlastDBStore] = None,
+        edge_stats: bool = False,
+) -> tuple[Iterable[pd.DataFrame], Iterable[Path], CompactGraph]:
     """Perform the filtering step (phase 1) of RNA-clique.
 
     This function performs the full filtering step of RNA-clique, which has also
@@ -97,11 +130,43 @@ def filtering_step(
 
     For a more thorough explanation, please refer to the RNA-clique paper.
 
+    The steps are not separated by barriers. Unless pooled searches or
+    recalibrated schedules are requested (both need the top genes of every
+    sample before any pair can start), the steps are run by
+    pipeline.find_all_pairs_pipelined on one pool of workers: the BLAST DB for
+    a sample is made as soon as its top genes are selected, the searches for a
+    pair start as soon as the DBs for both of its samples are ready, and each
+    gene matches table is added to the graph as soon as it is completed.
+
+    This function can also add samples to an existing analysis incrementally.
+    To do so, provide the existing analysis's mapping from top genes paths to
+    sample names as the existing parameter, along with the same output paths
+    used for the existing analysis. Input directories whose sample names are
+    already in the mapping are skipped. Top genes are selected only for the new
+    samples, BLAST searches are run only for pairs involving a new sample, and
+    the gene matches graph stored at output_graph is updated in place with the
+    new tables. (If there is no graph at output_graph, it is built from all
+    tables, old and new.) The returned iterables still cover all pairs of
+    samples.
+
+    If an earlier run was interrupted while computing the gene matches tables,
+    it can be resumed by setting resume to True. Tables that were completed
+    and verified are then read from disk instead of being computed again (see
+    find_all_pairs.find_all_pairs).
+
+    If edge_stats is True, the graph stores the alignment statistics of each
+    edge (see build_graph.build_compact_graph), so the distances can be
+    computed from the graph without reading the tables again. An existing
+    graph without edge statistics is then rebuilt from all tables.
+
     This function mainly performs I/O, but it also returns three objects that
     are convenient for downstream processing. First, the function returns an
     iterable of the gene matches tables. Second, the function returns an
     iterable of paths to the gene matches tables. Third, the function returns
-    the gene matches graph.
+    the gene matches graph, as a CompactGraph. The graph is saved to
+    output_graph in the compact binary format (see compact_graph.save_graph);
+    when adding samples incrementally, an existing graph in the older pickle
+    format is also accepted.
 
     To reduce memory requirements, the function avoids loading all gene matches
     tables into memory at once. To this end, the returned iterable over gene
@@ -113,7 +178,7 @@ def filtering_step(
         out_dir_1:         Output directory for storing top genes by coverage.
         out_dir_2:         Output directory for storing gene matches tables.
         cache_dir:         Intermediate directory storing BLAST DB caches.
-        output_graph:      Path to output gene matches graph pickle.
+        output_graph:      Path to output gene matches graph.
         top_genes (int):   Number of top genes to select.
         transcripts (str): Name of transcript FASTA files within input dirs.
         top_matches (int): Threshold for counting matches between directions.
@@ -121,11 +186,48 @@ def filtering_step(
         evalue (float):    BLAST search e-value threshold.
         keep_all (bool):   Whether to keep all matches in case of a tie.
         jobs (int):        Number of parallel jobs to use.
+        pooled (bool):     Search each sample's DB once with pooled queries.
+        hits_dir:          Directory in which to archive raw BLAST hits.
+        existing (dict):   Path-to-sample mapping of an existing analysis.
+        resume (bool):     Skip pairs whose tables were completed and verified.
+        recalibrate:       Refit pair cost estimates to observed durations.
+        table_cache:       Cache of tables shared between analyses.
+        db_store:          Store of BLAST DBs shared between analyses.
+        edge_stats:        Store alignment statistics for each graph edge.
 
     Returns:
         Two iterables with gene matches tables and paths, gene matches graph.
     """
-    path_to_sample = dict(
+    pairs = None
+    graph = None
+    if existing is not None:
+        existing = {Path(k): v for (k, v) in existing.items()}
+        known = set(existing.values())
+        dirs = [d for d in dirs if d.stem not in known]
+    sources = {top_genes_path(out_dir_1, d): d for d in dirs}
+    new_path_to_sample = {p: d.stem for (p, d) in sources.items()}
+    if existing is None:
+        path_to_sample = new_path_to_sample
+    else:
+        path_to_sample = existing | new_path_to_sample
+        pairs = [
+            p for p in itertools.combinations(path_to_sample, 2)
+            if p[0] in new_path_to_sample or p[1] in new_path_to_sample
+        ]
+        try:
+            graph = load_graph(output_graph)
+        except FileNotFoundError:
+            pass
+        if edge_stats and graph is not None and graph.edge_stats is None:
+            eprint("Graph has no edge statistics. Rebuilding from all tables.")
+            graph = None
+    hf_args = [
+        id_parser,
+        top_matches,
+        evalue,
+        keep_all
+    ]
+    if pooled or recalibrate:
         Parallel(n_jobs=jobs)(
             map(
                 delayed(
@@ -140,23 +242,68 @@ def filtering_step(
                 dirs
             )
         )
+        tables, table_paths, num_tables = find_all_pairs(
+            path_to_sample,
+            out_dir_2,
+            cache_dir,
+            path_to_sample.__getitem__,
+            hf_args=hf_args,
+            jobs=jobs,
+            pooled=pooled,
+            hits_dir=hits_dir,
+            pairs=pairs,
+            resume=resume,
+            recalibrate=recalibrate,
+            table_cache=table_cache,
+            db_store=db_store,
+        )
+    else:
+        tables, table_paths, num_tables = find_all_pairs_pipelined(
+            path_to_sample,
+            out_dir_2,
+            cache_dir,
+            path_to_sample.__getitem__,
+            hf_args=hf_args,
+            jobs=jobs,
+            sources=sources,
+            transcripts=transcripts,
+            select_args=[top_genes, id_parser],
+            hits_dir=hits_dir,
+            pairs=pairs,
+            resume=resume,
+            table_cache=table_cache,
+            db_store=db_store,
+        )
+    if pairs is not None:
+        # Tables for pairs of existing samples are already on disk.
+        all_paths = [
+            make_output_path(
+                out_dir_2,
+                *p,
+                path_to_sample=path_to_sample.__getitem__,
+                extension="h5"
+            )
+            for p in itertools.combinations(path_to_sample, 2)
+        ]
+        if graph is None:
+            new_paths = set(table_paths)
+            tables = itertools.chain(
+                tables,
+                (
+                    ComparisonSimilarityComputer._read_table(p)
+                    for p in all_paths if p not in new_paths
+                )
+            )
+            num_tables = len(all_paths)
+        table_paths = iter(all_paths)
+    graph = build_compact_graph(
+        tqdm(tables, total=num_tables),
+        graph=graph,
+        edge_stats=edge_stats
     )
-    tables, table_paths, num_tables = find_all_pairs(
-        path_to_sample,
-        out_dir_2,
-        cache_dir,
-        path_to_sample.__getitem__,
-        hf_args=[
-            id_parser,
-            top_matches,
-            evalue,
-            keep_all
-        ],
-        jobs=jobs,
-    )
-    graph = build_graph(tqdm(tables, total=num_tables))
-    with open(output_graph, "wb") as f:
-        pickle.dump(graph, f, pickle.HIGHEST_PROTOCOL)
+    if pairs is not None:
+        num_tables = len(all_paths)
+    save_graph(graph, output_graph)
     table_paths1, table_paths2 = itertools.tee(table_paths)
     return map(
         ComparisonSimilarityComputer._read_table,
@@ -164,6 +311,29 @@ def filtering_step(
     ), table_paths2, graph, num_tables, path_to_sample
     
 
+def incremental_path_to_sample(
+        args,
+        config: config_module.RNACliqueConfig
+) -> Optional[dict[Path, str]]:
+    """Get the existing path_to_sample mapping if running incrementally.
+
+    Parameters:
+        args:   Parsed command-line arguments.
+        config: The configuration for the analysis.
+
+    Returns:
+        The existing path_to_sample mapping, or None for a full analysis.
+    """
+    if not args.incremental:
+        return None
+    if not config.path_to_sample:
+        eprint(
+            "Warning: No path_to_sample mapping found in input config. "
+            "Running full analysis."
+        )
+        return None
+    return config.path_to_sample
+
 def main():
     with set_except_hook():
         _, args, config = build_parser().get_arguments_and_config()
@@ -184,7 +354,15 @@ def main():
                 id_parser,
                 config.evalue,
                 config.keep_all,
-                config.jobs
+                config.jobs,
+                config.pooled_blast,
+                config.hits_dir,
+                existing=incremental_path_to_sample(args, config),
+                resume=args.resume,
+                recalibrate=config.recalibrate_schedule,
+                table_cache=TableCache.from_config(config),
+                db_store=BlastDBStore.from_config(config),
+                edge_stats=config.edge_stats
             )[-1]
         except TranscriptIDParseError:
             app.print_transcript_id_parse_error_message(
@@ -1,32 +1,46 @@
 import re
-import math
 import multiprocessing
 import functools
 import itertools
 import os
 import sys
+import tempfile
 
 import pandas as pd
 
 from typing import Optional, Any, Callable, Iterator
+from collections import defaultdict
 from collections.abc import Iterable, Mapping
 from pathlib import Path
 
 from more_itertools import consume
 from simple_blast import BlastDBCache
-from joblib import Parallel, delayed
+from simple_blast.blasting import TabularBlastnSearch
 from tqdm import tqdm
 
 from . import app
 from . import config as config_module
 from .find_homologs import HomologFinder
 from .app import eprint, set_except_hook
-from .gene_matches_tables import write_table
+from .fasta import FastaRecord, read_fasta, write_fasta
+from .gene_matches_tables import TableLedger, read_table, write_table
+from .hit_archive import HitArchive
 from .transcripts import TranscriptID, TranscriptIDParseError
 from .path_to_sample import PathToSampleError, dict_path_to_sample
+from .db_store import BlastDBStore
+from .table_cache import TableCache
+from .scheduling import (
+    PairScheduler,
+    QueueScheduler,
+    fasta_stats,
+    run_scheduled
+)
 
 default_sample_regex = re.compile(os.environ.get("SAMPLE_RE", "^(.*?)_.*$"))
 
+# Separates the sample index from the original ID in pooled FASTA IDs.
+pooled_id_sep = ":"
+
 def build_parser():
     arg_config = config_module.RNACliqueConfigArgumentManager(
         description="Calculate gene matches tables for all pairs of samples.",
@@ -42,7 +56,13 @@ def build_parser():
         "evalue",
         "title",
         "output_dir",
-        "jobs"
+        "jobs",
+        "pooled_blast",
+        "hits_dir",
+        "recalibrate_schedule",
+        "db_store_dir",
+        "table_cache_dir",
+        "table_cache_size"
     )
     arg_config.add_argument(
         "--sample-regex",
@@ -51,6 +71,11 @@ def build_parser():
         default=default_sample_regex,
         help="Python regex for parsing sample names"
     )
+    arg_config.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip pairs whose tables were already completed and verified."
+    )
     arg_config.add_output_config_argument()
     return arg_config
 
@@ -59,16 +84,27 @@ def find_homologs_and_save(
         transcripts2 : Path,
         out_path : Path,
         hf_args : Optional[Iterable] = None,
-        hf_kwargs : Optional[Mapping[str, Any]] = None
+        hf_kwargs : Optional[Mapping[str, Any]] = None,
+        ledger : Optional[TableLedger] = None,
+        table_cache : Optional[TableCache] = None
 ) -> pd.DataFrame:
     """Get the gene matches tables for the given FASTA files and save results.
 
+    If a ledger is given, the saved table is recorded in it as completed.
+
+    If a TableCache is given, it is checked before running BLAST, and a table
+    found there is saved to out_path instead of being computed. Otherwise, the
+    computed table is added to the cache. The cache is not checked when raw
+    hits are being archived, since a cached table has no hits to archive.
+
     Parameters:
         transcripts1: Path to the top n transcripts FASTA for the first sample.
         transcripts2: Path to the top n transcripts FASTA for the second sample.
         out_path:     Output file in which to store the gene matches table.
         hf_args:      Arguments to pass to HomologFinder constructor.
         hf_kwargs:    Keyword arguments to pass to HomologFinder constructor.
+        ledger:       Ledger in which to record the completed table.
+        table_cache:  Cache of tables shared between analyses.
 
     Returns:
         The gene matches tables computed for the two sets of transcripts.
@@ -78,15 +114,149 @@ def find_homologs_and_save(
     if hf_kwargs is None:
         hf_kwargs = {}
     finder = HomologFinder(*hf_args, **hf_kwargs)
+    if table_cache is not None and finder.hit_archive is None:
+        table = restore_cached_table(
+            table_cache,
+            transcripts1,
+            transcripts2,
+            out_path,
+            ledger
+        )
+        if table is not None:
+            return table
     table = finder.get_match_table(transcripts1, transcripts2)
+    if table_cache is not None:
+        table_cache.put(transcripts1, transcripts2, table)
+    label_table(table, transcripts1, transcripts2)
+    write_table(table, out_path)
+    if ledger is not None:
+        ledger.record(out_path, len(table))
+    return table
+
+def restore_cached_table(
+        table_cache: TableCache,
+        transcripts1: Path,
+        transcripts2: Path,
+        out_path: Path,
+        ledger: Optional[TableLedger] = None
+) -> Optional[pd.DataFrame]:
+    """Save the cached gene matches table for a pair of samples, if any.
+
+    Parameters:
+        table_cache:  Cache of tables shared between analyses.
+        transcripts1: Path to the top n transcripts FASTA for the first sample.
+        transcripts2: Path to the top n transcripts FASTA for the second sample.
+        out_path:     Output file in which to store the gene matches table.
+        ledger:       Ledger in which to record the restored table.
+
+    Returns:
+        The restored table, or None if the pair's table is not cached.
+    """
+    table = table_cache.get(transcripts1, transcripts2)
+    if table is None:
+        return None
+    label_table(table, transcripts1, transcripts2)
+    write_table(table, out_path)
+    if ledger is not None:
+        ledger.record(out_path, len(table))
+    return table
+
+def label_table(
+        table: pd.DataFrame,
+        transcripts1: Path,
+        transcripts2: Path
+) -> pd.DataFrame:
+    """Add the sample columns to a gene matches table."""
     table["ssample"] = str(transcripts1)
     table["qsample"] = str(transcripts2)
     table[["ssample", "qsample"]] = table[["ssample", "qsample"]].astype(
         "category"
     )
+    return table
+
+def find_homologs_from_hits_and_save(
+        transcripts1: Path,
+        transcripts2: Path,
+        forward_hits_path: Path,
+        backward_hits_path: Path,
+        out_path: Path,
+        hf_args: Optional[Iterable] = None,
+        hf_kwargs: Optional[Mapping[str, Any]] = None,
+        ledger: Optional[TableLedger] = None,
+        table_cache: Optional[TableCache] = None
+) -> pd.DataFrame:
+    """Get the gene matches table from saved BLAST hits and save the result.
+
+    This function is used for pooled searches. Instead of running BLAST, it
+    reads the hits for each direction from the files written by
+    pooled_search_and_split. The hits files are deleted once the table has
+    been computed. If a ledger is given, the saved table is recorded in it as
+    completed, and if a TableCache is given, the table is added to it.
+
+    Parameters:
+        transcripts1:       Path to top n transcripts FASTA for first sample.
+        transcripts2:       Path to top n transcripts FASTA for second sample.
+        forward_hits_path:  Hits for first sample queries against the second.
+        backward_hits_path: Hits for second sample queries against the first.
+        out_path:           Output file in which to store gene matches table.
+        hf_args:            Arguments to pass to HomologFinder constructor.
+        hf_kwargs:          Keyword arguments to pass to HomologFinder.
+        ledger:             Ledger in which to record the completed table.
+        table_cache:        Cache of tables shared between analyses.
+
+    Returns:
+        The gene matches tables computed for the two sets of transcripts.
+    """
+    if hf_args is None:
+        hf_args = []
+    if hf_kwargs is None:
+        hf_kwargs = {}
+    finder = HomologFinder(*hf_args, **hf_kwargs)
+    table = finder.get_match_table_from_hits(
+        pd.read_pickle(forward_hits_path),
+        pd.read_pickle(backward_hits_path),
+        transcripts1,
+        transcripts2
+    )
+    if table_cache is not None:
+        table_cache.put(transcripts1, transcripts2, table)
+    label_table(table, transcripts1, transcripts2)
     write_table(table, out_path)
+    if ledger is not None:
+        ledger.record(out_path, len(table))
+    forward_hits_path.unlink()
+    backward_hits_path.unlink()
     return table
 
+def split_completed(
+        pairs: Iterable[tuple[Path, Path]],
+        output_path: Callable[[Path, Path], Path],
+        ledger: TableLedger
+) -> tuple[list[Path], list[tuple[Path, Path]]]:
+    """Separate pairs whose tables were completed from those still pending.
+
+    A pair's table is considered completed if it is recorded in the ledger and
+    its file still matches the recorded checksum.
+
+    Parameters:
+        pairs:       Pairs of top genes files.
+        output_path: Function mapping a pair to the path of its table.
+        ledger:      Ledger in which completed tables are recorded.
+
+    Returns:
+        Paths of the completed tables, and the pairs still pending.
+    """
+    entries = ledger.entries()
+    done = []
+    pending = []
+    for p in pairs:
+        if ledger.verify(output_path(*p), entries):
+            done.append(output_path(*p))
+        else:
+            pending.append(p)
+    eprint(f"Skipping {len(done)} completed tables.")
+    return done, pending
+
 def make_output_path(
         dir_ : Path,
         t1 : Path,
@@ -131,33 +301,280 @@ def make_one_db(db_loc : Path, seq_file_path : Path) -> BlastDBCache:
     cache.makedb(seq_file_path)
     return cache
 
+def store_one_db(
+        store: BlastDBStore,
+        seq_file_path: Path
+) -> dict[frozenset[Path], str]:
+    """Get a database for a single FASTA file from a BlastDBStore.
+
+    Parameters:
+        store:         The store in which to find or make the database.
+        seq_file_path: The path to the subject sequence FASTA.
+
+    Returns:
+        A BlastDBCache index entry for the database.
+    """
+    return {frozenset({Path(seq_file_path)}): store.makedb(seq_file_path)}
+
 def make_all_dbs(
         db_loc : Path,
         seqs : Iterable[Path],
-        jobs : int = 1
+        jobs : int = 1,
+        store : Optional[BlastDBStore] = None
 ) -> BlastDBCache:
     """Create a BlastDBCache with databases for the given FASTA files.
 
     Since one database does not depend on any other, this function optionally
-    creates the databases in parallel.
+    creates the databases in parallel, starting with the largest FASTA files.
+    (makeblastdb is single-threaded, so there are no threads to distribute.)
+
+    If a BlastDBStore is given, the databases are taken from the store, and
+    only those not already in the store are made. The databases are marked as
+    in use by the store until its release method is called.
 
     Parameters:
         db_loc:     Path to the directory in which to make the databases.
         seqs:       Paths to the FASTA files for which to make the databases.
         jobs (int): The number of parallel jobs to use.
+        store:      Store of databases shared between analyses.
 
     Returns:
         A BlastDBCache with databases for all provided FASTA files.
     """
+    seqs = list(seqs)
+    if store is None:
+        f = lambda p: make_one_db(db_loc, p)._cache
+    else:
+        store.acquire(seqs)
+        f = functools.partial(store_one_db, store)
     cdict = {}
-    for cache in Parallel(n_jobs=jobs)(
-            delayed(make_one_db)(db_loc, p) for p in tqdm(seqs)
+    for entries in tqdm(
+            run_scheduled(
+                QueueScheduler(
+                    [(p,) for p in seqs],
+                    [Path(p).stat().st_size for p in seqs]
+                ),
+                f,
+                jobs
+            ),
+            total=len(seqs)
     ):
-        cdict |= cache._cache
-    cache = BlastDBCache(db_loc)
+        cdict |= entries
+    cache = BlastDBCache(db_loc, find_existing=False)
     cache._cache = cdict
     return cache
 
+def write_pooled_fasta(
+        inputs: Iterable[tuple[int, Path]],
+        out_path: Path
+):
+    """Write the sequences of several inputs to a single FASTA file.
+
+    The ID of each sequence is prefixed with the index of the input from which
+    it came, so that hits of the pooled sequences can be traced back to their
+    samples.
+
+    Parameters:
+        inputs:   Indices of and paths to the FASTA files to pool.
+        out_path: Path of the pooled FASTA file to write.
+    """
+    with open(out_path, "wb") as f:
+        for i, path in inputs:
+            write_fasta(
+                (
+                    FastaRecord(
+                        f"{i}{pooled_id_sep}{record.header}",
+                        record.seq
+                    )
+                    for record in read_fasta(path)
+                ),
+                f
+            )
+
+def pooled_hits_path(dir_: Path, query: int, subject: int) -> Path:
+    """Return the path of the pooled hits for the given sample indices."""
+    return dir_ / f"{query}--{subject}.pkl"
+
+def pooled_search_and_split(
+        subject_index: int,
+        subject: Path,
+        pooled: Path,
+        split_dir: Path,
+        queries: Iterable[int],
+        hf_args: Optional[Iterable] = None,
+        hf_kwargs: Optional[Mapping[str, Any]] = None
+):
+    """Search one sample with pooled queries and split the hits.
+
+    The pooled FASTA file contains the top genes of several query samples (see
+    write_pooled_fasta). It is searched against the subject sample once, and
+    the hits are split by query sample and saved to split_dir, with one file
+    per ordered pair of samples. Hits are only saved for the given query
+    samples; other hits, such as those of the subject sample against itself,
+    are discarded.
+
+    BLAST computes the statistics of each query from the length of the query
+    and the size of the subject's database, and the maximum number of target
+    sequences applies to each query separately. The hits for each query sample
+    are therefore the same as those of a separate search of that sample.
+
+    Parameters:
+        subject_index (int): Index of the subject sample.
+        subject:             Path to the top n transcripts of the subject.
+        pooled:              Path to the pooled FASTA file of the queries.
+        split_dir:           Directory in which to save the split hits.
+        queries:             Indices of query samples for which to save hits.
+        hf_args:             Arguments to pass to HomologFinder constructor.
+        hf_kwargs:           Keyword arguments to pass to HomologFinder.
+    """
+    if hf_args is None:
+        hf_args = []
+    if hf_kwargs is None:
+        hf_kwargs = {}
+    finder = HomologFinder(*hf_args, **hf_kwargs)
+    search = TabularBlastnSearch(
+        pooled,
+        subject,
+        evalue=finder.evalue,
+        additional_columns=HomologFinder.blast_columns,
+        **finder.blast_kwargs
+    )
+    hits = search.hits
+    parts = hits["qseqid"].str.split(pooled_id_sep, n=1)
+    hit_queries = parts.str[0].astype(int).to_numpy()
+    hits["qseqid"] = parts.str[1]
+    for query in queries:
+        hits[hit_queries == query].reset_index(drop=True).to_pickle(
+            pooled_hits_path(split_dir, query, subject_index)
+        )
+
+def find_all_pairs_pooled(
+        inputs: Iterable[Path],
+        output_dir: Path,
+        cache_dir: Path,
+        path_to_sample: Callable[[Path], str],
+        hf_args: Iterable = [],
+        jobs: int = multiprocessing.cpu_count() - 1,
+        hf_kwargs: Optional[Mapping[str, Any]] = None,
+        pairs: Optional[Iterable[tuple[Path, Path]]] = None,
+        ledger: Optional[TableLedger] = None,
+        recalibrate: bool = False,
+        cores: Optional[int] = None,
+        table_cache: Optional[TableCache] = None,
+        db_store: Optional[BlastDBStore] = None
+) -> tuple[Iterator[pd.DataFrame], Iterator[Path], int]:
+    """Obtain gene matches tables for all pairs using pooled BLAST searches.
+
+    Instead of running two BLAST searches for every pair of samples, this
+    function pools the top genes of the samples paired with each sample into
+    a single FASTA file and searches the sample's BLAST database with it once.
+    The hits of each search are split by query sample and saved, and the gene
+    matches table for each pair is then computed from the saved hits by
+    HomologFinder. Since BLAST computes the statistics of each query
+    separately, the tables are identical to those of separate searches.
+
+    Samples searched with the same query samples share one pooled FASTA file.
+    In particular, when every pair of samples is compared, all samples are
+    pooled once, and the hits of each sample against itself are discarded.
+
+    The pooled FASTA files are temporary and are created in the cache_dir,
+    along with the BLAST databases, unless they are taken from a BlastDBStore.
+    The split hits are also stored in the cache_dir until the gene matches
+    tables that need them have been computed. The searches are started in
+    decreasing order of subject size, with the cores split between concurrent
+    searches and their BLAST threads as in find_all_pairs, and the tables are
+    computed in the order given by a PairScheduler.
+
+    The arguments and return value are the same as for find_all_pairs, except
+    that keyword arguments for HomologFinder used to compute the tables from
+    the saved hits can be provided via hf_kwargs, and completed tables are
+    recorded in the given ledger and added to the given TableCache, if any.
+    """
+    if not cache_dir:
+        raise ValueError("Pooled BLAST searches require a cache directory.")
+    if pairs is None:
+        pairs = list(itertools.combinations(inputs, 2))
+    else:
+        pairs = list(pairs)
+    if not pairs:
+        return iter([]), iter([]), 0
+    inputs = list(dict.fromkeys(itertools.chain.from_iterable(pairs)))
+    stats = {p: fasta_stats(p) for p in inputs}
+    index = {p: i for (i, p) in enumerate(inputs)}
+    queries = defaultdict(set)
+    for p1, p2 in pairs:
+        queries[index[p1]].add(index[p2])
+        queries[index[p2]].add(index[p1])
+    # Including the subject among its own queries costs one wasted search of
+    # the subject against itself, but it lets all samples share one file when
+    # every pair is compared.
+    pool_keys = {
+        i: frozenset(q | {i}) if len(q) + 1 == len(inputs) else frozenset(q)
+        for (i, q) in queries.items()
+    }
+    split_dir = Path(cache_dir) / "pooled_hits"
+    split_dir.mkdir(parents=True, exist_ok=True)
+    eprint("Building BLAST DBs.")
+    cache = make_all_dbs(cache_dir, inputs, jobs=jobs, store=db_store)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as pool_dir:
+        pools = {}
+        for n, key in enumerate(dict.fromkeys(pool_keys.values())):
+            pools[key] = Path(pool_dir) / f"pooled{n}.fasta"
+            write_pooled_fasta(
+                ((i, inputs[i]) for i in sorted(key)),
+                pools[key]
+            )
+        eprint("Running pooled BLAST searches.")
+        consume(
+            tqdm(
+                run_scheduled(
+                    QueueScheduler(
+                        [(i, inputs[i]) for i in queries],
+                        [stats[inputs[i]][0] for i in queries]
+                    ),
+                    lambda i, p, threads: pooled_search_and_split(
+                        i,
+                        p,
+                        pools[pool_keys[i]],
+                        split_dir,
+                        queries[i],
+                        hf_args=hf_args,
+                        hf_kwargs={"db_cache": cache, "threads": threads}
+                    ),
+                    jobs,
+                    cores=jobs if cores is None else cores
+                ),
+                total=len(queries)
+            )
+        )
+    mop = functools.partial(
+        make_output_path,
+        path_to_sample=path_to_sample,
+        extension="h5"
+    )
+    return (
+        run_scheduled(
+            PairScheduler(pairs, stats, recalibrate=recalibrate),
+            # As in gene_matches, the forward hits of a pair are those with the
+            # second sample's transcripts as the BLAST queries.
+            lambda p1, p2: find_homologs_from_hits_and_save(
+                p1,
+                p2,
+                pooled_hits_path(split_dir, index[p2], index[p1]),
+                pooled_hits_path(split_dir, index[p1], index[p2]),
+                mop(output_dir, p1, p2),
+                hf_args=hf_args,
+                hf_kwargs=hf_kwargs,
+                ledger=ledger,
+                table_cache=table_cache
+            ),
+            jobs
+        ), map(
+            lambda x: mop(output_dir, *x),
+            pairs
+        ), len(pairs)
+    )
+
 def find_all_pairs(
         inputs: Iterable[Path],
         output_dir: Path,
@@ -165,6 +582,14 @@ def find_all_pairs(
         path_to_sample: Callable[[Path], str],
         hf_args: Iterable = [],
         jobs: int = multiprocessing.cpu_count() - 1,
+        pooled: bool = False,
+        hits_dir: Optional[Path] = None,
+        pairs: Optional[Iterable[tuple[Path, Path]]] = None,
+        resume: bool = False,
+        recalibrate: bool = False,
+        cores: Optional[int] = None,
+        table_cache: Optional[TableCache] = None,
+        db_store: Optional[BlastDBStore] = None
 ) -> tuple[Iterator[pd.DataFrame], Iterator[Path], int]:
     """Obtain gene matches tables for all pairs of input samples.
 
@@ -191,7 +616,59 @@ def find_all_pairs(
 
     The final element of the returned value is the total number of gene matches
     tables. This value is provided for convenience---it's always s choose 2,
-    where s is the number of samples.
+    where s is the number of samples, unless specific pairs are requested.
+
+    By default, tables are computed for every pair of inputs. To compute tables
+    for only some pairs (for example, when adding samples to an existing
+    analysis), the pairs may be provided explicitly. In that case, BLAST DBs
+    are only made for the samples that appear in the given pairs.
+
+    When pooled is True, the BLAST searches are performed with
+    find_all_pairs_pooled, which searches the database of each sample once
+    with the other samples pooled as queries rather than running two searches
+    per pair of samples. The tables are the same.
+
+    When hits_dir is given, the raw hits of every unidirectional search are
+    saved in a HitArchive in that directory, so the tables can later be
+    rebuilt with different settings without running BLAST (see
+    rebuild_tables).
+
+    Tables are written atomically, and each completed table is recorded in a
+    TableLedger in the output directory. When resume is True, pairs whose
+    tables are recorded in the ledger and whose files still match the recorded
+    checksums are not computed again. Their tables are instead read from disk
+    and yielded after the newly computed tables, so the returned iterators
+    still cover every pair. Only resume a run with the same settings as the
+    interrupted run; the ledger does not record the settings used to compute
+    the tables.
+
+    Pairs are not submitted to the workers in the order in which they are
+    given. Instead, a PairScheduler estimates the cost of each pair from the
+    numbers of bases and sequences in the two samples, and the most expensive
+    pairs are started first, so that a few large pairs do not keep one worker
+    busy after the others have finished. When recalibrate is True, the cost
+    estimates are refit to the durations of the completed pairs as the run
+    progresses.
+
+    The number of cores to use can be given separately from the number of
+    parallel jobs; by default, it is the same. A CoreBudget divides the cores
+    between the running jobs, and each BLAST search uses as many threads as
+    its job was given. Each job gets an equal share of the cores while there
+    are more remaining pairs than jobs, and the remaining pairs share all free
+    cores when there are fewer, so BLAST searches are multithreaded whenever
+    there are fewer pairs than cores.
+
+    When a TableCache is given, the tables of pairs whose top genes files and
+    settings match those of a table in the cache are restored from the cache
+    instead of being computed, and every newly computed table is added to the
+    cache. Since restored pairs are never searched, the cache is not used to
+    restore tables when hits_dir is given.
+
+    When a BlastDBStore is given, the BLAST databases for the samples are
+    taken from the store instead of being made in the cache_dir, and
+    makeblastdb is only run for samples whose top genes files are not already
+    in the store. The databases are protected from pruning until the store's
+    release method is called or the process exits.
 
     Parameters:
         inputs:         Paths to sample transcripts (of top n genes).
@@ -200,36 +677,102 @@ def find_all_pairs(
         path_to_sample: Function mapping paths to sample names.
         hf_args:        Arguments to pass to HomologFinder.
         jobs (int):     Number of parallel jobs to use.
+        pooled (bool):  Search each sample's DB once with pooled queries.
+        hits_dir:       Directory in which to archive raw BLAST hits.
+        pairs:          Pairs of inputs for which to compute tables.
+        resume (bool):  Skip pairs whose tables were completed and verified.
+        recalibrate:    Refit pair cost estimates to observed durations.
+        cores (int):    Number of cores to split between jobs and threads.
+        table_cache:    Cache of tables shared between analyses.
+        db_store:       Store of BLAST DBs shared between analyses.
 
     Returns:
         Gene matches tables, paths to tables, number of tables
     """
-    cache = None
-    if cache_dir:
-        eprint("Building BLAST DBs.")
-        cache = make_all_dbs(cache_dir, inputs, jobs=jobs)
-    fh = functools.partial(
-        find_homologs_and_save,
-        hf_args=hf_args,
-        hf_kwargs = {
-            "db_cache": cache
-        }
-    )
+    hf_kwargs = {}
+    if hits_dir:
+        hf_kwargs["hit_archive"] = HitArchive(hits_dir, path_to_sample)
+    if pairs is None:
+        pairs = list(itertools.combinations(inputs, 2))
+    else:
+        pairs = list(pairs)
     mop = functools.partial(
         make_output_path,
         path_to_sample=path_to_sample,
         extension="h5"
     )
+    ledger = TableLedger(output_dir)
+    done = []
+    pending = pairs
+    if resume:
+        done, pending = split_completed(
+            pairs,
+            functools.partial(mop, output_dir),
+            ledger
+        )
+    if table_cache is not None and not hits_dir:
+        uncached = []
+        for p in pending:
+            out_path = mop(output_dir, *p)
+            if restore_cached_table(table_cache, *p, out_path, ledger) is None:
+                uncached.append(p)
+            else:
+                done.append(out_path)
+        eprint(
+            f"Restored {len(pending) - len(uncached)} tables from the table "
+            "cache."
+        )
+        pending = uncached
+    if pooled:
+        tables, _, _ = find_all_pairs_pooled(
+            inputs,
+            output_dir,
+            cache_dir,
+            path_to_sample,
+            hf_args=hf_args,
+            jobs=jobs,
+            hf_kwargs=hf_kwargs,
+            pairs=pending,
+            ledger=ledger,
+            recalibrate=recalibrate,
+            cores=cores,
+            table_cache=table_cache,
+            db_store=db_store
+        )
+    else:
+        inputs = list(dict.fromkeys(itertools.chain.from_iterable(pending)))
+        cache = None
+        if (cache_dir or db_store is not None) and inputs:
+            eprint("Building BLAST DBs.")
+            cache = make_all_dbs(
+                cache_dir,
+                inputs,
+                jobs=jobs,
+                store=db_store
+            )
+        tables = run_scheduled(
+            PairScheduler.from_paths(pending, recalibrate=recalibrate),
+            lambda p1, p2, threads: find_homologs_and_save(
+                p1,
+                p2,
+                mop(output_dir, p1, p2),
+                hf_args=hf_args,
+                hf_kwargs={
+                    "db_cache": cache,
+                    "threads": threads
+                } | hf_kwargs,
+                ledger=ledger,
+                table_cache=table_cache
+            ),
+            jobs,
+            cores=jobs if cores is None else cores
+        )
     return (
-        Parallel(n_jobs=jobs, return_as="generator_unordered")(
-            delayed(
-                fh
-            )(*p, mop(output_dir, *p))
-            for p in itertools.combinations(inputs, 2)
-        ), map(
+        itertools.chain(tables, map(read_table, done)),
+        map(
             lambda x: mop(output_dir, *x),
-            itertools.combinations(inputs,2)
-        ), math.comb(len(inputs), 2)
+            pairs
+        ), len(pairs)
     )
 
 def sample_regex_parse(regex):
@@ -285,7 +828,13 @@ def main():
                     config.evalue,
                     config.keep_all
                 ],
-                jobs=config.jobs
+                jobs=config.jobs,
+                pooled=config.pooled_blast,
+                hits_dir=config.hits_dir,
+                resume=args.resume,
+                recalibrate=config.recalibrate_schedule,
+                table_cache=TableCache.from_config(config),
+                db_store=BlastDBStore.from_config(config)
             )
             consume(tqdm(gen, total=gen_len))
             config.mark_finish()
@@ -1,18 +1,25 @@
+import io
 import re
 import numbers
 import functools
+import itertools
+import subprocess
+import threading
+import importlib.metadata
 
 import numpy as np
 import pandas as pd
 
 from fractions import Fraction
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 from simple_blast.blasting import TabularBlastnSearch
 
 from . import config as config_module
 from . import app
+from .hit_archive import HitArchive
+from .keys import pack_gene_pairs, sorted_contains
 from .transcripts import TranscriptID, TranscriptIDParseError
 from .app import eprint, set_except_hook
 
@@ -51,6 +58,9 @@ def build_parser():
     )
     return arg_config
 
+# Number of BLAST output rows to read at once when streaming hits.
+default_chunksize = 1 << 20
+
 def parse_seq_id(regex: re.compile, s: pd.Series) -> pd.DataFrame:
     """Parse a seq_id column to extract the gene and isoform IDs."""
     return s.str.extract(regex).astype(np.int32)
@@ -87,6 +97,7 @@ def gene_matches(
         n: int = 1,
         keep_seqids: bool = False,
         shrink: bool = True,
+        chunksize: Optional[int] = default_chunksize,
         **blast_kwargs
 ) -> pd.DataFrame:
     """Find the isotigs in file 2 that best match each gene in file 1.
@@ -107,6 +118,15 @@ def gene_matches(
     Additional parameters for the BLAST search may also be provided as variadic
     arguments to this function.
 
+    By default, the output of the BLAST search is not loaded all at once.
+    Instead, it is read in chunks of chunksize rows as BLAST produces it, and
+    only the hits that could still be among the top n for their query gene are
+    kept between chunks (see stream_best_gene_matches). Peak memory usage then
+    depends on the number of query genes and the chunk size rather than on the
+    total number of hits, which can be very large for repetitive
+    transcriptomes. If chunksize is None, all hits are loaded before the best
+    matches are selected.
+
     Parameters:
         parse:              Function to parse seq IDs into gene and isotig IDs.
         path1 (str):        Path to the BLAST search query FASTA file.
@@ -115,6 +135,7 @@ def gene_matches(
         n (int):            Number of top matches to select for each query gene.
         keep_seqids (bool): Whether to keep the raw seqid columns.
         shrink (bool):      Attempt to reduce memory usage.
+        chunksize (int):    Number of BLAST output rows to read at once.
 
     Returns:
         A dataframe of BLAST hits for subject isotigs best matching query genes.
@@ -122,16 +143,204 @@ def gene_matches(
     # TODO: Check whether we really want the top n subject isotigs or the top
     # n subject genes. (I suspect we really want the latter.)
     search = TabularBlastnSearch(path2, path1, evalue=evalue, **blast_kwargs)
-    hits = search.hits
-    for t in ["q", "s"]:
-        hits[[t + "gene", t + "iso"]] = parse(search.hits[t + "seqid"])
+    if chunksize is not None:
+        return stream_best_gene_matches(
+            parse,
+            stream_hits(search, chunksize),
+            n=n,
+            keep_seqids=keep_seqids,
+            shrink=shrink
+        )
+    return best_gene_matches(
+        parse,
+        search.hits,
+        n=n,
+        keep_seqids=keep_seqids,
+        shrink=shrink
+    )
+
+def best_gene_matches(
+        parse: Optional[Callable[[pd.Series], pd.DataFrame]],
+        hits: pd.DataFrame,
+        n: int = 1,
+        keep_seqids: bool = False,
+        shrink: bool = True
+) -> pd.DataFrame:
+    """Select the hits for the isotigs that best match each query gene.
+
+    This function performs the processing gene_matches applies to the results
+    of its BLAST search. It can be used directly when the BLAST hits were
+    obtained some other way, such as from a pooled search.
+
+    If parse is None, the hits must already have the gene and isotig ID
+    columns (qgene, qiso, sgene, and siso).
+
+    Parameters:
+        parse:              Function to parse seq IDs into gene and isotig IDs.
+        hits:               BLAST hits with qseqid, sseqid, and bitscore.
+        n (int):            Number of top matches to select for each query gene.
+        keep_seqids (bool): Whether to keep the raw seqid columns.
+        shrink (bool):      Attempt to reduce memory usage.
+
+    Returns:
+        A dataframe of BLAST hits for subject isotigs best matching query genes.
+    """
+    if parse is not None:
+        add_gene_columns(parse, hits)
     if not keep_seqids:
-        hits = search.hits.drop(["qseqid", "sseqid"], axis=1)
+        hits = hits.drop(columns=["qseqid", "sseqid"], errors="ignore")
     res = highest_bitscores(hits, n, keep="all")
     if shrink:
         res = shrink_df(res)
     return res
 
+# Versions (major, minor) of simple_blast whose private BlastnSearch._run
+# stream_hits may use.
+streaming_simple_blast_versions = {(0, 7)}
+
+@functools.cache
+def can_stream_hits() -> bool:
+    """Return whether the installed simple_blast lets stream_hits stream."""
+    version = re.match(
+        r"(\d+)\.(\d+)",
+        importlib.metadata.version("simple_blast")
+    )
+    return version is not None and \
+        tuple(map(int, version.groups())) in streaming_simple_blast_versions
+
+def stream_hits(
+        search: TabularBlastnSearch,
+        chunksize: int = default_chunksize
+) -> Iterator[pd.DataFrame]:
+    """Run a BLAST search and yield its hits in chunks as they are produced.
+
+    Unlike the hits property of the search, this function never holds all of
+    the hits in memory. The rows of the yielded dataframes are numbered
+    consecutively across chunks, as if the chunks were parts of one dataframe.
+    Each chunk is parsed with the search's parse_hits method, so column dtypes
+    are inferred separately for each chunk, and categorical columns may have
+    different categories in different chunks.
+
+    simple_blast has no public way to read the output of a search while BLAST
+    is running, so this function uses the private BlastnSearch._run method. If
+    the installed simple_blast is not known to have that method (see
+    can_stream_hits), all of the hits are loaded and yielded as one chunk.
+
+    Parameters:
+        search:          The BLAST search to run.
+        chunksize (int): Maximum number of rows in each chunk.
+    """
+    if not can_stream_hits():
+        yield search.hits
+        return
+    proc = search._run()
+    # Drain stderr in the background so that BLAST cannot block on it.
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+    drain.start()
+    try:
+        start = 0
+        while True:
+            lines = list(itertools.islice(proc.stdout, chunksize))
+            # An empty chunk is yielded only when there are no hits at all.
+            if not lines and start:
+                break
+            chunk = search.parse_hits(
+                io.BytesIO(b"".join(lines)),
+                search.out_columns,
+                search.column_dtypes
+            )
+            chunk.index += start
+            start += len(chunk)
+            yield chunk
+            if len(lines) < chunksize:
+                break
+    finally:
+        if proc.poll() is None:
+            proc.stdout.close()
+            proc.kill()
+        proc.wait()
+        drain.join()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(
+            proc.returncode,
+            proc.args,
+            stderr=stderr[0] if stderr else None
+        )
+
+def stream_best_gene_matches(
+        parse: Optional[Callable[[pd.Series], pd.DataFrame]],
+        chunks: Iterable[pd.DataFrame],
+        n: int = 1,
+        keep_seqids: bool = False,
+        shrink: bool = True
+) -> pd.DataFrame:
+    """Select the best matches for each query gene from chunks of BLAST hits.
+
+    This function gives the same result as best_gene_matches applied to the
+    concatenation of the chunks, but it only keeps the current best hits for
+    each query gene between chunks. Since ties are kept, a hit that is not
+    among the top n hits for its gene in the chunks seen so far cannot be among
+    the top n hits for its gene overall, so it can be discarded immediately.
+    The hits kept between chunks are bounded by n per query gene (plus ties).
+    At least one chunk (which may be empty) must be provided.
+
+    Parameters:
+        parse:              Function to parse seq IDs into gene and isotig IDs.
+        chunks:             Chunks of BLAST hits with qseqid, sseqid, bitscore.
+        n (int):            Number of top matches to select for each query gene.
+        keep_seqids (bool): Whether to keep the raw seqid columns.
+        shrink (bool):      Attempt to reduce memory usage.
+
+    Returns:
+        A dataframe of BLAST hits for subject isotigs best matching query genes.
+    """
+    best = None
+    for chunk in chunks:
+        chunk = best_gene_matches(
+            parse,
+            chunk,
+            n=n,
+            keep_seqids=keep_seqids,
+            shrink=False
+        )
+        if best is not None:
+            chunk = highest_bitscores(
+                pd.concat([best, chunk]),
+                n,
+                keep="all"
+            )
+        best = chunk
+    if best is None:
+        raise ValueError("No chunks of BLAST hits were provided.")
+    best = best.sort_index()
+    # Concatenating categorical columns with different categories gives object
+    # columns, so the dtypes of the parsed hits are restored here.
+    for col, dtype in TabularBlastnSearch.column_dtypes.items():
+        if col in best.columns:
+            best[col] = best[col].astype(dtype)
+    if not best.empty:
+        # Restore the order best_gene_matches gives the hits.
+        best = highest_bitscores(best, n, keep="all")
+    if shrink:
+        best = shrink_df(best)
+    return best
+
+def add_gene_columns(
+        parse: Callable[[pd.Series], pd.DataFrame],
+        hits: pd.DataFrame
+):
+    """Add gene and isotig ID columns parsed from the seq IDs of BLAST hits.
+
+    Parameters:
+        parse: Function to parse seq IDs into gene and isotig IDs.
+        hits:  BLAST hits with qseqid and sseqid columns.
+    """
+    for t in ["q", "s"]:
+        hits[[t + "gene", t + "iso"]] = parse(
+            hits[t + "seqid"]
+        ).to_numpy()
+
 def highest_bitscores(
         df: pd.DataFrame,
         n: int = 1,
@@ -145,33 +354,124 @@ def highest_bitscores(
     the column on which to group and the number of hits to select per group may
     be controlled with the optional parameters.
 
-    Additional keyword arguments will be passed to the pandas nlargest function
-    to control its behavior. This allows the caller to change the strategy for
-    breaking ties, for example.
+    Additional keyword arguments control the behavior of the selection in the
+    same way as they would for the pandas nlargest function. This allows the
+    caller to change the strategy for breaking ties, for example. Unless other
+    keyword arguments are given or keep is "last", the selection is performed
+    by array_highest_bitscores, which is much faster than pandas. Otherwise,
+    the arguments are passed to pandas_highest_bitscores.
 
     Parameters:
         df:            A dataframe containing BLAST hits.
         n (int):       Number of top hits to select per group.
         groupby (str): Column on which to group hits.
     """
-    try:
-        return df.loc[
-            df.groupby(
-                groupby
-            )["bitscore"].nlargest(n, **kwargs).index.get_level_values(-1)
-        ]
-    except TypeError:
-        from IPython import embed; embed()
+    if set(kwargs) <= {"keep"} and kwargs.get("keep") != "last":
+        return array_highest_bitscores(df, n, groupby, **kwargs)
+    return pandas_highest_bitscores(df, n, groupby, **kwargs)
+
+def pandas_highest_bitscores(
+        df: pd.DataFrame,
+        n: int = 1,
+        groupby: str | list[str] = "qgene",
+        **kwargs
+) -> pd.DataFrame:
+    """Select the rows with the highest bitscore for each group using pandas.
+
+    This is the reference implementation of highest_bitscores. Additional
+    keyword arguments are passed to the pandas nlargest function.
+
+    Parameters:
+        df:            A dataframe containing BLAST hits.
+        n (int):       Number of top hits to select per group.
+        groupby (str): Column on which to group hits.
+    """
+    return df.loc[
+        df.groupby(
+            groupby
+        )["bitscore"].nlargest(n, **kwargs).index.get_level_values(-1)
+    ]
+
+def array_highest_bitscores(
+        df: pd.DataFrame,
+        n: int = 1,
+        groupby: str | list[str] = "qgene",
+        keep: str = "first"
+) -> pd.DataFrame:
+    """Select the rows with the highest bitscore for each group using NumPy.
+
+    This function selects the same rows, in the same order, as
+    pandas_highest_bitscores, but it avoids the per-group overhead of pandas.
+    The rows are sorted once with np.lexsort by group keys, by descending
+    bitscore, and by position, and the top rows of each group are then selected
+    from the boundaries of the groups in the sorted order.
+
+    As with pandas, groups are ordered by their keys, rows whose group key is
+    missing are dropped, and rows with missing bitscores are ranked below all
+    others. The keep parameter determines how ties are handled. With
+    keep="first", exactly n rows (or all rows, if fewer) are selected from
+    each group, preferring the first of any tied rows. With keep="all", every
+    row whose bitscore is at least the nth highest bitscore in its group is
+    selected. (keep="last" is not supported, since the order in which pandas
+    returns the rows in that case depends on the group size.)
+
+    Unlike pandas_highest_bitscores, this function selects rows by position, so
+    it also works for dataframes with duplicate index labels.
+
+    Parameters:
+        df:            A dataframe containing BLAST hits.
+        n (int):       Number of top hits to select per group.
+        groupby (str): Column(s) on which to group hits.
+        keep (str):    How to handle ties: "first" or "all".
+    """
+    if keep not in ["first", "all"]:
+        raise ValueError(f"Unsupported keep value {keep}.")
+    if isinstance(groupby, str):
+        groupby = [groupby]
+    codes = [pd.factorize(df[col], sort=True)[0] for col in groupby]
+    valid = np.ones(len(df), dtype=bool)
+    for c in codes:
+        valid &= c >= 0
+    positions = np.flatnonzero(valid)
+    codes = [c[positions] for c in codes]
+    # Sort keys are negated bitscores, with missing bitscores last.
+    scores = -df["bitscore"].to_numpy(dtype=np.float64)[positions]
+    scores[np.isnan(scores)] = np.inf
+    # lexsort sorts by the last key first.
+    order = np.lexsort([positions, scores] + codes[::-1])
+    if len(order) == 0 or n <= 0:
+        return df.iloc[positions[order][:0]]
+    scores = scores[order]
+    new_group = np.zeros(len(order), dtype=bool)
+    new_group[0] = True
+    for c in codes:
+        c = c[order]
+        new_group[1:] |= c[1:] != c[:-1]
+    starts = np.flatnonzero(new_group)
+    sizes = np.diff(np.append(starts, len(order)))
+    group_start = np.repeat(starts, sizes)
+    if keep == "all":
+        # The nth highest bitscore in each group (or the lowest, if fewer).
+        nth = scores[starts + np.minimum(sizes, n) - 1]
+        selected = scores <= np.repeat(nth, sizes)
+    else:
+        selected = np.arange(len(order)) - group_start < n
+    return df.iloc[positions[order[selected]]]
 
 class HomologFinder:
     """Obtains gene matches tables using given parameters.
 
     Attributes:
-        keep_all (bool): Whether to keep all rows in the case of ties.
-        debug (bool):    Whether debug behavior is enabled.
+        evalue (float):      e-value cutoff used for BLAST searches.
+        blast_kwargs (dict): Additional keyword arguments for BLAST searches.
+        keep_all (bool):     Whether to keep all rows in the case of ties.
+        debug (bool):        Whether debug behavior is enabled.
+        hit_archive:         Archive in which raw BLAST hits are saved.
     """
     # When the forward and reverse matches are merged, these columns are used.
     merge_columns = ["qgene", "sgene"]
+    # Columns requested from BLAST in addition to the default columns.
+    blast_columns = ["gaps", "nident", "sstrand"]
     
     def __init__(
             self,
@@ -180,24 +480,41 @@ class HomologFinder:
             evalue: float,
             keep_all: bool,
             debug: bool = False,
+            hit_archive: Optional[HitArchive] = None,
+            chunksize: Optional[int] = default_chunksize,
             **blast_kwargs
     ):
         """Constructs a HomomlogFinder that uses the provided parameters.
 
+        If a HitArchive is provided, the raw hits of every BLAST search are
+        saved to it so that gene matches tables can later be rebuilt with
+        different settings using get_match_table_from_archive.
+
+        Unless a HitArchive is provided (in which case every hit is needed), the
+        output of each BLAST search is read in chunks of chunksize rows, keeping
+        only the best hits for each query gene between chunks. A chunksize of
+        None loads the full output of each search at once instead.
+
         Parameters:
             parse_transcript_id: Function to parse transcript IDs.
             top_n (int):         Top hits to select for each query gene (big N).
             evalue (float):      e-value cutoff to use for BLAST searches
             keep_all (bool):     Keep all matches in the case of ties.
             debug (bool):        Whether debug behavior is enabled.
+            hit_archive:         Archive in which to save raw BLAST hits.
+            chunksize (int):     Number of BLAST output rows to read at once.
         """            
         # self.regex = regex
         # self.top_n = top_n
-        # self.evalue = evalue
+        self.evalue = evalue
+        self.blast_kwargs = blast_kwargs
         # Partially apply some functions to make the code below less repetitive.
-        parse = lambda x: pd.DataFrame(
-            x.apply(lambda y: parse_transcript_id(y)[1:]).tolist()
-        )
+        #
+        # IDs are parsed in batches, since hit tables can contain millions of
+        # rows.
+        parse_transcript_ids = TranscriptID.batch_parser(parse_transcript_id)
+        parse = lambda x: parse_transcript_ids(x)[["gene", "isoform"]]
+        self.parse = parse
         # gm is a function that obtains unidirectional best matches for a pair
         # of samples using the given parameters.
         assert top_n is not None
@@ -206,11 +523,15 @@ class HomologFinder:
             parse=parse,
             evalue=evalue,
             n=top_n,
-            additional_columns=["gaps", "nident", "sstrand"],
+            chunksize=chunksize,
+            additional_columns=type(self).blast_columns,
             **blast_kwargs
         )
+        # bm does the same for BLAST hits that have already been obtained.
+        self.bm = functools.partial(best_gene_matches, parse=parse, n=top_n)
         self.keep_all = keep_all
         self.debug = debug
+        self.hit_archive = hit_archive
 
     def get_match_table(
             self,
@@ -230,19 +551,146 @@ class HomologFinder:
         Returns:
             A Pandas dataframe representing the samples' gene matches table.
         """
-        if self.debug:
-            eprint("Getting forward matches.")
-        forward_matches = self.gm(
-            path1=transcripts1,
-            path2=transcripts2
+        if self.hit_archive is None:
+            if self.debug:
+                eprint("Getting forward matches.")
+            forward_matches = self.gm(
+                path1=transcripts1,
+                path2=transcripts2
+            )
+            if self.debug:
+                eprint("Getting reverse matches.")
+            backward_matches = self.gm(
+                path1=transcripts2,
+                path2=transcripts1
+            )
+            return self.combine_matches(forward_matches, backward_matches)
+        hits = []
+        for query, subject in [
+                (transcripts1, transcripts2),
+                (transcripts2, transcripts1)
+        ]:
+            if self.debug:
+                eprint(f"Getting matches for {query} against {subject}.")
+            hits.append(
+                TabularBlastnSearch(
+                    subject,
+                    query,
+                    evalue=self.evalue,
+                    additional_columns=type(self).blast_columns,
+                    **self.blast_kwargs
+                ).hits
+            )
+        return self.get_match_table_from_hits(*hits, transcripts1, transcripts2)
+
+    def get_match_table_from_hits(
+            self,
+            forward_hits: pd.DataFrame,
+            backward_hits: pd.DataFrame,
+            transcripts1: Optional[Path] = None,
+            transcripts2: Optional[Path] = None
+    ) -> pd.DataFrame:
+        """Obtains the gene matches table from precomputed BLAST hits.
+
+        The hits must have the columns that get_match_table would obtain from
+        BLAST (the default tabular columns plus blast_columns). As in
+        get_match_table, the forward hits are those of the BLAST search with
+        the sample 2 transcripts as queries and the sample 1 transcripts as
+        subjects, and the backward hits are those of the opposite search.
+
+        If the HomologFinder has a hit_archive and the paths to the transcripts
+        are given, the hits are saved to the archive.
+
+        Parameters:
+            forward_hits:  BLAST hits of sample 2 queries against sample 1.
+            backward_hits: BLAST hits of sample 1 queries against sample 2.
+            transcripts1:  A path to the (top n) transcripts for sample 1.
+            transcripts2:  A path to the (top n) transcripts for sample 2.
+
+        Returns:
+            A Pandas dataframe representing the samples' gene matches table.
+        """
+        for hits in [forward_hits, backward_hits]:
+            add_gene_columns(self.parse, hits)
+        if self.hit_archive is not None and transcripts1 and transcripts2:
+            self.hit_archive.save(transcripts1, transcripts2, forward_hits)
+            self.hit_archive.save(transcripts2, transcripts1, backward_hits)
+        return self.combine_matches(
+            self.bm(hits=forward_hits, parse=None),
+            self.bm(hits=backward_hits, parse=None)
         )
-        forward_matches["reverse"] = False
-        if self.debug:
-            eprint("Getting reverse matches.")
-        backward_matches = self.gm(
-            path1=transcripts2,
-            path2=transcripts1
+
+    def get_match_table_from_archive(
+            self,
+            transcripts1: Path,
+            transcripts2: Path,
+            archive: Optional[HitArchive] = None
+    ) -> pd.DataFrame:
+        """Rebuilds the gene matches table from archived BLAST hits.
+
+        The table is computed using this HomologFinder's top_n, keep_all, and
+        evalue settings. Since the archive only contains hits that passed the
+        e-value cutoff of the original searches, the evalue setting can only
+        make the cutoff stricter.
+
+        Tables rebuilt from an archive contain only the archived columns, plus
+        the columns added by HomologFinder.
+
+        Parameters:
+            transcripts1: A path to the (top n) transcripts for sample 1.
+            transcripts2: A path to the (top n) transcripts for sample 2.
+            archive:      Archive to read (default is the hit_archive).
+
+        Returns:
+            A Pandas dataframe representing the samples' gene matches table.
+        """
+        if archive is None:
+            archive = self.hit_archive
+        return self.get_match_table_from_gene_hits(
+            archive.load(transcripts1, transcripts2),
+            archive.load(transcripts2, transcripts1)
         )
+
+    def get_match_table_from_gene_hits(
+            self,
+            forward_hits: pd.DataFrame,
+            backward_hits: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Obtains the gene matches table from hits with parsed gene IDs.
+
+        Hits with e-values above this HomologFinder's cutoff are discarded
+        first. The given dataframes are not modified, so the same hits can be
+        used with several HomologFinders.
+
+        Parameters:
+            forward_hits:  Hits of sample 1 queries against sample 2.
+            backward_hits: Hits of sample 2 queries against sample 1.
+
+        Returns:
+            A Pandas dataframe representing the samples' gene matches table.
+        """
+        return self.combine_matches(
+            *(
+                self.bm(hits=hits[hits["evalue"] <= self.evalue], parse=None)
+                for hits in [forward_hits, backward_hits]
+            )
+        )
+
+    def combine_matches(
+            self,
+            forward_matches: pd.DataFrame,
+            backward_matches: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Combines best matches from both directions into a gene matches table.
+
+        Parameters:
+            forward_matches:  Best matches for sample 1 genes in sample 2.
+            backward_matches: Best matches for sample 2 genes in sample 1.
+
+        Returns:
+            A Pandas dataframe representing the samples' gene matches table.
+        """
+        forward_matches["reverse"] = False
         backward_matches["reverse"] = True
         # We rename the columns in the reverse matches to enable merging.
         backward_matches.rename(
@@ -257,49 +705,97 @@ class HomologFinder:
         #
         # A row (hit) in either dataframe with query gene ID q and subject gene
         # ID s is kept if and only if there is a row with query gene ID q and
-        # subject gene ID s in both dataframes.
+        # subject gene ID s in both dataframes. Each (q, s) pair is packed into
+        # one integer key, so membership is tested by binary search in sorted
+        # keys instead of by merging the dataframes.
+        #
+        # The candidates are the kept forward rows in their original order,
+        # followed by the kept reverse rows, stably sorted by the position of
+        # the first forward row with the same key. This is the order of an
+        # inner merge sorted by forward and then reverse row, which pandas
+        # documents but does not guarantee for rows with the same key. The
+        # order decides which of several tied hits is kept when keep_all is
+        # False.
         #
-        # The resulting dataframe has two columns---index_x and index_y---that
-        # indicate where in the original dataframes the rows were found.
-        # 
         # (Keep in mind that we swapped the order of query and subject in the
         # reverse dataframe, so "query" is always something in sample 1, and
-        # "subject" is always something in sample 2 from now on.)        
-        if forward_matches.empty or backward_matches.empty:
-            intersection = pd.DataFrame(
-                columns=self.merge_columns + ["index_x", "index_y"]
-            )
-        else:
-            intersection = pd.merge(
-                forward_matches[self.merge_columns].reset_index(),
-                backward_matches[self.merge_columns].reset_index(),
-                how="inner",
-                on=self.merge_columns
-            )
+        # "subject" is always something in sample 2 from now on.)
+        forward_keys = pack_gene_pairs(
+            forward_matches["qgene"],
+            forward_matches["sgene"]
+        )
+        backward_keys = pack_gene_pairs(
+            backward_matches["qgene"],
+            backward_matches["sgene"]
+        )
+        forward_rows = np.flatnonzero(
+            sorted_contains(np.sort(backward_keys), forward_keys)
+        )
+        by_key = np.argsort(forward_keys, kind="stable")
+        sorted_keys = forward_keys[by_key]
+        first = np.searchsorted(sorted_keys, backward_keys)
+        backward_rows = np.flatnonzero(
+            sorted_contains(sorted_keys, backward_keys)
+        )
+        backward_rows = backward_rows[
+            np.argsort(by_key[first[backward_rows]], kind="stable")
+        ]
         # Get the hits (and subject gene ID) with the highest bitscore for each
         # query gene.
-        return highest_bitscores(
-            # Get the hits with highest bitscore for each pair of homologous
-            # genes.
-            highest_bitscores(
-                # Get the original rows back from the forward and reverse
-                # dataframes.
-                pd.concat(
-                    [
-                        forward_matches.loc[
-                            intersection["index_x"].drop_duplicates()
-                        ],
-                        backward_matches.loc[
-                            intersection["index_y"].drop_duplicates()
-                        ],
-                    ]
-                ).reset_index(drop=True),
-                groupby=self.merge_columns,
-                # TODO: Decide if "all" is the right choice here.
-                keep="all"
-            ),
-            keep=["first", "all"][self.keep_all]
-        )        
+        #
+        # A hit with the highest bitscore for its query gene also has the
+        # highest bitscore for its pair of genes, so the hits are selected in a
+        # single pass over the candidates sorted (stably) by query and subject
+        # gene. This selects the same rows, in the same order, as selecting the
+        # best hits for each pair of genes and then for each query gene with
+        # highest_bitscores.
+        def gather(column, dtype):
+            return np.concatenate([
+                forward_matches[column].to_numpy(dtype=dtype)[forward_rows],
+                backward_matches[column].to_numpy(dtype=dtype)[backward_rows]
+            ])
+        qgenes = gather("qgene", np.int64)
+        sgenes = gather("sgene", np.int64)
+        scores = gather("bitscore", np.float64)
+        scores[np.isnan(scores)] = -np.inf
+        order = np.lexsort([sgenes, qgenes])
+        qgenes = qgenes[order]
+        scores = scores[order]
+        if len(order):
+            starts = np.flatnonzero(
+                np.concatenate([[True], qgenes[1:] != qgenes[:-1]])
+            )
+            best = np.maximum.reduceat(scores, starts)
+            selected = scores == np.repeat(
+                best,
+                np.diff(starts, append=len(scores))
+            )
+            order, qgenes = order[selected], qgenes[selected]
+            if not self.keep_all:
+                order = order[
+                    np.concatenate([[True], qgenes[1:] != qgenes[:-1]])
+                ]
+        # Gather the selected rows from both dataframes. Like the rows of an
+        # intermediate dataframe of all candidates, they are labelled by their
+        # positions among the candidates.
+        reverse = order >= len(forward_rows)
+        res = pd.concat(
+            [
+                forward_matches.iloc[forward_rows[order[~reverse]]],
+                backward_matches.iloc[
+                    backward_rows[order[reverse] - len(forward_rows)]
+                ]
+            ]
+        )
+        res = res.iloc[
+            np.argsort(
+                np.concatenate(
+                    [np.flatnonzero(~reverse), np.flatnonzero(reverse)]
+                )
+            )
+        ]
+        res.index = pd.Index(order)
+        return res
         # Compute distances at a gene level.
         # best_matches["dist"] = \
         #     best_matches["nident"] / \
@@ -1,9 +1,14 @@
+import hashlib
 import itertools
+import json
+import os
+import tempfile
+
 import pandas as pd
 
 from pathlib import Path
 from collections.abc import Iterable
-from typing import Iterator
+from typing import Iterator, Optional
 
 def read_table(
         path: Path,
@@ -42,18 +47,140 @@ def read_table(
 def write_table(df: pd.DataFrame, path: Path):
     """Save a dataframe to a specified path, guessing format based on extension.
 
+    The table is first written to a temporary file in the same directory and
+    then renamed to the specified path. Since the rename is atomic, a file at
+    the specified path is always a completely written table, even if the
+    process writing it is killed.
+
     Parameters:
         df:   The dataframe to save.
         path: Path to which data will be saved.
     """
-    if path.suffix == ".pkl":
-        df.to_pickle(path)
-    elif path.suffix == ".h5":
-        df.to_hdf(path, key="gene_matches", format="table")
-    else:
+    path = Path(path)
+    if path.suffix not in [".pkl", ".h5"]:
         raise ValueError(
             f"Could not determine file type for extension {path.suffix}."
         )
+    fd, tmp = tempfile.mkstemp(
+        prefix=f".{path.name}.",
+        suffix=".tmp",
+        dir=path.parent
+    )
+    os.close(fd)
+    try:
+        if path.suffix == ".pkl":
+            df.to_pickle(tmp, compression=None)
+        else:
+            df.to_hdf(tmp, key="gene_matches", format="table", mode="w")
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def file_sha256(path: Path, buffer_size: int = 1 << 20) -> str:
+    """Return the hex SHA-256 digest of the file at the given path."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(buffer_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+class TableLedger:
+    """Records which gene matches tables in a directory have been completed.
+
+    Computing the gene matches tables for all pairs of samples can take days,
+    so it is useful to be able to resume an interrupted run without repeating
+    the pairs that were already finished. A TableLedger keeps a record of every
+    completed table in a JSON Lines file in the tables directory. Each entry
+    contains the name of the table file, the number of rows in the table, the
+    size of the file, and the SHA-256 checksum of the file.
+
+    A table is considered verified only when it has an entry in the ledger and
+    the file currently on disk matches the recorded size and checksum. Tables
+    that are missing from the ledger, missing from the disk, or that have been
+    modified since they were recorded must be computed again.
+
+    Entries are appended with a single write to a file opened in append mode,
+    so several processes may record tables in the same ledger at once. If a
+    process is killed while appending, the incomplete line is terminated by
+    the next append and ignored when the ledger is read.
+
+    Attributes:
+        directory: Directory containing the gene matches tables.
+        path:      Path to the ledger file.
+    """
+    name = "completed_tables.jsonl"
+
+    def __init__(self, directory: Path):
+        """Construct a TableLedger for the tables in the given directory.
+
+        Parameters:
+            directory: Directory containing the gene matches tables.
+        """
+        self.directory = Path(directory)
+        self.path = self.directory / type(self).name
+
+    def record(self, table_path: Path, rows: int):
+        """Record a completed table in the ledger.
+
+        Parameters:
+            table_path: Path to the completed table file.
+            rows (int): Number of rows in the table.
+        """
+        table_path = Path(table_path)
+        entry = {
+            "table": table_path.name,
+            "rows": int(rows),
+            "size": table_path.stat().st_size,
+            "sha256": file_sha256(table_path),
+        }
+        line = json.dumps(entry) + "\n"
+        with open(self.path, "a+b") as f:
+            # Terminate any line left incomplete by a killed process.
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+            f.write(line.encode())
+
+    def entries(self) -> dict[str, dict]:
+        """Get the latest ledger entry for each recorded table file name."""
+        res = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    res[entry["table"]] = entry
+        except FileNotFoundError:
+            pass
+        return res
+
+    def verify(
+            self,
+            table_path: Path,
+            entries: Optional[dict[str, dict]] = None
+    ) -> bool:
+        """Check whether a table is complete and unchanged since recorded.
+
+        Parameters:
+            table_path: Path to the table file to check.
+            entries:    Ledger entries, as returned by the entries method.
+
+        Returns:
+            True if the table matches its ledger entry and False otherwise.
+        """
+        table_path = Path(table_path)
+        if entries is None:
+            entries = self.entries()
+        try:
+            entry = entries[table_path.name]
+            return table_path.stat().st_size == entry["size"] and \
+                file_sha256(table_path) == entry["sha256"]
+        except (KeyError, FileNotFoundError):
+            return False
 
 def multi_glob(path: Path, globs: Iterable[str]) -> Iterator[Path]:
     """Return an iterator over multiple glob patterns.
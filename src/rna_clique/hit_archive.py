@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from typing import Callable, Optional
+
+class HitArchive:
+    """Stores the raw BLAST hits for ordered pairs of samples on disk.
+
+    Gene matches tables keep only the best hits for each gene, so changing the
+    top_matches, keep_all, or evalue settings would ordinarily require running
+    all of the BLAST searches again. A HitArchive keeps every hit of every
+    unidirectional search so that the gene matches tables can be rebuilt with
+    different settings without BLAST.
+
+    Hits are stored in a compact columnar format, one uncompressed NumPy .npz
+    file per ordered pair of samples. Only the columns listed in the columns
+    attribute are stored. Sequence IDs are stored as integer gene and isoform
+    IDs, and the sstrand column is stored as a boolean that is True for hits on
+    the plus strand.
+
+    Attributes:
+        directory:      Directory containing the archived hits.
+        path_to_sample: Function mapping transcript paths to sample names.
+    """
+    # Archived columns and their types.
+    columns = {
+        "qgene": np.int32,
+        "qiso": np.int32,
+        "sgene": np.int32,
+        "siso": np.int32,
+        "bitscore": np.float64,
+        "evalue": np.float64,
+        "nident": np.int32,
+        "length": np.int32,
+        "gaps": np.int32,
+    }
+    strands = ["minus", "plus"]
+
+    def __init__(
+            self,
+            directory: Path,
+            path_to_sample: Optional[Callable[[Path], str]] = None
+    ):
+        """Construct a HitArchive stored in the given directory.
+
+        Parameters:
+            directory:      Directory containing the archived hits.
+            path_to_sample: Function mapping transcript paths to sample names.
+        """
+        self.directory = Path(directory)
+        self.path_to_sample = path_to_sample
+
+    def _name(self, transcripts: Path) -> str:
+        if self.path_to_sample is None:
+            return Path(transcripts).stem
+        return self.path_to_sample(transcripts)
+
+    def path(self, query: Path, subject: Path) -> Path:
+        """Get the path of the archive for the given ordered pair of samples.
+
+        Parameters:
+            query:   Path to the (top n) transcripts used as queries.
+            subject: Path to the (top n) transcripts used as subjects.
+
+        Returns:
+            The path to the archive file for the ordered pair.
+        """
+        return self.directory / "{}--{}.npz".format(
+            self._name(query),
+            self._name(subject)
+        )
+
+    def __contains__(self, pair: tuple[Path, Path]) -> bool:
+        return self.path(*pair).exists()
+
+    def save(self, query: Path, subject: Path, hits: pd.DataFrame):
+        """Save the hits of a unidirectional search to the archive.
+
+        The hits must already contain the gene and isoform columns produced by
+        parsing the sequence IDs.
+
+        Parameters:
+            query:   Path to the (top n) transcripts used as queries.
+            subject: Path to the (top n) transcripts used as subjects.
+            hits:    The BLAST hits to save.
+        """
+        arrays = {
+            col: hits[col].to_numpy(dtype=dtype)
+            for (col, dtype) in type(self).columns.items()
+        }
+        arrays["plus"] = (hits["sstrand"] == "plus").to_numpy(dtype=bool)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.path(query, subject), "wb") as f:
+            np.savez(f, **arrays)
+
+    def load(self, query: Path, subject: Path) -> pd.DataFrame:
+        """Load the hits of a unidirectional search from the archive.
+
+        Parameters:
+            query:   Path to the (top n) transcripts used as queries.
+            subject: Path to the (top n) transcripts used as subjects.
+
+        Returns:
+            A dataframe containing the archived hits.
+        """
+        with np.load(self.path(query, subject)) as arrays:
+            hits = pd.DataFrame(
+                {col: arrays[col] for col in type(self).columns}
+            )
+            hits["sstrand"] = pd.Categorical.from_codes(
+                arrays["plus"].astype(np.int8),
+                type(self).strands
+            )
+        return hits
@@ -0,0 +1,42 @@
+import numpy as np
+
+from collections.abc import Iterable
+
+def pack_gene_pairs(
+        qgenes: Iterable[int],
+        sgenes: Iterable[int]
+) -> np.ndarray:
+    """Pack pairs of 32-bit gene IDs into single 64-bit integer keys.
+
+    Two pairs have the same key if and only if they have the same query and
+    subject gene IDs.
+
+    Parameters:
+        qgenes: Query gene IDs.
+        sgenes: Subject gene IDs.
+
+    Returns:
+        An array of int64 keys, one for each pair.
+    """
+    qgenes = np.asarray(qgenes, dtype=np.int64)
+    sgenes = np.asarray(sgenes, dtype=np.int64)
+    return (qgenes << 32) | (sgenes & 0xFFFFFFFF)
+
+def sorted_contains(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Test whether each of the given keys is in a sorted array of keys.
+
+    This is equivalent to np.isin(keys, sorted_keys), but it uses binary search
+    in the already sorted array instead of sorting or hashing both arrays.
+
+    Parameters:
+        sorted_keys: Sorted array in which to look for the keys.
+        keys:        Keys to look for.
+
+    Returns:
+        A boolean array that is True where the key is in sorted_keys.
+    """
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    i = np.searchsorted(sorted_keys, keys)
+    np.minimum(i, len(sorted_keys) - 1, out=i)
+    return sorted_keys[i] == keys
@@ -1,5 +1,4 @@
 import re
-import pickle
 import sys
 import copy
 
@@ -14,10 +13,10 @@ from .subset_comparisons import (
     matcher,
     make_subset_comparisons,
 )
-from .build_graph import build_graph
-from .find_homologs import eprint
+from .build_graph import build_compact_graph
+from .compact_graph import save_graph
 from .gene_matches_tables import get_table_files
-from .app import set_except_hook
+from .app import eprint, set_except_hook
 
 def build_parser():
     arg_config = config_module.RNACliqueConfigArgumentManager(
@@ -190,15 +189,16 @@ class SubsetAnalysisCreator:
         self.config.keep_all = self.super_config.keep_all
         self.config.jobs = self.super_config.jobs
         self.config.transcript_id_regex = self.super_config.transcript_id_regex
-        graph = build_graph(
+        self.config.edge_stats = self.super_config.edge_stats
+        graph = build_compact_graph(
             make_subset_comparisons(
                 tqdm(inputs),
                 self.config.tables_dir,
                 self.config.path_to_sample.__contains__
-            )
+            ),
+            edge_stats=self.config.edge_stats
         )
-        with open(self.config.graph, "wb") as f:
-            pickle.dump(graph, f, pickle.HIGHEST_PROTOCOL)        
+        save_graph(graph, self.config.graph)
 
 def main():
     with set_except_hook():
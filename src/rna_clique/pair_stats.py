@@ -0,0 +1,407 @@
+import itertools
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
+from .compact_graph import (
+    CompactGraph,
+    edge_stat_columns,
+    node_keys,
+    read_array_file,
+    write_array_file
+)
+from .restriction import KeyRestrictor
+from .similarity_arrays import SimilarityArrays
+
+# Identifies files of per-component, per-pair statistics.
+pair_stats_magic = b"RCSTATS\0"
+pair_stats_format_version = 1
+
+# Statistics stored for each ideal component and pair of samples.
+pair_stats_columns = ["nident", "length", "gaps"]
+
+# Number of matrix entries summed in memory at once when computing statistics.
+stats_block_size = 1 << 22
+
+def _search(
+        sorted_values: np.ndarray,
+        values: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Find the positions of values in a sorted array and which were found."""
+    if len(sorted_values) == 0:
+        return (
+            np.zeros(len(values), dtype=np.intp),
+            np.zeros(len(values), dtype=bool)
+        )
+    i = np.searchsorted(sorted_values, values)
+    np.minimum(i, len(sorted_values) - 1, out=i)
+    return i, sorted_values[i] == values
+
+def _zeros(shape: tuple[int, ...], dtype) -> np.ndarray:
+    """Get a zero-filled array memory-mapped from an anonymous temporary file."""
+    if not np.prod(shape):
+        return np.zeros(shape, dtype=dtype)
+    with tempfile.TemporaryFile() as f:
+        # The map keeps its own handle on the file.
+        return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
+def _cell_sums(
+        rows: np.ndarray,
+        cols: np.ndarray,
+        weights: dict[str, np.ndarray],
+        shape: tuple[int, int]
+) -> dict[str, np.ndarray]:
+    """Sum weights into int32 matrices by row and column.
+
+    The matrices are memory-mapped from temporary files and filled a block of
+    rows at a time, so only one block is summed in memory.
+    """
+    width = shape[1]
+    cells = rows.astype(np.int64) * width + cols
+    order = np.argsort(cells, kind="stable")
+    cells = cells[order]
+    sums = {c: _zeros(shape, np.int32) for c in weights}
+    block = max(1, stats_block_size // max(width, 1))
+    for start in range(0, shape[0], block):
+        stop = min(start + block, shape[0])
+        lo, hi = np.searchsorted(cells, [start * width, stop * width])
+        for c, w in weights.items():
+            sums[c][start:stop] = np.bincount(
+                cells[lo:hi] - start * width,
+                weights=w[order[lo:hi]],
+                minlength=(stop - start) * width
+            ).reshape(stop - start, width)
+    return sums
+
+def pair_stats_path(path: Path) -> Path:
+    """Get the path of the pair statistics for the graph at path."""
+    path = Path(path)
+    return path.with_name(path.stem + ".pairstats")
+
+class ComponentPairStats:
+    """Alignment statistics for each ideal component and pair of samples.
+
+    Distances are computed from the sums of the nident, length, and gaps
+    columns of the gene matches tables, restricted to genes in ideal
+    components. Every row of a restricted table matches two genes of the same
+    ideal component, so the sums can be split by component. A
+    ComponentPairStats stores the split sums in three matrices with a row for
+    each ideal component and a column for each pair of samples. The
+    similarities for any subset of the ideal components can then be computed
+    by summing the rows for those components, without reading the tables
+    again.
+
+    The matrices are int32, since each entry is a sum over the few rows of one
+    table that match genes of one component. They can be saved to a file and
+    memory-mapped (see save and load). Computed matrices are memory-mapped from
+    temporary files, so they need not fit in memory either.
+
+    Attributes:
+        samples (list): Names of the samples, in order of sample codes.
+        components:     Labels of the ideal components, in order of rows.
+        pairs:          Sample codes of the pair for each column (n, 2).
+        nident:         Number of identical positions.
+        length:         Alignment lengths.
+        gaps:           Number of gaps.
+    """
+    def __init__(
+            self,
+            samples: Sequence[str],
+            components: np.ndarray,
+            pairs: np.ndarray,
+            nident: np.ndarray,
+            length: np.ndarray,
+            gaps: np.ndarray
+    ):
+        """Construct a ComponentPairStats from existing arrays.
+
+        Parameters:
+            samples:    Names of the samples, in order of sample codes.
+            components: Labels of the ideal components, in order of rows.
+            pairs:      Sample codes of the pair for each column.
+            nident:     Number of identical positions.
+            length:     Alignment lengths.
+            gaps:       Number of gaps.
+        """
+        self.samples = list(samples)
+        self.components = components
+        self.pairs = pairs
+        self.nident = nident
+        self.length = length
+        self.gaps = gaps
+
+    @classmethod
+    def from_tables(
+            cls,
+            graph: CompactGraph,
+            tables: Iterable[pd.DataFrame],
+            samples: Optional[int] = None
+    ) -> "ComponentPairStats":
+        """Compute the statistics from the gene matches graph and tables.
+
+        Parameters:
+            graph:         The gene matches graph.
+            tables:        The gene matches tables.
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            The statistics for the ideal components of the graph.
+        """
+        components = graph.ideal_components(samples)
+        nodes = graph.component_nodes(components)
+        # Vertices are sorted by key, so the keys need not be sorted again.
+        keys = node_keys(graph.node_samples[nodes], graph.node_genes[nodes])
+        restrictor = KeyRestrictor(graph.samples, keys, presorted=True)
+        rows = np.searchsorted(components, graph.components[nodes])
+        codes = {s: i for (i, s) in enumerate(graph.samples)}
+        pairs = np.array(
+            list(itertools.combinations(range(len(graph.samples)), 2)),
+            dtype=np.int32
+        ).reshape(-1, 2)
+        # Only the rows of each table that fall in ideal components are kept.
+        cell_rows = [np.empty(0, dtype=np.intp)]
+        cell_cols = [np.empty(0, dtype=np.int64)]
+        values = {c: [np.empty(0)] for c in pair_stats_columns}
+        n = len(graph.samples)
+        for df in tables:
+            if len(df) == 0:
+                continue
+            a, b = sorted(
+                codes[str(df[c].iloc[0])] for c in ["qsample", "ssample"]
+            )
+            # Index of pair (a, b) in the order of itertools.combinations.
+            col = a * n - a * (a + 1) // 2 + (b - a - 1)
+            qi, q_valid = _search(
+                keys,
+                restrictor.encode(df, ["qsample", "qgene"])
+            )
+            _, s_valid = _search(
+                keys,
+                restrictor.encode(df, ["ssample", "sgene"])
+            )
+            valid = q_valid & s_valid
+            cell_rows.append(rows[qi[valid]])
+            cell_cols.append(np.full(np.count_nonzero(valid), col))
+            for c in pair_stats_columns:
+                values[c].append(df[c].to_numpy()[valid])
+        stats = _cell_sums(
+            np.concatenate(cell_rows),
+            np.concatenate(cell_cols),
+            {c: np.concatenate(v) for (c, v) in values.items()},
+            (len(components), len(pairs))
+        )
+        return cls(graph.samples, components, pairs, **stats)
+
+    @classmethod
+    def from_graph(
+            cls,
+            graph: CompactGraph,
+            samples: Optional[int] = None
+    ) -> "ComponentPairStats":
+        """Compute the statistics from the edge statistics of the graph.
+
+        The rows of the restricted tables are the edges inside ideal
+        components, so the statistics are the same as those computed by
+        from_tables, but no table is read. The graph must store edge
+        statistics (see CompactGraph).
+
+        Parameters:
+            graph:         The gene matches graph, with edge statistics.
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            The statistics for the ideal components of the graph.
+        """
+        if graph.edge_stats is None:
+            raise ValueError("The graph has no edge statistics.")
+        components = graph.ideal_components(samples)
+        labels = graph.components[graph.edges[:, 0]]
+        rows, selected = _search(components, labels)
+        edges = graph.edges[selected]
+        a = graph.node_samples[edges[:, 0]].astype(np.int64)
+        b = graph.node_samples[edges[:, 1]].astype(np.int64)
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        n = len(graph.samples)
+        pairs = np.array(
+            list(itertools.combinations(range(n), 2)),
+            dtype=np.int32
+        ).reshape(-1, 2)
+        # Index of each edge's pair in the order of itertools.combinations.
+        cols = a * n - a * (a + 1) // 2 + (b - a - 1)
+        stats = _cell_sums(
+            rows[selected],
+            cols,
+            {
+                c: graph.edge_stats[selected, edge_stat_columns.index(c)]
+                for c in pair_stats_columns
+            },
+            (len(components), len(pairs))
+        )
+        return cls(graph.samples, components, pairs, **stats)
+
+    def save(self, path: Path):
+        """Save the statistics in a memory-mappable file.
+
+        The file has the same layout as the compact gene matches graph format
+        (see compact_graph.write_array_file) but starts with the
+        pair_stats_magic bytes.
+
+        Parameters:
+            path: Path to which to save the statistics.
+        """
+        write_array_file(
+            path,
+            pair_stats_magic,
+            {"version": pair_stats_format_version, "samples": self.samples},
+            {
+                "components": self.components,
+                "pairs": self.pairs,
+            } | {c: getattr(self, c) for c in pair_stats_columns}
+        )
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "ComponentPairStats":
+        """Load statistics saved by the save method.
+
+        Parameters:
+            path:        Path to the saved statistics.
+            mmap (bool): Memory-map the statistics instead of reading them.
+
+        Returns:
+            The loaded statistics.
+        """
+        header, arrays = read_array_file(
+            path,
+            pair_stats_magic,
+            pair_stats_format_version,
+            mmap=mmap
+        )
+        return cls(header["samples"], **arrays)
+
+    def matches(
+            self,
+            graph: CompactGraph,
+            samples: Optional[int] = None
+    ) -> bool:
+        """Return whether these statistics are for the given graph.
+
+        Parameters:
+            graph:         The gene matches graph.
+            samples (int): The number of samples in the analysis.
+        """
+        return self.samples == list(graph.samples) and np.array_equal(
+            self.components,
+            graph.ideal_components(samples)
+        )
+
+    def similarity_arrays(
+            self,
+            components: Optional[Iterable[int]] = None
+    ) -> SimilarityArrays:
+        """Get the similarities computed from a subset of the components.
+
+        Like SimilarityArrays.from_sums, this method raises a ZeroDivisionError
+        if the denominator for some pair of samples is zero, which happens when
+        no component is selected.
+
+        Parameters:
+            components: Labels of the ideal components to use (default: all).
+
+        Returns:
+            The similarities, with samples sorted by name.
+        """
+        if components is None:
+            rows = slice(None)
+        else:
+            components = np.asarray(list(components), dtype=np.int64)
+            rows, found = _search(self.components, components)
+            if not found.all():
+                raise KeyError(
+                    f"Component {components[~found][0]} is not ideal."
+                )
+        sums = {
+            c: getattr(self, c)[rows].sum(axis=0, dtype=np.int64)
+            for c in pair_stats_columns
+        }
+        num = sums["nident"]
+        den = sums["length"] - sums["gaps"]
+        if (den == 0).any():
+            i, j = self.pairs[np.argmax(den == 0)]
+            raise ZeroDivisionError(
+                "Similarity for {} has denominator zero.".format(
+                    {self.samples[i], self.samples[j]}
+                )
+            )
+        return SimilarityArrays(
+            self.sorted_samples,
+            self._pair_matrices(num, 1),
+            self._pair_matrices(den, 1)
+        )
+
+    @property
+    def sorted_samples(self) -> list[str]:
+        """The samples sorted by name, as in ComparisonSimilarityComputer."""
+        return sorted(self.samples)
+
+    def _pair_matrices(self, values: np.ndarray, diagonal) -> np.ndarray:
+        """Arrange values for the pairs (last axis) in symmetric matrices.
+
+        The rows and columns of the matrices are in order of sorted_samples.
+        """
+        order = np.argsort(np.asarray(self.samples, dtype=object))
+        code = np.empty(len(order), dtype=np.intp)
+        code[order] = np.arange(len(order))
+        i = code[self.pairs[:, 0]]
+        j = code[self.pairs[:, 1]]
+        n = len(self.samples)
+        res = np.zeros(values.shape[:-1] + (n, n), dtype=values.dtype)
+        res[..., np.arange(n), np.arange(n)] = diagonal
+        res[..., i, j] = values
+        res[..., j, i] = values
+        return res
+
+    def replicate_dissimilarities(
+            self,
+            weights: np.ndarray,
+            block_size: int = 1 << 14
+    ) -> np.ndarray:
+        """Get dissimilarity matrices for weighted sums of the components.
+
+        Each row of weights gives the weight of each ideal component (in order
+        of the components attribute) in one replicate; for example, a
+        bootstrap replicate weights each component by the number of times it
+        was drawn. The sums for all replicates are computed by one matrix
+        product per block of pairs, so the statistics are read only once.
+
+        Pairs of samples for which a replicate has no aligned positions get a
+        dissimilarity of NaN in that replicate.
+
+        Parameters:
+            weights:          Weights of the components (replicates x
+                              components).
+            block_size (int): Number of pairs to process at once.
+
+        Returns:
+            Dissimilarity matrices (replicates x samples x samples), with
+            samples in order of sorted_samples.
+        """
+        # The sums are integers well below 2**53, so float64 products (which
+        # use BLAS) are exact.
+        weights = np.asarray(weights, dtype=np.float64)
+        num = np.empty((len(weights), len(self.pairs)))
+        den = np.empty((len(weights), len(self.pairs)))
+        for start in range(0, len(self.pairs), block_size):
+            cols = slice(start, start + block_size)
+            num[:, cols] = weights @ self.nident[:, cols].astype(np.float64)
+            den[:, cols] = weights @ (
+                self.length[:, cols].astype(np.float64)
+                - self.gaps[:, cols]
+            )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dis = (den - num) / den
+        return self._pair_matrices(dis, 0.0)
@@ -0,0 +1,316 @@
+import functools
+import itertools
+import multiprocessing
+
+import pandas as pd
+
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+from collections.abc import Iterable, Mapping
+
+from simple_blast import BlastDBCache
+
+from .app import eprint
+from .db_store import BlastDBStore
+from .find_all_pairs import (
+    find_homologs_and_save,
+    make_one_db,
+    make_output_path,
+    split_completed,
+    store_one_db
+)
+from .gene_matches_tables import TableLedger, read_table
+from .hit_archive import HitArchive
+from .select_top_genes_all import select_top_and_save
+from .table_cache import TableCache
+from .scheduling import Result, TaskGraph, run_graph
+
+# Priorities of the stages of phase 1. Earlier stages unblock later ones, so
+# ready tasks of earlier stages are started first.
+select_priority = 2
+db_priority = 1
+pair_priority = 0
+
+def make_db_entries(
+        cache_dir: Optional[Path],
+        store: Optional[BlastDBStore],
+        seq_file_path: Path
+) -> dict[frozenset[Path], str]:
+    """Make the BLAST database for one FASTA file and get its index entry.
+
+    Parameters:
+        cache_dir:     The directory in which to make the database.
+        store:         Store of databases shared between analyses, if any.
+        seq_file_path: The path to the subject sequence FASTA.
+
+    Returns:
+        A BlastDBCache index entry for the database.
+    """
+    if store is None:
+        return make_one_db(cache_dir, seq_file_path)._cache
+    return store_one_db(store, seq_file_path)
+
+def find_homologs_with_dbs(
+        transcripts1: Path,
+        transcripts2: Path,
+        out_path: Path,
+        cache_dir: Optional[Path],
+        db_entries1: Optional[Mapping[frozenset[Path], str]],
+        db_entries2: Optional[Mapping[frozenset[Path], str]],
+        hf_args: Iterable,
+        hf_kwargs: Mapping[str, Any],
+        ledger: TableLedger,
+        table_cache: Optional[TableCache] = None,
+        threads: int = 1
+) -> pd.DataFrame:
+    """Get and save the gene matches table for a pair using the given DBs.
+
+    Parameters:
+        transcripts1: Path to the top n transcripts FASTA for the first sample.
+        transcripts2: Path to the top n transcripts FASTA for the second sample.
+        out_path:     Output file in which to store the gene matches table.
+        cache_dir:    Directory containing the BLAST DBs.
+        db_entries1:  BlastDBCache index entry for the first sample's DB.
+        db_entries2:  BlastDBCache index entry for the second sample's DB.
+        hf_args:      Arguments to pass to HomologFinder constructor.
+        hf_kwargs:    Keyword arguments to pass to HomologFinder constructor.
+        ledger:       Ledger in which to record the completed table.
+        table_cache:  Cache of tables shared between analyses.
+        threads:      Number of threads for each BLAST search.
+
+    Returns:
+        The gene matches table computed for the two sets of transcripts.
+    """
+    cache = None
+    if db_entries1 is not None:
+        cache = BlastDBCache(cache_dir, find_existing=False)
+        cache._cache = dict(db_entries1) | dict(db_entries2)
+    return find_homologs_and_save(
+        transcripts1,
+        transcripts2,
+        out_path,
+        hf_args=hf_args,
+        hf_kwargs={"db_cache": cache, "threads": threads} | dict(hf_kwargs),
+        ledger=ledger,
+        table_cache=table_cache
+    )
+
+def phase1_graph(
+        inputs: Iterable[Path],
+        output_dir: Path,
+        cache_dir: Optional[Path],
+        path_to_sample: Callable[[Path], str],
+        hf_args: Iterable = [],
+        sources: Optional[Mapping[Path, Path]] = None,
+        transcripts: str = "transcripts.fasta",
+        select_args: Iterable = (),
+        hits_dir: Optional[Path] = None,
+        pairs: Optional[Iterable[tuple[Path, Path]]] = None,
+        ledger: Optional[TableLedger] = None,
+        table_cache: Optional[TableCache] = None,
+        db_store: Optional[BlastDBStore] = None
+) -> TaskGraph:
+    """Get a TaskGraph for selecting top genes and computing tables for pairs.
+
+    The graph has a task of each of three kinds for each sample or pair:
+
+    * ("select", path): selects the top genes for a sample and saves them to
+      path (only for inputs given in sources);
+    * ("db", path): makes the BLAST database for a sample's top genes (only
+      when a cache_dir or BlastDBStore is given);
+    * ("pair", path1, path2): runs the BLAST searches for a pair of samples
+      and saves their gene matches table.
+
+    Each database depends on the selection of its sample, and each pair
+    depends on the databases (or, without databases, the selections) of its
+    two samples.
+
+    The parameters are the same as for find_all_pairs_pipelined.
+    """
+    inputs = list(inputs)
+    if sources is None:
+        sources = {}
+    if pairs is None:
+        pairs = list(itertools.combinations(inputs, 2))
+    if ledger is None:
+        ledger = TableLedger(output_dir)
+    hf_kwargs = {}
+    if hits_dir:
+        hf_kwargs["hit_archive"] = HitArchive(hits_dir, path_to_sample)
+    use_dbs = bool(cache_dir) or db_store is not None
+    mop = functools.partial(
+        make_output_path,
+        output_dir,
+        path_to_sample=path_to_sample,
+        extension="h5"
+    )
+    graph = TaskGraph()
+    samples = list(dict.fromkeys(itertools.chain.from_iterable(pairs)))
+    for path, source in sources.items():
+        graph.add(
+            ("select", path),
+            select_top_and_save,
+            Path(path).parent,
+            transcripts,
+            source,
+            *select_args,
+            priority=select_priority,
+            cost=(Path(source) / transcripts).stat().st_size,
+            # Protect the database from pruning before it is made.
+            callback=(
+                None if db_store is None
+                else lambda res: db_store.acquire([res[0]])
+            )
+        )
+    if db_store is not None:
+        db_store.acquire(p for p in samples if p not in sources)
+    for path in samples:
+        if use_dbs:
+            graph.add(
+                ("db", path),
+                make_db_entries,
+                cache_dir,
+                db_store,
+                path,
+                deps=[("select", path)] if path in sources else [],
+                priority=db_priority,
+                cost=functools.partial(lambda p: Path(p).stat().st_size, path)
+            )
+    for p1, p2 in pairs:
+        if use_dbs:
+            deps = [("db", p1), ("db", p2)]
+        else:
+            deps = [("select", p) for p in (p1, p2) if p in sources]
+        graph.add(
+            ("pair", p1, p2),
+            find_homologs_with_dbs,
+            p1,
+            p2,
+            mop(p1, p2),
+            cache_dir,
+            Result(("db", p1)) if use_dbs else None,
+            Result(("db", p2)) if use_dbs else None,
+            hf_args,
+            hf_kwargs,
+            ledger,
+            deps=deps,
+            priority=pair_priority,
+            cost=functools.partial(
+                lambda a, b: Path(a).stat().st_size * Path(b).stat().st_size,
+                p1,
+                p2
+            ),
+            threaded=True,
+            table_cache=table_cache
+        )
+    return graph
+
+def find_all_pairs_pipelined(
+        inputs: Iterable[Path],
+        output_dir: Path,
+        cache_dir: Optional[Path],
+        path_to_sample: Callable[[Path], str],
+        hf_args: Iterable = [],
+        jobs: int = multiprocessing.cpu_count() - 1,
+        sources: Optional[Mapping[Path, Path]] = None,
+        transcripts: str = "transcripts.fasta",
+        select_args: Iterable = (),
+        hits_dir: Optional[Path] = None,
+        pairs: Optional[Iterable[tuple[Path, Path]]] = None,
+        resume: bool = False,
+        cores: Optional[int] = None,
+        table_cache: Optional[TableCache] = None,
+        db_store: Optional[BlastDBStore] = None
+) -> tuple[Iterator[pd.DataFrame], Iterator[Path], int]:
+    """Select top genes and obtain gene matches tables without stage barriers.
+
+    This function computes the same tables as selecting the top genes of every
+    sample and then calling find_all_pairs, but it does not wait for each
+    stage to finish for all samples before starting the next. Instead, the
+    selection of top genes, the making of BLAST DBs, and the searches for
+    pairs of samples form a TaskGraph (see phase1_graph) that is run by
+    run_graph on a single pool of workers. The DB for a sample is made as
+    soon as its top genes are selected, and the searches for a pair start as
+    soon as the DBs of both samples are ready, so a slow selection or DB delays
+    only the pairs that involve its sample. Gene matches tables are yielded as
+    they are completed, so the consumer of the returned iterator (typically
+    build_graph) ingests them while the remaining pairs are still running.
+
+    Ready tasks of earlier stages are started first. Among ready pairs, pairs
+    are started in decreasing order of the product of the sizes of their top
+    genes files, which approximates the search space used by PairScheduler.
+    Cores are split between the jobs by a CoreBudget as in find_all_pairs.
+
+    The inputs given in sources are the top genes files that have yet to be
+    selected. sources maps each such path to the input directory from which
+    its top genes are selected; the path must be the one used by
+    select_top_and_save (see select_top_genes_all.top_genes_path). The other
+    inputs must already exist.
+
+    When resume is True, pairs whose tables were completed and verified are not
+    computed again, as in find_all_pairs. When a TableCache is given, it is
+    checked by each pair before running BLAST. Pooled searches and schedule
+    recalibration need the top genes of every sample before any pair starts,
+    so they are not supported here; use find_all_pairs for them.
+
+    Parameters:
+        inputs:            Paths to sample transcripts (of top n genes).
+        output_dir:        Output directory for storing gene matches tables.
+        cache_dir:         Intermediate BLAST DB cache directory
+        path_to_sample:    Function mapping paths to sample names.
+        hf_args:           Arguments to pass to HomologFinder.
+        jobs (int):        Number of parallel jobs to use.
+        sources (dict):    Input directories for inputs yet to be selected.
+        transcripts (str): Name of transcript FASTA files within input dirs.
+        select_args:       Arguments to pass to TopGeneSelector.from_path.
+        hits_dir:          Directory in which to archive raw BLAST hits.
+        pairs:             Pairs of inputs for which to compute tables.
+        resume (bool):     Skip pairs whose tables were completed and verified.
+        cores (int):       Number of cores to split between jobs and threads.
+        table_cache:       Cache of tables shared between analyses.
+        db_store:          Store of BLAST DBs shared between analyses.
+
+    Returns:
+        Gene matches tables, paths to tables, number of tables
+    """
+    inputs = list(inputs)
+    if pairs is None:
+        pairs = list(itertools.combinations(inputs, 2))
+    else:
+        pairs = list(pairs)
+    mop = functools.partial(
+        make_output_path,
+        output_dir,
+        path_to_sample=path_to_sample,
+        extension="h5"
+    )
+    ledger = TableLedger(output_dir)
+    done = []
+    pending = pairs
+    if resume:
+        done, pending = split_completed(pairs, mop, ledger)
+    graph = phase1_graph(
+        inputs,
+        output_dir,
+        cache_dir,
+        path_to_sample,
+        hf_args=hf_args,
+        sources=sources,
+        transcripts=transcripts,
+        select_args=select_args,
+        hits_dir=hits_dir,
+        pairs=pending,
+        ledger=ledger,
+        table_cache=table_cache,
+        db_store=db_store
+    )
+    eprint("Running phase 1 pipeline.")
+    results = run_graph(graph, jobs, cores=jobs if cores is None else cores)
+    return (
+        itertools.chain(
+            (res for (key, res) in results if key[0] == "pair"),
+            map(read_table, done)
+        ),
+        map(lambda x: mop(*x), pairs),
+        len(pairs)
+    )
@@ -1,5 +1,3 @@
-import pickle
-
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -8,7 +6,7 @@ from pathlib import Path
 from typing import Optional
 
 from . import config as config_module
-from .graph import component_subgraphs
+from .compact_graph import load_component_summary, load_graph
 from .gene_matches_tables import read_table, get_table_files
 from .app import set_except_hook, eprint
 
@@ -161,12 +159,14 @@ def main():
                    "Please provide a config file with the path_to_sample "
                    "attribute set, or provide the tables_dir setting.\n")
             raise
-        with open(config.graph, "rb") as f:
-            graph = pickle.load(f)
-        components = list(component_subgraphs(graph))
+        # The summary saved with the graph avoids loading the graph at all.
+        component_stats = load_component_summary(config.graph)
+        if component_stats is None:
+            component_stats = load_graph(config.graph).component_stats
         # embed()
-        component_sizes = [len(c) for c in components]
-        sample_counts = [len(set(t[0] for t in c)) for c in components]
+        component_sizes = component_stats["nodes"].tolist()
+        sample_counts = component_stats["samples"].tolist()
+        edge_counts = component_stats["edges"].tolist()
         if args.size_plot:
             eprint("Making size plot.")
             # cs_counter = Counter(component_sizes)
@@ -198,9 +198,9 @@ def main():
         plt.clf()
         if args.density_plot:
             density = [
-                2*len(c.edges)/(l*(l-1))
-                for (c, l) in zip(components, component_sizes)
-            ]        
+                2*e/(l*(l-1))
+                for (e, l) in zip(edge_counts, component_sizes)
+            ]
             eprint("Making density plot.")
             sns.set_style("whitegrid")
             kde = sns.kdeplot(np.array(sorted(density)))
@@ -217,16 +217,15 @@ def main():
         if args.statistics:
             eprint("Computing statistics.")
             ideal = sum(
-                1 for (c, s, g) in zip(
-                    components,
+                1 for (e, s, g) in zip(
+                    edge_counts,
                     component_sizes,
                     sample_counts
                 )
-                if len(c) == samples and g == samples and
-                2*len(c.edges) == s*(s-1)
+                if s == samples and g == samples and 2*e == s*(s-1)
             )
-            gt_samples = sum(1 for c in components if len(c) >= samples)
-            stats = [samples, len(components), gt_samples, ideal]
+            gt_samples = sum(1 for s in component_sizes if s >= samples)
+            stats = [samples, len(component_sizes), gt_samples, ideal]
             if args.statistics == "h":
                 for label, stat in zip(stat_labels, stats):
                     print(label + ":", stat)
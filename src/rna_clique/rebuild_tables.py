@@ -0,0 +1,242 @@
+import itertools
+import math
+import multiprocessing
+import sys
+
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from joblib import Parallel, delayed
+from more_itertools import consume
+from tqdm import tqdm
+
+from . import app
+from . import config as config_module
+from .app import eprint, set_except_hook
+from .find_all_pairs import label_table, make_output_path
+from .find_homologs import HomologFinder
+from .gene_matches_tables import TableLedger, write_table
+from .hit_archive import HitArchive
+from .path_to_sample import (
+    PathToSampleError,
+    dict_path_to_sample,
+    path_to_sample as default_path_to_sample
+)
+from .transcripts import TranscriptID, TranscriptIDParseError
+
+# Settings that may be changed for each variant and how to parse them.
+variant_settings = {
+    "top_matches": int,
+    "evalue": float,
+    "keep_all": lambda x: x.lower() in ["true", "yes", "1"],
+}
+
+def build_parser():
+    arg_config = config_module.RNACliqueConfigArgumentManager(
+        description=(
+            "Rebuild gene matches tables from archived BLAST hits."
+        )
+    )
+    arg_config.expose_fields_with_default_aliases(
+        "hits_dir",
+        "transcript_id_regex",
+        "top_matches",
+        "evalue",
+        "keep_all",
+        "jobs",
+        required=True
+    )
+    arg_config.expose_fields_with_default_aliases(
+        "tables_dir",
+        "top_genes_dir",
+        "output_dir",
+    )
+    arg_config.add_argument(
+        "--variant",
+        "-V",
+        nargs="+",
+        action="append",
+        metavar=("OUT_DIR", "SETTING=VALUE"),
+        help=(
+            "directory in which to write tables followed by settings that "
+            "differ from the configuration ({})".format(
+                ", ".join(variant_settings)
+            )
+        )
+    )
+    return arg_config
+
+def parse_variant(
+        variant: list[str],
+        defaults: dict[str, Any]
+) -> tuple[Path, dict[str, Any]]:
+    """Parse an output directory and settings given on the command line.
+
+    Parameters:
+        variant (list):  Output directory followed by SETTING=VALUE strings.
+        defaults (dict): Default values for the settings.
+
+    Returns:
+        The output directory and a dict of settings.
+    """
+    out_dir, *assignments = variant
+    settings = dict(defaults)
+    for assignment in assignments:
+        name, sep, value = assignment.partition("=")
+        if not sep or name not in variant_settings:
+            raise ValueError(f"Invalid variant setting {assignment}.")
+        settings[name] = variant_settings[name](value)
+    return Path(out_dir), settings
+
+def rebuild_pair(
+        transcripts1: Path,
+        transcripts2: Path,
+        archive: HitArchive,
+        variants: list[tuple[Path, HomologFinder]],
+        path_to_sample: Callable[[Path], str]
+) -> list[Path]:
+    """Rebuild the gene matches tables for one pair of samples.
+
+    The archived hits for the pair are loaded once and used for every variant.
+    Each table is recorded in the TableLedger of its output directory.
+
+    Parameters:
+        transcripts1:   Path to the top n transcripts for the first sample.
+        transcripts2:   Path to the top n transcripts for the second sample.
+        archive:        The archive containing the hits for the pair.
+        variants:       Output directories and corresponding HomologFinders.
+        path_to_sample: Function mapping paths to sample names.
+
+    Returns:
+        The paths to which the tables were written, one per variant.
+    """
+    forward_hits = archive.load(transcripts1, transcripts2)
+    backward_hits = archive.load(transcripts2, transcripts1)
+    out_paths = []
+    for out_dir, finder in variants:
+        table = finder.get_match_table_from_gene_hits(
+            forward_hits,
+            backward_hits
+        )
+        label_table(table, transcripts1, transcripts2)
+        out_path = make_output_path(
+            out_dir,
+            transcripts1,
+            transcripts2,
+            path_to_sample=path_to_sample,
+            extension="h5"
+        )
+        write_table(table, out_path)
+        TableLedger(out_dir).record(out_path, len(table))
+        out_paths.append(out_path)
+    return out_paths
+
+def rebuild_tables(
+        inputs: Iterable[Path],
+        hits_dir: Path,
+        variants: Iterable[tuple[Path, dict[str, Any]]],
+        path_to_sample: Callable[[Path], str],
+        parse_transcript_id: Callable[[str], TranscriptID],
+        jobs: int = multiprocessing.cpu_count() - 1
+) -> tuple[Iterator[list[Path]], int]:
+    """Rebuild gene matches tables for all pairs from archived BLAST hits.
+
+    This function rebuilds the gene matches tables for any number of
+    combinations of the top_matches, evalue, and keep_all settings without
+    running BLAST. The hits must have been archived in hits_dir when the
+    tables were originally computed (see find_all_pairs). Each variant is
+    described by an output directory and a dict that may contain values for
+    top_matches, evalue, and keep_all. Since the archive only contains hits
+    that passed the original e-value cutoff, a variant's evalue can only be
+    stricter than the original.
+
+    The hits for each pair are read only once, no matter how many variants are
+    requested. Like find_all_pairs, this function returns a lazy iterator; it
+    yields the output paths for each pair as the pair is completed.
+
+    Parameters:
+        inputs:              Paths to sample transcripts (of top n genes).
+        hits_dir:            Directory containing the archived hits.
+        variants:            Output directories and settings for each variant.
+        path_to_sample:      Function mapping paths to sample names.
+        parse_transcript_id: Function to parse FASTA IDs into TranscriptIDs.
+        jobs (int):          Number of parallel jobs to use.
+
+    Returns:
+        An iterator over lists of output paths, and the number of pairs.
+    """
+    inputs = list(inputs)
+    archive = HitArchive(hits_dir, path_to_sample)
+    finders = []
+    for out_dir, settings in variants:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        finders.append(
+            (
+                out_dir,
+                HomologFinder(
+                    parse_transcript_id,
+                    settings["top_matches"],
+                    settings["evalue"],
+                    settings["keep_all"]
+                )
+            )
+        )
+    return Parallel(n_jobs=jobs, return_as="generator_unordered")(
+        delayed(rebuild_pair)(p1, p2, archive, finders, path_to_sample)
+        for (p1, p2) in itertools.combinations(inputs, 2)
+    ), math.comb(len(inputs), 2)
+
+def main():
+    with set_except_hook():
+        parser = build_parser()
+        _, args, config = parser.get_arguments_and_config()
+    with set_except_hook(config.verbose):
+        if config.path_to_sample:
+            inputs = list(config.path_to_sample)
+            pts = dict_path_to_sample(config.path_to_sample)
+        elif config.top_genes_dir:
+            inputs = list(config.top_genes_dir.glob("*.fasta"))
+            pts = default_path_to_sample
+        else:
+            eprint(
+                "Must provide path_to_sample or top_genes_dir. Cannot "
+                "continue."
+            )
+            sys.exit(1)
+        defaults = {
+            "top_matches": config.top_matches,
+            "evalue": config.evalue,
+            "keep_all": config.keep_all,
+        }
+        try:
+            variants = [
+                parse_variant(v, defaults) for v in (args.variant or [])
+            ]
+        except ValueError as e:
+            parser.parser.error(str(e))
+        if not variants:
+            if not config.tables_dir:
+                eprint("Must provide tables_dir or a variant. Cannot continue.")
+                sys.exit(1)
+            variants = [(config.tables_dir, defaults)]
+        try:
+            gen, gen_len = rebuild_tables(
+                inputs,
+                config.hits_dir,
+                variants,
+                pts,
+                TranscriptID.parser_from_re(config.transcript_id_regex),
+                jobs=config.jobs
+            )
+            consume(tqdm(gen, total=gen_len))
+        except TranscriptIDParseError:
+            app.print_transcript_id_parse_error_message(
+                config.transcript_id_regex
+            )
+            raise
+        except PathToSampleError as e:
+            eprint(f"RNA-clique could not get the sample name for {e.path}.")
+            raise e
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
+from .compact_graph import CompactGraph, node_keys, sorted_unique
+from .keys import sorted_contains
+
+class KeyRestrictor:
+    """Restricts gene matches tables to a set of valid (sample, gene) pairs.
+
+    restrict_multi merges each table with a dataframe of valid pairs once for
+    every list of columns, which is slow for large tables. A KeyRestrictor
+    instead encodes the valid pairs once as sorted 64-bit keys packing a sample
+    code and a gene ID (see compact_graph.node_keys). Each table is restricted
+    by encoding its sample and gene columns in the same way and testing the
+    keys for membership by binary search.
+
+    The result is the same as that of restrict_multi: the rows of the table in
+    which every (sample, gene) pair given by the lists of columns is valid.
+
+    Attributes:
+        samples (list): Names of the samples, in order of sample codes.
+        keys:           Sorted keys of the valid (sample, gene) pairs.
+    """
+    def __init__(
+            self,
+            samples: Sequence[str],
+            keys: np.ndarray,
+            presorted: bool = False
+    ):
+        """Construct a KeyRestrictor from sample names and valid keys.
+
+        If presorted is True, the keys must already be sorted and distinct,
+        and they are used without being copied.
+
+        Parameters:
+            samples:          Names of the samples, in order of sample codes.
+            keys:             Keys of the valid (sample, gene) pairs.
+            presorted (bool): Whether the keys are already sorted and distinct.
+        """
+        self.samples = list(samples)
+        if presorted:
+            self.keys = keys
+        else:
+            self.keys = sorted_unique(np.asarray(keys, dtype=np.int64))
+        self._codes = {s: i for (i, s) in enumerate(self.samples)}
+
+    @classmethod
+    def from_graph(
+            cls,
+            graph: CompactGraph,
+            samples: Optional[int] = None
+    ) -> "KeyRestrictor":
+        """Get a KeyRestrictor for the genes in a graph's ideal components.
+
+        Parameters:
+            graph:         The gene matches graph.
+            samples (int): The number of samples in the analysis.
+
+        Returns:
+            A KeyRestrictor whose valid pairs are the ideal components' genes.
+        """
+        nodes = graph.component_nodes(graph.ideal_components(samples))
+        return cls(
+            graph.samples,
+            node_keys(graph.node_samples[nodes], graph.node_genes[nodes])
+        )
+
+    def encode(self, df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+        """Get the keys of the (sample, gene) pairs in the given columns.
+
+        Samples that are not known to the KeyRestrictor are given code -1, so
+        their keys are never valid.
+
+        Parameters:
+            df:      The dataframe containing the columns.
+            columns: Names of the sample and gene columns.
+
+        Returns:
+            The key of each row's (sample, gene) pair.
+        """
+        sample_col, gene_col = columns
+        codes, uniques = pd.factorize(df[sample_col])
+        mapping = np.array(
+            [self._codes.get(str(s), -1) for s in uniques] + [-1],
+            dtype=np.int64
+        )
+        return node_keys(
+            mapping[codes],
+            df[gene_col].to_numpy(dtype=np.int64)
+        )
+
+    def restrict(
+            self,
+            df: pd.DataFrame,
+            columns: Iterable[Sequence[str]]
+    ) -> pd.DataFrame:
+        """Restrict a dataframe to rows whose (sample, gene) pairs are valid.
+
+        Parameters:
+            df:      The dataframe to restrict.
+            columns: The lists of sample and gene columns to check.
+
+        Returns:
+            df, without rows where some (sample, gene) pair is not valid.
+        """
+        mask = np.ones(len(df), dtype=bool)
+        for cols in columns:
+            mask &= sorted_contains(self.keys, self.encode(df, cols))
+        return df[mask]
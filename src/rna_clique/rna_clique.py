@@ -2,7 +2,7 @@ import multiprocessing
 import sys
 
 from pathlib import Path
-from typing import Callable, Iterable, Optional
+from typing import Callable, Iterable, Mapping, Optional
 
 from multiset_key_dict import MultisetKeyDict
 
@@ -16,6 +16,8 @@ from .transcripts import (
 )
 from .filtered_distance import SampleSimilarity, NoIdealComponentsError
 from .similarity_computer import ComparisonSimilarityComputer
+from .db_store import BlastDBStore
+from .table_cache import TableCache
 from .app import eprint, validate_input_dirs, set_except_hook
 
 def build_parser():
@@ -43,6 +45,14 @@ def rna_clique(
         keep_all: bool = True,
         store_dfs: bool = False,
         jobs: int = multiprocessing.cpu_count() - 1,
+        pooled: bool = False,
+        hits_dir: Optional[Path] = None,
+        existing: Optional[Mapping[Path, str]] = None,
+        resume: bool = False,
+        recalibrate: bool = False,
+        table_cache: Optional[TableCache] = None,
+        db_store: Optional[BlastDBStore] = None,
+        edge_stats: bool = False,
 ) -> tuple[SampleSimilarity, dict[Path, str]]:
     """Perform a full RNA-clique analysis using the provided transcriptomes.
 
@@ -113,12 +123,23 @@ def rna_clique(
     opting to use iterators to reduce the memory footprint. If tables are needed
     immediately after running this method, the store_dfs option can be set to
     True to keep the gene matches table dataframes in the SampleSimilarity
-    object.
+    object. When the tables are not stored, the filtered similarities are
+    computed from the table files by parallel worker processes (see
+    SampleSimilarity). If edge_stats is True, the alignment statistics of
+    each edge are stored in the gene matches graph as the tables are added to
+    it, and the similarities are computed from the edges inside ideal
+    components, so the tables are read only once.
 
     See the original RNA-clique publication, "RNA-clique: a method for computing
     genetic distances from RNA-seq data" for more details on RNA-clique's
     workings.
 
+    Samples can be added to an existing analysis by providing the existing
+    analysis's path-to-sample mapping as the existing parameter; see the
+    documentation for filtering_step.filtering_step for details. An
+    interrupted analysis can be resumed without recomputing the gene matches
+    tables that were already completed by setting resume to True.
+
     When a non-None value is provided for output_matrix, this function eagerly
     computes the distance matrix and saves it to the provided Path. If there are
     no ideal components in the gene matches graph, computing distances is not
@@ -147,6 +168,14 @@ def rna_clique(
         keep_all (bool):   Keep all gene pairs in the case of ties by bitscore.
         store_dfs (bool):  Store gene matches tables in SampleSimilarity object.
         jobs (int):        Number of parallel jobs to use.
+        pooled (bool):     Search each sample's DB once with pooled queries.
+        hits_dir:          Directory in which to archive raw BLAST hits.
+        existing (dict):   Path-to-sample mapping of an existing analysis.
+        resume (bool):     Skip pairs whose tables were completed and verified.
+        recalibrate:       Refit pair cost estimates to observed durations.
+        table_cache:       Cache of tables shared between analyses.
+        db_store:          Store of BLAST DBs shared between analyses.
+        edge_stats:        Compute distances from statistics stored in graph.
 
     Returns:
         SampleSimilarity with distances and graph and Path-to-sample mapping.
@@ -164,6 +193,14 @@ def rna_clique(
         evalue,
         keep_all,
         jobs,
+        pooled,
+        hits_dir,
+        existing,
+        resume,
+        recalibrate,
+        table_cache,
+        db_store,
+        edge_stats,
     )
     tables = ComparisonSimilarityComputer.mapping_from_dfs(tables)
     if store_dfs:
@@ -171,6 +208,9 @@ def rna_clique(
     sim = SampleSimilarity(
         graph,
         tables,
+        # Stored tables are already in memory, so they are not read again.
+        table_paths=None if store_dfs else table_paths,
+        jobs=jobs
     )
     if output_matrix is not None:
         mat = sim.get_dissimilarity_df()
@@ -199,7 +239,18 @@ def main():
                 config.evalue,
                 config.keep_all,
                 False,
-                jobs=config.jobs
+                jobs=config.jobs,
+                pooled=config.pooled_blast,
+                hits_dir=config.hits_dir,
+                existing=filtering_step.incremental_path_to_sample(
+                    args,
+                    config
+                ),
+                resume=args.resume,
+                recalibrate=config.recalibrate_schedule,
+                table_cache=TableCache.from_config(config),
+                db_store=BlastDBStore.from_config(config),
+                edge_stats=config.edge_stats
             )
             config.path_to_sample = pts    
             mat = sim.get_dissimilarity_df()
@@ -0,0 +1,656 @@
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+import numpy as np
+
+from pathlib import Path
+from collections.abc import Iterable, Mapping
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+# joblib's Parallel reuses this executor, so it must be joblib's kind.
+from joblib.executor import get_memmapping_executor
+
+from .fasta import raw_records
+
+def fasta_stats(path: Path) -> tuple[int, int]:
+    """Count the bases and sequences in a FASTA file.
+
+    Parameters:
+        path: Path to the FASTA file.
+
+    Returns:
+        The total number of sequence characters and the number of sequences.
+    """
+    bases = 0
+    seqs = 0
+    with open(path, "rb") as f:
+        for _, raw in raw_records(f):
+            header_end = raw.find(b"\n")
+            if header_end < 0:
+                header_end = len(raw)
+            bases += len(raw) - header_end - raw.count(b"\n", header_end)
+            seqs += 1
+    return bases, seqs
+
+def timed(f: Callable, *args, **kwargs) -> tuple[Any, float]:
+    """Call a function and return its result with the time it took."""
+    start = time.perf_counter()
+    res = f(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+class PairScheduler:
+    """Orders pairs of samples so that the most expensive pairs start first.
+
+    The time needed to compute a gene matches table varies greatly between
+    pairs of samples, mostly with the number of bases in the top genes of each
+    sample. When pairs are submitted to a pool of workers in an arbitrary
+    order, the largest pairs may end up being started last, leaving a single
+    worker busy long after the others have become idle. Starting the largest
+    pairs first (the "longest processing time first" rule) avoids most of this
+    tail.
+
+    The cost of a pair is estimated by a linear model whose features are the
+    product of the numbers of bases in the two samples (the BLAST search
+    space), the sum of their numbers of bases, the sum of their numbers of
+    sequences, and a constant. Initially, only the search space is weighted.
+    When recalibrate is True, the weights are refit by least squares to the
+    durations of the completed pairs each time a duration is observed, and the
+    remaining pairs are ordered by the refit model.
+
+    Pairs are taken from the scheduler one at a time with the pop method (or by
+    iterating over it). When pairs are taken as workers become available, as
+    run_scheduled does, pairs taken later in a run are ordered using the
+    durations observed earlier in the run. The scheduler may be used from
+    different threads.
+
+    Attributes:
+        pairs (list):       The pairs to schedule.
+        recalibrate (bool): Whether to refit the model to observed durations.
+        weights:            Current weights of the cost model.
+    """
+    default_weights = np.array([1.0, 0.0, 0.0, 0.0])
+
+    def __init__(
+            self,
+            pairs: Iterable[tuple[Hashable, Hashable]],
+            stats: Mapping[Hashable, tuple[int, int]],
+            recalibrate: bool = False
+    ):
+        """Construct a PairScheduler for given pairs and per-sample stats.
+
+        Parameters:
+            pairs:              The pairs to schedule.
+            stats:              Numbers of bases and sequences for each sample.
+            recalibrate (bool): Whether to refit the model to observed times.
+        """
+        self.pairs = list(pairs)
+        self.recalibrate = recalibrate
+        self._index = {p: i for (i, p) in enumerate(self.pairs)}
+        features = np.empty((len(self.pairs), 4))
+        for i, (p1, p2) in enumerate(self.pairs):
+            (b1, s1), (b2, s2) = stats[p1], stats[p2]
+            features[i] = [b1 * b2, b1 + b2, s1 + s2, 1]
+        # Scale columns to make the least squares problem well conditioned.
+        self._scale = np.maximum(np.abs(features).max(axis=0, initial=0), 1)
+        self._features = features / self._scale
+        self._pending = np.ones(len(self.pairs), dtype=bool)
+        self._observed = []
+        self._durations = []
+        self._lock = threading.Lock()
+        self.weights = type(self).default_weights.copy()
+        self._costs = self._features @ (self.weights * self._scale)
+
+    @classmethod
+    def from_paths(
+            cls,
+            pairs: Iterable[tuple[Path, Path]],
+            *args,
+            **kwargs
+    ) -> "PairScheduler":
+        """Get a PairScheduler for pairs of FASTA files, reading their stats."""
+        pairs = list(pairs)
+        stats = {
+            p: fasta_stats(p) for p in dict.fromkeys(
+                x for pair in pairs for x in pair
+            )
+        }
+        return cls(pairs, stats, *args, **kwargs)
+
+    def cost(self, pair: tuple[Hashable, Hashable]) -> float:
+        """Get the current estimated cost of a pair."""
+        return self._costs[self._index[pair]]
+
+    def pop(self) -> Optional[tuple[Hashable, Hashable]]:
+        """Take the pending pair with the highest estimated cost, if any."""
+        with self._lock:
+            if not self._pending.any():
+                return None
+            i = np.argmax(np.where(self._pending, self._costs, -np.inf))
+            self._pending[i] = False
+            return self.pairs[i]
+
+    def __iter__(self) -> Iterator[tuple[Hashable, Hashable]]:
+        while (pair := self.pop()) is not None:
+            yield pair
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def pending(self) -> int:
+        """Get the number of pairs that have not yet been taken."""
+        with self._lock:
+            return int(self._pending.sum())
+
+    def observe(self, pair: tuple[Hashable, Hashable], seconds: float):
+        """Record the time taken for a pair, refitting the model if enabled.
+
+        Parameters:
+            pair:            The completed pair.
+            seconds (float): The time taken to compute the pair.
+        """
+        with self._lock:
+            self._observed.append(self._index[pair])
+            self._durations.append(seconds)
+            if self.recalibrate and \
+               len(self._observed) >= self._features.shape[1]:
+                self._fit()
+
+    def _fit(self):
+        x = self._features[self._observed]
+        w, *_ = np.linalg.lstsq(x, np.asarray(self._durations), rcond=None)
+        # Negative weights would make larger pairs look cheaper.
+        w = np.maximum(w, 0)
+        if w[:-1].any():
+            self.weights = w / self._scale
+            self._costs = self._features @ w
+
+class QueueScheduler:
+    """Hands out items in decreasing order of fixed estimated costs.
+
+    A QueueScheduler provides the same interface as a PairScheduler for items
+    that are not pairs of samples, such as single samples or isoform sets.
+    Each item is a tuple of arguments for the function run on it. If no costs
+    are given, the items are handed out in the order given.
+
+    Attributes:
+        items (list): The items to schedule, in the order they are handed out.
+    """
+    def __init__(
+            self,
+            items: Iterable[tuple],
+            costs: Optional[Iterable[float]] = None
+    ):
+        """Construct a QueueScheduler for the given items and costs.
+
+        Parameters:
+            items: The items to schedule.
+            costs: Estimated cost of each item.
+        """
+        self.items = list(items)
+        if costs is not None:
+            costs = list(costs)
+            order = sorted(
+                range(len(self.items)),
+                key=costs.__getitem__,
+                reverse=True
+            )
+            self.items = [self.items[i] for i in order]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def pop(self) -> Optional[tuple]:
+        """Take the next item, if any."""
+        with self._lock:
+            if self._next >= len(self.items):
+                return None
+            self._next += 1
+            return self.items[self._next - 1]
+
+    def __iter__(self) -> Iterator[tuple]:
+        while (item := self.pop()) is not None:
+            yield item
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def pending(self) -> int:
+        """Get the number of items that have not yet been taken."""
+        with self._lock:
+            return len(self.items) - self._next
+
+    def observe(self, item: tuple, seconds: float):
+        """Ignore the time taken for an item; costs are fixed."""
+        pass
+
+class CoreBudget:
+    """Splits a budget of cores between concurrent jobs and their threads.
+
+    BLAST can use several threads for a single search, but a pool of
+    single-threaded jobs leaves cores idle whenever there are fewer remaining
+    tasks than workers, which always happens at the end of a run. A CoreBudget
+    decides how many threads each task should use when it is started. While
+    there are at least as many remaining tasks as job slots, the free cores
+    are divided evenly between the slots. When there are fewer remaining tasks
+    than free slots, as when there are fewer pairs than jobs, the free cores
+    are divided between the remaining tasks instead, and every core released
+    by a completed task is given to the next task that starts.
+
+    The number of threads of a running task cannot be changed, so cores
+    released after the last task has started stay idle. Starting the most
+    expensive tasks first (see PairScheduler) keeps this tail short. The
+    budget never hands out more threads than there are cores, except that
+    every task gets at least one thread.
+
+    Attributes:
+        cores (int): Total number of cores to use.
+        jobs (int):  Maximum number of concurrent tasks.
+    """
+    def __init__(self, cores: int, jobs: int):
+        """Construct a CoreBudget for the given numbers of cores and jobs.
+
+        Parameters:
+            cores (int): Total number of cores to use.
+            jobs (int):  Maximum number of concurrent tasks.
+        """
+        self.cores = cores
+        self.jobs = jobs
+        self._free = cores
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, pending: int, limit: Optional[int] = None) -> int:
+        """Get the number of threads for a task that is about to start.
+
+        Parameters:
+            pending (int): Number of tasks not yet started, including this one.
+            limit (int):   Maximum number of threads the task can use.
+
+        Returns:
+            The number of threads the task should use.
+        """
+        with self._lock:
+            slots = max(1, min(self.jobs - self._running, pending))
+            threads = self._free // slots
+            if limit is not None:
+                threads = min(threads, limit)
+            threads = max(1, threads)
+            self._free -= threads
+            self._running += 1
+            return threads
+
+    def release(self, threads: int):
+        """Return the threads of a completed task to the budget."""
+        with self._lock:
+            self._free += threads
+            self._running -= 1
+
+# Number of completed results per job that may wait to be consumed before no
+# more work is started.
+results_per_job = 2
+
+def run_scheduled(
+        scheduler: PairScheduler | QueueScheduler,
+        f: Callable,
+        jobs: int,
+        cores: Optional[int] = None
+) -> Iterator:
+    """Call a function on every scheduled item in parallel.
+
+    The items are submitted to a pool of worker processes in the order given by
+    the scheduler, one at a time as workers become available, and the duration
+    of each call is reported back to the scheduler as soon as the call
+    completes. Like the other parallel functions in this package, the results
+    are yielded in the order in which they complete.
+
+    When cores is given, a CoreBudget splits the cores between the workers,
+    and f is called with a threads keyword argument giving the number of
+    threads the call should use.
+
+    Work begins as soon as this function is called, and items continue to be
+    submitted while the consumer of the returned iterator is busy, as long as
+    no more than results_per_job results per job are waiting to be consumed.
+    If a call raises an exception, or if the returned iterator is closed, no
+    further items are submitted. The exception is raised when the failed call's
+    result is reached.
+
+    Parameters:
+        scheduler:   The scheduler providing the items.
+        f:           Function to call with the elements of each item.
+        jobs (int):  Number of parallel jobs to use.
+        cores (int): Number of cores to split between the jobs' threads.
+
+    Returns:
+        An iterator over the results of the calls.
+    """
+    # Requesting fewer workers would resize the executor shared with joblib,
+    # so the number of concurrent calls is limited by the slots instead.
+    executor = get_memmapping_executor(max(1, jobs))
+    jobs = max(1, min(jobs, len(scheduler)))
+    budget = None if cores is None else CoreBudget(cores, jobs)
+    backlog = results_per_job * jobs
+    # The queue also holds the number of submitted items at the end.
+    results = queue.Queue(backlog + 1)
+    slots = threading.Semaphore(jobs)
+    unconsumed = threading.Semaphore(backlog)
+    failed = threading.Event()
+    stopped = threading.Event()
+
+    def done(future, item, threads):
+        if budget is not None:
+            budget.release(threads)
+        if future.exception() is None:
+            scheduler.observe(item, future.result()[1])
+        else:
+            failed.set()
+        slots.release()
+        results.put(future)
+
+    def dispatch():
+        submitted = 0
+        while True:
+            unconsumed.acquire()
+            slots.acquire()
+            if stopped.is_set():
+                return
+            item = None if failed.is_set() else scheduler.pop()
+            if item is None:
+                results.put(submitted)
+                return
+            kwargs = {}
+            threads = None
+            if budget is not None:
+                threads = budget.acquire(scheduler.pending() + 1)
+                kwargs["threads"] = threads
+            future = executor.submit(timed, f, *item, **kwargs)
+            submitted += 1
+            future.add_done_callback(
+                functools.partial(done, item=item, threads=threads)
+            )
+
+    threading.Thread(target=dispatch, daemon=True).start()
+
+    def collect():
+        received = 0
+        total = None
+        try:
+            while total is None or received < total:
+                res = results.get()
+                if isinstance(res, int):
+                    total = res
+                else:
+                    received += 1
+                    unconsumed.release()
+                    yield res.result()[0]
+        finally:
+            stopped.set()
+            # Wake the dispatcher if it is waiting, so that it can exit.
+            unconsumed.release()
+            slots.release()
+    return collect()
+
+class Result:
+    """Placeholder for the result of another task in a TaskGraph.
+
+    When a task is started, each Result among its arguments is replaced by the
+    result of the task it refers to (or by an item of that result, if an item
+    is given), and the task implicitly depends on that task.
+
+    Attributes:
+        key:  Key of the task whose result is used.
+        item: Index or key of the item of the result to use, if any.
+    """
+    __slots__ = ("key", "item")
+
+    def __init__(self, key: Hashable, item: Optional[Hashable] = None):
+        self.key = key
+        self.item = item
+
+    def resolve(self, results: Mapping[Hashable, Any]) -> Any:
+        """Get the value of the placeholder from the results of tasks."""
+        res = results[self.key]
+        return res if self.item is None else res[self.item]
+
+class TaskGraph:
+    """A set of tasks with dependencies between them, to be run by run_graph.
+
+    Each task is identified by a hashable key and consists of a function, its
+    arguments, the keys of the tasks on which it depends, a priority, and an
+    estimated cost. A task may be started only when all of the tasks on which
+    it depends have completed. Among the tasks that may be started, the task
+    with the highest priority is started first, and tasks with the same
+    priority are started in decreasing order of cost. The cost may be a
+    function, in which
+    case it is called when the task becomes ready, after the tasks on which it
+    depends have completed (when, for example, their output files exist).
+
+    Threaded tasks are called with a threads keyword argument giving the
+    number of threads they should use. A task may also have a callback, which
+    is called in the process running run_graph with the task's result as soon
+    as the task completes, before any task that depends on it is started.
+    """
+    def __init__(self):
+        self.tasks = {}
+
+    def add(
+            self,
+            key: Hashable,
+            f: Callable,
+            *args,
+            deps: Iterable[Hashable] = (),
+            priority: int = 0,
+            cost: float | Callable[[], float] = 0.0,
+            threaded: bool = False,
+            callback: Optional[Callable[[Any], Any]] = None,
+            **kwargs
+    ):
+        """Add a task to the graph.
+
+        Parameters:
+            key:             Key identifying the task.
+            f:               Function to call with the given arguments.
+            deps:            Keys of additional tasks on which the task depends.
+            priority (int):  Priority of the task over tasks of lower priority.
+            cost:            Estimated cost of the task, or a function for it.
+            threaded (bool): Whether to pass a threads keyword argument to f.
+            callback:        Function to call with the result of the task.
+        """
+        if key in self.tasks:
+            raise ValueError(f"Duplicate task {key}.")
+        deps = set(deps) | {
+            a.key for a in itertools.chain(args, kwargs.values())
+            if isinstance(a, Result)
+        }
+        self.tasks[key] = (
+            f,
+            args,
+            kwargs,
+            deps,
+            (priority, cost),
+            threaded,
+            callback
+        )
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.tasks
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def dependents(self) -> dict[Hashable, list[Hashable]]:
+        """Get the keys of the tasks that depend on each task.
+
+        Raises:
+            ValueError: If a task depends on a missing task or on itself
+                        (directly or indirectly).
+        """
+        dependents = {k: [] for k in self.tasks}
+        for key, task in self.tasks.items():
+            for dep in task[3]:
+                if dep not in dependents:
+                    raise ValueError(f"Task {key} depends on missing {dep}.")
+                dependents[dep].append(key)
+        # Kahn's algorithm; any task never reached is part of a cycle.
+        waiting = {k: len(t[3]) for (k, t) in self.tasks.items()}
+        stack = [k for (k, n) in waiting.items() if n == 0]
+        reached = 0
+        while stack:
+            reached += 1
+            for d in dependents[stack.pop()]:
+                waiting[d] -= 1
+                if waiting[d] == 0:
+                    stack.append(d)
+        if reached < len(self.tasks):
+            raise ValueError("Task graph contains a cycle.")
+        return dependents
+
+def run_graph(
+        graph: TaskGraph,
+        jobs: int,
+        cores: Optional[int] = None
+) -> Iterator[tuple[Hashable, Any]]:
+    """Run the tasks of a TaskGraph in parallel as their dependencies finish.
+
+    Unlike a sequence of run_scheduled calls, one per stage of a computation,
+    run_graph has no barriers between stages. Every task is started as soon as
+    the tasks on which it depends have completed and a worker is available,
+    so a single slow task delays only the tasks that depend on it. All tasks
+    share one pool of worker processes.
+
+    When cores is given, a CoreBudget splits the cores between the workers.
+    Threaded tasks are given a share of the cores, and other tasks are counted
+    as using one core each.
+
+    Work begins as soon as this function is called. The keys and results of
+    the tasks are yielded in the order in which the tasks complete. As in
+    run_scheduled, no task is started while results_per_job results per job
+    are waiting to be consumed. The result of a task is kept only until every
+    task that depends on it has been started. If a task raises an exception, or
+    if the returned iterator is closed, no further tasks are started. The
+    exception is raised when the failed task's result is reached.
+
+    Parameters:
+        graph:       The tasks to run.
+        jobs (int):  Number of parallel jobs to use.
+        cores (int): Number of cores to split between the jobs' threads.
+
+    Returns:
+        An iterator over the keys and results of the tasks.
+    """
+    dependents = graph.dependents()
+    total = len(graph)
+    # As in run_scheduled, the executor is shared with joblib.
+    executor = get_memmapping_executor(max(1, jobs))
+    jobs = max(1, min(jobs, total))
+    budget = None if cores is None else CoreBudget(cores, jobs)
+    backlog = results_per_job * jobs
+    results = queue.Queue(backlog)
+    cond = threading.Condition()
+    waiting = {k: len(t[3]) for (k, t) in graph.tasks.items()}
+    # Number of dependents not yet started for each task with dependents.
+    uses = {k: len(d) for (k, d) in dependents.items() if d}
+    outputs = {}
+    ready = []
+    counter = itertools.count()
+    state = {
+        "free": jobs,
+        "started": 0,
+        "unconsumed": 0,
+        "failed": False,
+        "stopped": False
+    }
+
+    def push(key):
+        priority, cost = graph.tasks[key][4]
+        if callable(cost):
+            cost = cost()
+        heapq.heappush(ready, (-priority, -cost, next(counter), key))
+
+    def done(future, key, threads):
+        with cond:
+            if budget is not None:
+                budget.release(threads)
+            if future.exception() is None:
+                try:
+                    callback = graph.tasks[key][6]
+                    if callback is not None:
+                        callback(future.result())
+                    if key in uses:
+                        outputs[key] = future.result()
+                    for d in dependents[key]:
+                        waiting[d] -= 1
+                        if waiting[d] == 0:
+                            push(d)
+                except BaseException as e:
+                    state["failed"] = True
+                    future = concurrent.futures.Future()
+                    future.set_exception(e)
+            else:
+                state["failed"] = True
+            state["free"] += 1
+            cond.notify()
+        results.put((key, future))
+
+    def dispatch():
+        while True:
+            with cond:
+                while not (state["failed"] or state["stopped"]) and \
+                      state["started"] < total and \
+                      not (ready and state["free"] and
+                           state["unconsumed"] < backlog):
+                    cond.wait()
+                if state["failed"] or state["stopped"] or \
+                   state["started"] == total:
+                    return
+                key = heapq.heappop(ready)[-1]
+                f, args, kwargs, deps, _, threaded, _ = graph.tasks[key]
+                args = [
+                    a.resolve(outputs) if isinstance(a, Result) else a
+                    for a in args
+                ]
+                kwargs = {
+                    k: v.resolve(outputs) if isinstance(v, Result) else v
+                    for (k, v) in kwargs.items()
+                }
+                for dep in deps:
+                    uses[dep] -= 1
+                    if uses[dep] == 0:
+                        del outputs[dep]
+                threads = None
+                if budget is not None:
+                    threads = budget.acquire(
+                        total - state["started"],
+                        None if threaded else 1
+                    )
+                    if threaded:
+                        kwargs["threads"] = threads
+                state["free"] -= 1
+                state["started"] += 1
+                state["unconsumed"] += 1
+            future = executor.submit(f, *args, **kwargs)
+            future.add_done_callback(
+                functools.partial(done, key=key, threads=threads)
+            )
+
+    for key, n in waiting.items():
+        if n == 0:
+            push(key)
+    threading.Thread(target=dispatch, daemon=True).start()
+
+    def collect():
+        try:
+            for _ in range(total):
+                key, future = results.get()
+                with cond:
+                    state["unconsumed"] -= 1
+                    cond.notify()
+                yield key, future.result()
+        finally:
+            with cond:
+                state["stopped"] = True
+                cond.notify()
+    return collect()
@@ -20,6 +20,7 @@ from .filtered_distance import (
     get_ideal_components,
 )
 from .export_orthologs import build_strand_graph, get_sample_gene_to_component
+from .fasta import FastaIndex
 from .path_to_sample import (
     path_to_sample,
     sample_re,
@@ -281,8 +282,10 @@ def search(
             "sam"
         )
         subjects = set()
-        export_index = Bio.SeqIO.index(exported, "fasta")
-        ideal = list(get_ideal_components(sim.graph, sim.sample_count))
+        export_index = FastaIndex(exported)
+        ideal = list(
+            get_ideal_components(sim.compact_graph, sim.sample_count)
+        )
         sample_gene_to_component = get_sample_gene_to_component(ideal)
         # TODO: See if we can avoid rebuilding node_to_ccc when only
         # strand_graph is provided.
@@ -297,7 +300,10 @@ def search(
         # cccs ONLY contains the components for which the corresponding
         # nodes can be found in the BLAST results.
         cccs = defaultdict(list)
-        for full_seq_id in tab_search.hits["sseqid"].drop_duplicates():
+        parse_transcript_ids = TranscriptID.batch_parser(parse_transcript_id)
+        full_seq_ids = tab_search.hits["sseqid"].drop_duplicates().tolist()
+        split_ids = []
+        for full_seq_id in full_seq_ids:
             try:
                 seq_id, sample, _ = full_seq_id.split(":")
             except ValueError:
@@ -305,18 +311,30 @@ def search(
                     f"FASTA ID {full_seq_id} in {exported} is missing one or "
                     "more group identifiers (expected 3)."
                 )
-            node = (sample_to_path[sample],) + \
-                parse_transcript_id(seq_id)[1:]
+            split_ids.append((seq_id, sample))
+        parsed = parse_transcript_ids([seq_id for (seq_id, _) in split_ids])
+        for full_seq_id, (_, sample), gene, isoform in zip(
+                full_seq_ids,
+                split_ids,
+                parsed["gene"].tolist(),
+                parsed["isoform"].tolist()
+        ):
+            node = (sample_to_path[sample], gene, isoform)
             cccs[node_to_ccc[node]].append(node)
             subjects.add(full_seq_id)
         sam_paths = []
         if extended_evalue is not None:
             # Get a mapping from gene matches graph nodes to sequence IDs.
             node_to_seq_id = {}
-            for full_seq_id in export_index:
+            export_ids = list(export_index)
+            parsed = parse_transcript_ids(export_ids)
+            for full_seq_id, gene, isoform in zip(
+                    export_ids,
+                    parsed["gene"].tolist(),
+                    parsed["isoform"].tolist()
+            ):
                 seq_id, sample, _ = full_seq_id.split(":")
-                node = (sample_to_path[sample],) + \
-                    parse_transcript_id(full_seq_id)[1:]
+                node = (sample_to_path[sample], gene, isoform)
                 node_to_seq_id[node] = full_seq_id
             # Map sample-gene pairs to ideal component indices.
             # print("Going over component connected components.")
@@ -388,14 +406,8 @@ def search(
                 str(out_dir / "graph.sam"),
                 *map(str, sam_paths)
             )
-        Bio.SeqIO.write(
-            (
-                export_index[x]
-                for x in subjects
-            ),
-            out_dir / "subjects.fasta",
-            "fasta"
-        )
+        with open(out_dir / "subjects.fasta", "wb") as f:
+            export_index.copy(subjects, f)
         return_result = SearchResult(
             tab_search.hits.shape[0],
             len(tab_search.hits["sseqid"].drop_duplicates()),
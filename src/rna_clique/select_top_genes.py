@@ -2,15 +2,21 @@ import heapq
 import sys
 
 import Bio
-import Bio.SeqIO
 
 from pathlib import Path
 from collections import defaultdict
 from collections.abc import Collection
-from typing import Iterator, Callable
+from typing import Iterator, Callable, Optional, BinaryIO
 
 from . import config as config_module
 from . import app
+from .fasta import (
+    FastaRecord,
+    read_fasta,
+    write_fasta,
+    fasta_record_spans,
+    copy_spans
+)
 from .transcripts import TranscriptID, default_parser, TranscriptIDParseError
 from .app import set_except_hook
 
@@ -76,16 +82,31 @@ class TopGeneSelector:
     use cases, the class provides classmethods that construct TopGeneSelector
     objects with such Callables automatically.
 
+    The transcripts need not be Bio.SeqRecord objects; any objects with an id
+    attribute can be used. The from_path classmethod reads the FASTA file with
+    rna_clique.fasta.read_fasta, which yields lightweight FastaRecord objects
+    that are much cheaper to construct than Bio.SeqRecord objects.
+
+    When the transcripts are stored in a FASTA file on disk, the two passes can
+    be avoided entirely. The copy_top_gene_seqs method scans the file once,
+    recording the byte offset and length of each record alongside its parsed
+    k-mer coverage and gene ID, and then copies the records for the top genes
+    directly from those offsets without constructing any SeqRecord objects.
+    This requires the path to the FASTA file, which is set automatically when
+    the TopGeneSelector is constructed with the from_path classmethod.
+
     Attributes:
         transcripts:         Function returning transcript SeqRecord iterator.
         top (int):           Number of top genes to select.
         parse_transcript_id: Function to parse FASTA IDs into TranscriptIDs.
+        path:                Path to the transcripts FASTA file, if known.
     """
     def __init__(
             self,
             transcripts: Callable[[], Iterator[Bio.SeqRecord]],
             top: int,
             parse_transcript_id: Callable[[str], TranscriptID] = default_parser,
+            path: Optional[Path] = None,
     ):
         """Construct a TopGeneSelector for given transcripts and top gene count.
 
@@ -100,10 +121,20 @@ class TopGeneSelector:
             transcripts:         Function to get transcript SeqRecord iterator.
             top (int):           Number of top genes to select.
             parse_transcript_id: Function to parse FASTA IDs into TranscriptIDs.
+            path:                Path to the transcripts FASTA file, if known.
         """
         self.transcripts = transcripts
         self.top = top
         self.parse_transcript_id = parse_transcript_id
+        self.path = path
+
+    def _select_top(self, highest_coverage: dict[int, float]) -> Iterator[int]:
+        """Yield the top genes given the highest coverage for every gene."""
+        for _, k in heapq.nlargest(
+                self.top,
+                ((v, k) for (k, v) in highest_coverage.items())
+        ):
+            yield k
 
     def get_top_genes(self) -> Iterator[int]:
         """Get the gene IDs of the top genes by k-mer coverage."""
@@ -112,24 +143,69 @@ class TopGeneSelector:
             cov, gene, iso = self.parse_transcript_id(t.id)
             gene = int(gene)
             highest_coverage[gene] = max(highest_coverage[gene], float(cov))
-        for _, k in heapq.nlargest(
-                self.top,
-                ((v, k) for (k, v) in highest_coverage.items())
-        ):
-            yield k
+        yield from self._select_top(highest_coverage)
 
-    def get_top_gene_seqs(self):
-        """Get the Bio.SeqRecord objects of the top genes by k-mer coverage."""
+    def _top_gene_records(self) -> Iterator:
+        """Get the records of the top genes as given by transcripts."""
         top_genes = set(self.get_top_genes())
         for t in self.transcripts():
             cov, gene, iso = self.parse_transcript_id(t.id)
             if int(gene) in top_genes:
                 yield t
 
+    def get_top_gene_seqs(self) -> Iterator[Bio.SeqRecord]:
+        """Get the Bio.SeqRecord objects of the top genes by k-mer coverage."""
+        for t in self._top_gene_records():
+            if isinstance(t, FastaRecord):
+                t = t.to_seq_record()
+            yield t
+
+    def copy_top_gene_seqs(self, out: BinaryIO):
+        """Copy the records of the top genes to out in a single pass.
+
+        Unlike get_top_gene_seqs, this method reads the transcripts FASTA file
+        only once. While scanning the file, it records the byte offset and
+        length of every record along with the record's gene ID and k-mer
+        coverage. Once the top genes are known, the selected records are copied
+        verbatim from their recorded offsets, in their original order.
+
+        Since records are copied verbatim, line wrapping and header
+        descriptions are preserved exactly as they appear in the input.
+
+        Parameters:
+            out: Binary file-like object to which to write selected records.
+        """
+        if self.path is None:
+            raise ValueError(
+                "Single-pass selection requires the path to the transcripts."
+            )
+        highest_coverage = defaultdict(float)
+        records = []
+        for id_, offset, length in fasta_record_spans(self.path):
+            cov, gene, _ = self.parse_transcript_id(id_)
+            gene = int(gene)
+            highest_coverage[gene] = max(highest_coverage[gene], float(cov))
+            records.append((gene, offset, length))
+        top_genes = set(self._select_top(highest_coverage))
+        with open(self.path, "rb") as f:
+            copy_spans(
+                f,
+                out,
+                (
+                    (offset, length) for (gene, offset, length) in records
+                    if gene in top_genes
+                )
+            )
+
     @classmethod
     def from_path(cls, path: Path, *args, **kwargs):
         """Get a TopGeneSelector from a Path to the transcripts FASTA file."""
-        return cls(lambda: Bio.SeqIO.parse(path, "fasta"), *args, **kwargs)
+        return cls(
+            lambda: read_fasta(path),
+            *args,
+            path=path,
+            **kwargs
+        )
 
     @classmethod
     def from_sequences(cls, seqs: Collection[Bio.SeqRecord], *args, **kwargs):
@@ -151,12 +227,15 @@ def main():
             )
         else:
             top = TopGeneSelector.from_sequences(
-                list(Bio.SeqIO.parse(sys.stdin, "fasta")),
+                list(read_fasta(sys.stdin.buffer)),
                 config.top_genes,
                 parse_transcript_id,
             )
-        try:            
-            Bio.SeqIO.write(top.get_top_gene_seqs(), sys.stdout, "fasta")
+        try:
+            if top.path is not None:
+                top.copy_top_gene_seqs(sys.stdout.buffer)
+            else:
+                write_fasta(top._top_gene_records(), sys.stdout.buffer)
         except TranscriptIDParseError:
             print("HEY")
             app.print_transcript_id_parse_error_message(
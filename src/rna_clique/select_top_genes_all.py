@@ -1,19 +1,23 @@
-import Bio.SeqIO
-
 from pathlib import Path
 from joblib import Parallel, delayed
 
 from . import config as config_module
 from . import app
 from .select_top_genes import TopGeneSelector
+from .fasta import write_fasta
 from .transcripts import TranscriptID, TranscriptIDParseError
 from .app import set_except_hook, validate_input_dirs
 
+def top_genes_path(out_dir: Path, x: Path) -> Path:
+    """Get the path at which the top genes for a sample directory are saved."""
+    return out_dir / (x.stem + "_top.fasta")
+
 def select_top_and_save(
         out_dir: Path,
         transcripts: str,
         x: Path,
-        *args
+        *args,
+        single_pass: bool = True
 ) -> tuple[Path, str]:
     """Select the top n genes by k-mer coverage from transcripts and save them.
 
@@ -26,23 +30,27 @@ def select_top_and_save(
     TopGeneSelector.from_path classmethod used to construct a TopGeneSelector
     object.
 
+    By default, the top genes are selected in a single pass over the
+    transcripts, and the selected records are copied verbatim into the output
+    file. When single_pass is False, the transcripts are instead parsed twice,
+    and the selected records are rewritten with wrapped sequence lines.
+
     Parameters:
-        out_dir:           Location in which to save top n genes.
-        transcripts (str): Name of the FASTA file containing transcripts.
-        x:                 Directory containing the transcripts FASTA file.
+        out_dir:            Location in which to save top n genes.
+        transcripts (str):  Name of the FASTA file containing transcripts.
+        x:                  Directory containing the transcripts FASTA file.
+        single_pass (bool): Select and copy top genes in one pass.
 
     Returns:
         Path to the output file and the inferred sample name.
     """
-    out = out_dir / (x.stem + "_top.fasta")
-    Bio.SeqIO.write(
-        TopGeneSelector.from_path(
-            x / transcripts,
-            *args
-        ).get_top_gene_seqs(),
-        out,
-        "fasta"
-    )
+    out = top_genes_path(out_dir, x)
+    selector = TopGeneSelector.from_path(x / transcripts, *args)
+    with open(out, "wb") as f:
+        if single_pass:
+            selector.copy_top_gene_seqs(f)
+        else:
+            write_fasta(selector._top_gene_records(), f)
     return (out, x.stem)
 
 def build_parser():
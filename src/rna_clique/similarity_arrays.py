@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+from collections.abc import Iterable, Iterator, Mapping
+from fractions import Fraction
+from typing import Callable, Optional
+
+from multiset_key_dict import FrozenMultiset, MultisetKeyDict
+
+def table_sums(table: pd.DataFrame) -> tuple[int, int]:
+    """Get the numerator and denominator of a table's similarity.
+
+    The numerator is the total number of identical positions, and the
+    denominator is the total length of the alignments, excluding gaps.
+
+    Parameters:
+        table: A (possibly filtered) gene matches table.
+
+    Returns:
+        The numerator and denominator of the similarity for the table's pair.
+    """
+    return (
+        int(table["nident"].sum()),
+        int(table["length"].sum() - table["gaps"].sum())
+    )
+
+class PairArrayMapping(Mapping):
+    """A lazy mapping from unordered pairs of samples to values from arrays.
+
+    Keys are FrozenMultisets of two samples (or one sample with multiplicity
+    two). The value for a pair is computed from the numerator and denominator
+    of its entry in a SimilarityArrays only when the pair is looked up.
+    """
+    def __init__(
+            self,
+            arrays: "SimilarityArrays",
+            value: Callable[[int, int], Fraction]
+    ):
+        """Construct a PairArrayMapping for the given arrays.
+
+        Parameters:
+            arrays: The SimilarityArrays holding the numerators and
+                    denominators.
+            value:  Function computing a value from a numerator and
+                    denominator.
+        """
+        self._arrays = arrays
+        self._value = value
+
+    def _indices(self, k: FrozenMultiset) -> tuple[int, int]:
+        elements = [x for (x, count) in k for _ in range(count)]
+        if len(elements) != 2:
+            raise KeyError(k)
+        try:
+            i, j = (self._arrays.codes[x] for x in elements)
+        except KeyError:
+            raise KeyError(k)
+        if not self._arrays.present[i, j]:
+            raise KeyError(k)
+        return i, j
+
+    def __getitem__(self, k: FrozenMultiset) -> Fraction:
+        i, j = self._indices(FrozenMultiset(k))
+        return self._value(
+            int(self._arrays.numerators[i, j]),
+            int(self._arrays.denominators[i, j])
+        )
+
+    def __iter__(self) -> Iterator[FrozenMultiset]:
+        samples = self._arrays.samples
+        for i, j in zip(*np.nonzero(np.triu(self._arrays.present))):
+            yield FrozenMultiset((samples[i], samples[j]))
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(np.triu(self._arrays.present)))
+
+class SimilarityArrays:
+    """Exact similarities between pairs of samples, stored as integer arrays.
+
+    The similarity between two samples is a fraction whose numerator is the
+    total number of identical positions in the alignments of their (filtered)
+    gene matches table and whose denominator is the total length of those
+    alignments, excluding gaps. A SimilarityArrays stores the numerators and
+    denominators for all pairs of samples in two symmetric int64 matrices
+    indexed by sample code, so similarity and dissimilarity matrices can be
+    computed by elementwise division instead of one lookup per pair. Each
+    sample is similar to itself with similarity 1/1.
+
+    Attributes:
+        samples (list):       Names of the samples, sorted.
+        codes (dict):         Mapping from sample names to their codes.
+        numerators:           Numerators of the similarities.
+        denominators:         Denominators of the similarities.
+        present:              Whether the similarity of each pair is known.
+    """
+    def __init__(
+            self,
+            samples: Iterable[str],
+            numerators: np.ndarray,
+            denominators: np.ndarray,
+            present: Optional[np.ndarray] = None
+    ):
+        """Construct a SimilarityArrays from existing arrays.
+
+        Parameters:
+            samples:      Names of the samples, in order of sample codes.
+            numerators:   Numerators of the similarities.
+            denominators: Denominators of the similarities.
+            present:      Whether each pair's similarity is known (default:
+                          every pair is known).
+        """
+        self.samples = list(samples)
+        self.codes = {s: i for (i, s) in enumerate(self.samples)}
+        self.numerators = np.asarray(numerators, dtype=np.int64)
+        self.denominators = np.asarray(denominators, dtype=np.int64)
+        if present is None:
+            present = np.ones(self.numerators.shape, dtype=bool)
+        self.present = np.asarray(present, dtype=bool)
+
+    @classmethod
+    def from_sums(
+            cls,
+            sums: Iterable[tuple[frozenset[str], int, int]]
+    ) -> "SimilarityArrays":
+        """Make a SimilarityArrays from the sums for pairs of samples.
+
+        This method raises a ZeroDivisionError if the denominator for some pair
+        of samples is zero, as similarities_from_dfs does.
+
+        Parameters:
+            sums: The pair, numerator, and denominator for each pair of samples.
+
+        Returns:
+            A SimilarityArrays holding the similarities of the given pairs.
+        """
+        first = []
+        second = []
+        numerators = []
+        denominators = []
+        for pair, num, den in sums:
+            if den == 0:
+                raise ZeroDivisionError(
+                    f"Similarity for {set(pair)} has denominator zero."
+                )
+            a, b = tuple(pair) * (2 if len(pair) == 1 else 1)
+            first.append(a)
+            second.append(b)
+            numerators.append(num)
+            denominators.append(den)
+        samples = sorted(set(first) | set(second))
+        codes = {s: i for (i, s) in enumerate(samples)}
+        i = np.fromiter((codes[a] for a in first), np.intp, len(first))
+        j = np.fromiter((codes[b] for b in second), np.intp, len(second))
+        n = len(samples)
+        num_arr = np.zeros((n, n), dtype=np.int64)
+        den_arr = np.zeros((n, n), dtype=np.int64)
+        present = np.zeros((n, n), dtype=bool)
+        for x, y in [(i, j), (j, i)]:
+            num_arr[x, y] = numerators
+            den_arr[x, y] = denominators
+            present[x, y] = True
+        diagonal = np.arange(n)
+        num_arr[diagonal, diagonal] = 1
+        den_arr[diagonal, diagonal] = 1
+        present[diagonal, diagonal] = True
+        return cls(samples, num_arr, den_arr, present)
+
+    def _check_complete(self):
+        if not self.present.all():
+            i, j = np.argwhere(~self.present)[0]
+            raise KeyError(
+                FrozenMultiset((self.samples[i], self.samples[j]))
+            )
+
+    def similarity_matrix(self) -> np.ndarray:
+        """Get the matrix of similarities, in order of sample codes.
+
+        Raises a KeyError if the similarity of some pair is not known.
+        """
+        self._check_complete()
+        return self.numerators / self.denominators
+
+    def dissimilarity_matrix(self) -> np.ndarray:
+        """Get the matrix of dissimilarities, 1 minus the similarities.
+
+        The differences are computed exactly before dividing, so the result is
+        the same as converting each exact dissimilarity to a float.
+
+        Raises a KeyError if the similarity of some pair is not known.
+        """
+        self._check_complete()
+        return (self.denominators - self.numerators) / self.denominators
+
+    def mapping(
+            self,
+            value: Callable[[int, int], Fraction] = Fraction
+    ) -> MultisetKeyDict:
+        """Get a lazy MultisetKeyDict view of values computed from the arrays.
+
+        Parameters:
+            value: Function computing a value from a numerator and denominator.
+
+        Returns:
+            A MultisetKeyDict mapping pairs of samples to their values.
+        """
+        res = MultisetKeyDict()
+        res._dict = PairArrayMapping(self, value)
+        return res
@@ -17,6 +17,7 @@ from multiset_key_dict import MultisetKeyDict
 
 from .gene_matches_tables import read_table
 from .identity import id_
+from .similarity_arrays import SimilarityArrays, table_sums
 
 def similarities_from_dfs(
     tables: Iterable[tuple[frozenset[str], pd.DataFrame]]
@@ -34,12 +35,20 @@ def similarities_from_dfs(
     considered undefined or unknown.
     """
     
+    for pair, num, den in similarity_sums_from_dfs(tables):
+        yield pair, Fraction(num, den)
+
+def similarity_sums_from_dfs(
+    tables: Iterable[tuple[frozenset[str], pd.DataFrame]]
+) -> Iterable[tuple[frozenset[str], int, int]]:
+    """Yield similarity numerators and denominators using gene matches tables.
+
+    Each value yielded is a triple containing the frozenset of the IDs of the
+    two samples, the numerator of their similarity, and its denominator. The
+    fractions are not reduced, and no error is raised for a zero denominator.
+    """
     for (qsample, ssample), restricted in tables:
-        dist = Fraction(
-            int(restricted["nident"].sum()),
-            int(restricted["length"].sum() - restricted["gaps"].sum())
-        )
-        yield frozenset((qsample, ssample)), dist        
+        yield (frozenset((qsample, ssample)), *table_sums(restricted))
 
 class ComparisonSimilarityComputer:
     """Base class for computing similarities from comparison statistics.
@@ -213,18 +222,37 @@ class ComparisonSimilarityComputer:
         """
         raise NotImplementedError()
 
+    def _similarity_sum_helper(
+            self
+    ) -> Iterator[tuple[frozenset[str], int, int]]:
+        """Get implicit mapping from sample pairs to similarity fractions.
+
+        This method returns a generator yielding triples containing an
+        unordered pair of samples and the numerator and denominator of their
+        similarity. By default, the fractions are obtained from
+        _similarity_helper, but subclasses can override this method to avoid
+        constructing a Fraction for each pair.
+        """
+        for pair, sim in self._similarity_helper():
+            sim = Fraction(sim)
+            yield pair, sim.numerator, sim.denominator
+
     @cached_property
-    def similarities(self):
-        """The similarities between pairs of samples."""
-        sims = MultisetKeyDict(self._similarity_helper())
-        self._samples = sorted(list(sims.key_elements()))
-        #print(sims._dict)
-        res = sims | MultisetKeyDict(
-            {(s, s): 1 for s in self._samples}
-        )
-        #print(res._dict)
+    def similarity_arrays(self) -> SimilarityArrays:
+        """Numerators and denominators of the similarities, as arrays."""
+        res = SimilarityArrays.from_sums(self._similarity_sum_helper())
+        self._samples = res.samples
         return res
 
+    @cached_property
+    def similarities(self):
+        """The similarities between pairs of samples.
+
+        The similarities are a lazy view of similarity_arrays; each similarity
+        is constructed as a Fraction when it is accessed.
+        """
+        return self.similarity_arrays.mapping()
+
     @classmethod
     def similarity_to_dissimilarity(cls, sim: Real) -> Real:
         """Obtain a dissimilarity (or distasnce) from a similarity.
@@ -241,13 +269,10 @@ class ComparisonSimilarityComputer:
 
     def get_dissimilarities(self) -> MultisetKeyDict[Any, Real]:
         """Returns the dissimilarities between pairs of samples."""
-        #res = MultisetKeyDict(self.similarities)
-        #for k, v in res.
-        return MultisetKeyDict(
-            {
-                p: self.similarity_to_dissimilarity(s)
-                for (p, s) in self.similarities.items()
-            }
+        return self.similarity_arrays.mapping(
+            lambda num, den: self.similarity_to_dissimilarity(
+                Fraction(num, den)
+            )
         )
 
     def get_similarities(self) -> MultisetKeyDict[Any, Real]:
@@ -319,7 +344,7 @@ class ComparisonSimilarityComputer:
         Returns:
             A matrix giving the similarity for each pair of samples.
         """
-        return self._pair_dict_to_matrix(self.get_similarities())
+        return self.similarity_arrays.similarity_matrix()
 
     def _matrix_to_df(self, mat: np.ndarray) -> pd.DataFrame:
         """Convert a matrix of values for pairs of samples to a dataframe.
@@ -362,6 +387,10 @@ class ComparisonSimilarityComputer:
         Returns:
             A matrix giving the dissimilarity for each pair of samples.
         """
+        base = ComparisonSimilarityComputer.similarity_to_dissimilarity
+        if type(self).similarity_to_dissimilarity.__func__ is base.__func__:
+            # The default dissimilarity can be computed on the arrays.
+            return self.similarity_arrays.dissimilarity_matrix()
         return self._pair_dict_to_matrix(self.get_dissimilarities())
 
     def get_dissimilarity_df(self) -> pd.DataFrame:
@@ -380,6 +409,7 @@ class ComparisonSimilarityComputer:
             comparison_fns: Iterable[Path],
             store_dfs: bool = True,
             *args,
+            read_options: Optional[dict[str, Any]] = None,
             **kwargs
     ) -> tuple[list, dict[str, Any]]:
         """Get constructor arguments for constructing from filenames.
@@ -387,6 +417,7 @@ class ComparisonSimilarityComputer:
         Parameters:
             comparison_fns:   Iterable of Paths to gene matches tables.
             store_dfs (bool): Whether to store gene matches tables in memory.
+            read_options:     Keyword arguments for _read_table.
 
         Returns:
             The positional and keyword constructor arguments.
@@ -395,7 +426,9 @@ class ComparisonSimilarityComputer:
             f = MultisetKeyDict
         else:
             f = id_
-        args = [f(cls._load_tables(comparison_fns))] + list(args)
+        args = [
+            f(cls._load_tables(comparison_fns, **(read_options or {})))
+        ] + list(args)
         return args, kwargs
 
     @classmethod
@@ -0,0 +1,212 @@
+import functools
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from pathlib import Path
+from collections.abc import Mapping
+from typing import Any, Optional
+
+from .gene_matches_tables import file_sha256, read_table, write_table
+
+@functools.lru_cache(maxsize=1024)
+def _cached_sha256(path: Path, size: int, mtime_ns: int) -> str:
+    return file_sha256(path)
+
+def content_sha256(path: Path) -> str:
+    """Return the SHA-256 digest of a file, reusing it while it is unchanged.
+
+    The digest is memoized on the path, size, and modification time of the
+    file, so a file used in many pairs is only read once per process.
+    """
+    path = Path(path).resolve()
+    st = path.stat()
+    return _cached_sha256(path, st.st_size, st.st_mtime_ns)
+
+class TableCache:
+    """Shares gene matches tables between analyses with the same inputs.
+
+    Analyses with overlapping sets of samples (subsets of an analysis, runs
+    with different titles, or runs repeated after changing metadata) compute
+    many of the same gene matches tables. A TableCache stores every computed
+    table in a directory that can be shared by any number of analyses, keyed
+    by the contents of the two top genes FASTA files and the settings that
+    affect the table. A pair whose inputs are byte-for-byte identical to those
+    of a cached pair is not searched again.
+
+    The sample columns of a gene matches table contain the paths to the top
+    genes FASTA files, which differ between analyses, so tables are cached
+    without them and labelled again when they are restored. Cached tables are
+    written atomically, so several analyses may use the same cache at once.
+
+    The total size of the cache is bounded. Restoring a table marks it as
+    recently used, and when storing a table would make the cache exceed its
+    maximum size, the least recently used tables are deleted.
+
+    Attributes:
+        directory:       Directory containing the cached tables.
+        params (dict):   Settings that affect the contents of the tables.
+        max_size (int):  Maximum total size of the cached tables, in bytes.
+    """
+    # Increment when the contents of cached tables change for the same inputs.
+    version = 1
+    extension = "h5"
+
+    def __init__(
+            self,
+            directory: Path,
+            params: Mapping[str, Any],
+            max_size: Optional[int] = None
+    ):
+        """Construct a TableCache stored in the given directory.
+
+        Parameters:
+            directory:      Directory containing the cached tables.
+            params (dict):  Settings that affect the contents of the tables.
+            max_size (int): Maximum total size of the cache, in bytes.
+        """
+        self.directory = Path(directory)
+        self.params = dict(params)
+        self.max_size = max_size
+        self._params_key = json.dumps(
+            {"version": type(self).version} | self.params,
+            sort_keys=True,
+            default=str
+        )
+
+    @classmethod
+    def from_config(cls, config) -> Optional["TableCache"]:
+        """Get the TableCache configured for an analysis, if any.
+
+        Parameters:
+            config: The configuration for the analysis.
+
+        Returns:
+            A TableCache, or None if no table cache directory is configured.
+        """
+        if not config.table_cache_dir:
+            return None
+        return cls(
+            config.table_cache_dir,
+            {
+                "top_matches": config.top_matches,
+                "evalue": config.evalue,
+                "keep_all": config.keep_all,
+                "transcript_id_regex": config.transcript_id_regex.pattern,
+                # Pooled and per-pair searches run BLAST differently, so their
+                # tables are not shared.
+                "pooled_blast": config.pooled_blast,
+            },
+            max_size=None if config.table_cache_size is None else int(
+                config.table_cache_size * 1e9
+            )
+        )
+
+    def key(self, transcripts1: Path, transcripts2: Path) -> str:
+        """Get the cache key for an ordered pair of top genes FASTA files.
+
+        Parameters:
+            transcripts1: Path to the top n transcripts for the first sample.
+            transcripts2: Path to the top n transcripts for the second sample.
+
+        Returns:
+            A hex digest identifying the table for the pair.
+        """
+        h = hashlib.sha256()
+        for t in [transcripts1, transcripts2]:
+            h.update(bytes.fromhex(content_sha256(t)))
+        h.update(self._params_key.encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> Path:
+        """Get the path of the cached table with the given key."""
+        return self.directory / key[:2] / f"{key}.{type(self).extension}"
+
+    def __contains__(self, pair: tuple[Path, Path]) -> bool:
+        return self.path(self.key(*pair)).exists()
+
+    def get(
+            self,
+            transcripts1: Path,
+            transcripts2: Path
+    ) -> Optional[pd.DataFrame]:
+        """Get the cached table for a pair of samples, if there is one.
+
+        The returned table does not have the sample columns.
+
+        Parameters:
+            transcripts1: Path to the top n transcripts for the first sample.
+            transcripts2: Path to the top n transcripts for the second sample.
+
+        Returns:
+            The cached gene matches table, or None if it is not cached.
+        """
+        path = self.path(self.key(transcripts1, transcripts2))
+        try:
+            table = read_table(path)
+            # The modification time records when the table was last used.
+            os.utime(path)
+        except (FileNotFoundError, OSError):
+            return None
+        return table
+
+    def put(
+            self,
+            transcripts1: Path,
+            transcripts2: Path,
+            table: pd.DataFrame
+    ):
+        """Store the table for a pair of samples, evicting old tables if needed.
+
+        Parameters:
+            transcripts1: Path to the top n transcripts for the first sample.
+            transcripts2: Path to the top n transcripts for the second sample.
+            table:        The gene matches table for the pair.
+        """
+        path = self.path(self.key(transcripts1, transcripts2))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_table(
+            table.drop(columns=["ssample", "qsample"], errors="ignore"),
+            path
+        )
+        self.evict()
+
+    def size(self) -> int:
+        """Get the total size of the cached tables, in bytes."""
+        return sum(st.st_size for (_, st) in self._entries())
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        res = []
+        for path in self.directory.glob(f"*/*.{type(self).extension}"):
+            try:
+                res.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        return res
+
+    def evict(self, max_size: Optional[int] = None) -> list[Path]:
+        """Delete the least recently used tables until the cache fits.
+
+        Parameters:
+            max_size (int): Size to which to shrink the cache, if not max_size.
+
+        Returns:
+            The paths of the deleted tables.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return []
+        entries = self._entries()
+        total = sum(st.st_size for (_, st) in entries)
+        removed = []
+        for path, st in sorted(entries, key=lambda e: e[1].st_mtime_ns):
+            if total <= max_size:
+                break
+            # Another process may have evicted the same table already.
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+            removed.append(path)
+        return removed
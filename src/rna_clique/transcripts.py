@@ -1,6 +1,9 @@
 import re
 
-from typing import Callable, Any
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Any, Iterable
 from collections import namedtuple
 
 # This default regex is based on the transcript ID format used in rnaSPAdes
@@ -63,9 +66,42 @@ TranscriptID = cast_namedtuple(
     [float, int, int]
 )
 
+# Types of the columns produced by batch transcript ID parsers.
+batch_dtypes = {
+    "coverage": np.float32,
+    "gene": np.int64,
+    "isoform": np.int64
+}
+
 class TranscriptIDParseError(Exception):
     pass
 
+def transcript_id_groups(cls: type, expr: re.Pattern) -> dict[str, int]:
+    """Get the capture group index for each field of a TranscriptID.
+
+    The groups are assigned using the same rules as re_parse_transcript_id;
+    named groups are used for the fields they name, and the remaining fields
+    are assigned the non-named groups in order. A field whose positional group
+    does not exist in the regex is mapped to a group index greater than
+    expr.groups.
+
+    Parameters:
+        cls:  The TranscriptID class.
+        expr: Regular expression for parsing transcript FASTA IDs.
+
+    Returns:
+        A dict mapping TranscriptID field names to capture group indices.
+    """
+    groups = {
+        f: expr.groupindex[f] for f in cls._fields if f in expr.groupindex
+    }
+    named = set(expr.groupindex.values())
+    positional = (i for i in range(1, expr.groups + 2) if i not in named)
+    for field in cls._fields:
+        if field not in groups:
+            groups[field] = next(positional, expr.groups + 1)
+    return groups
+
 def re_parse_transcript_id(
         cls: type,
         expr: re.Pattern
@@ -123,8 +159,107 @@ def re_parse_transcript_id(
                     f"Could not parse transcript ID {id_}."
                 )                
         return TranscriptID(**d)
+    parse_transcript_id.regex = expr
     return parse_transcript_id
 
+def re_batch_parse_transcript_ids(
+        cls: type,
+        expr: re.Pattern
+) -> Callable[[Iterable[str]], pd.DataFrame]:
+    """Create a function that parses many transcript FASTA IDs at once.
+
+    The returned function accepts a Series (or other iterable) of FASTA IDs and
+    returns a DataFrame with coverage, gene, and isoform columns, indexed like
+    the input. Capture groups are interpreted using the same rules as
+    re_parse_transcript_id.
+
+    Parsing is vectorized. The distinct IDs are found first, so that each is
+    matched against the regex only once, and the regex is applied to all of
+    them in a single call to Series.str.extract. Coverages are returned as
+    float32, and gene and isoform IDs are returned as int64.
+
+    Parameters:
+        expr: Regular expression for parsing transcript FASTA IDs.
+
+    Returns:
+        A function that uses the regex to parse FASTA IDs into a DataFrame.
+    """
+    groups = transcript_id_groups(cls, expr)
+    def parse_transcript_ids(ids: Iterable[str]) -> pd.DataFrame:
+        """Parse the given FASTA IDs into a DataFrame using a regex.
+
+        This function was created using the re_batch_parse_transcript_ids
+        function; the regex this function uses was provided to that function.
+
+        Parameters:
+            ids: The FASTA IDs to parse.
+
+        Returns:
+            A DataFrame with one row of TranscriptID fields per FASTA ID.
+        """
+        if not isinstance(ids, pd.Series):
+            ids = pd.Series(list(ids), dtype=object)
+        codes, uniques = pd.factorize(ids)
+        if len(uniques) and max(groups.values()) > expr.groups:
+            raise TranscriptIDParseError(
+                f"Could not parse transcript ID {uniques[0]}."
+            )
+        extracted = pd.Series(uniques, dtype=object).str.extract(expr)
+        columns = {}
+        for field in cls._fields:
+            values = extracted.iloc[:, groups[field] - 1]
+            missing = values.isna().to_numpy()
+            if missing.any():
+                raise TranscriptIDParseError(
+                    f"Could not parse transcript ID {uniques[missing][0]}."
+                )
+            try:
+                values = values.astype(batch_dtypes[field]).to_numpy()
+            except ValueError:
+                raise TranscriptIDParseError(
+                    f"Could not convert {field} in parsed transcript IDs."
+                )
+            columns[field] = values[codes]
+        return pd.DataFrame(columns, index=ids.index)
+    return parse_transcript_ids
+
+def batch_parser(
+        cls: type,
+        parse_transcript_id: Callable[[str], TranscriptID]
+) -> Callable[[Iterable[str]], pd.DataFrame]:
+    """Get a batch parser equivalent to the given transcript ID parser.
+
+    When the parser was created with re_parse_transcript_id, the returned
+    function parses IDs with the same regex using
+    re_batch_parse_transcript_ids. Otherwise, the returned function applies the
+    given parser to each distinct ID and assembles the results into a
+    DataFrame with the same columns and types.
+
+    Parameters:
+        parse_transcript_id: Function to parse one FASTA ID into a TranscriptID.
+
+    Returns:
+        A function that parses FASTA IDs into a DataFrame.
+    """
+    regex = getattr(parse_transcript_id, "regex", None)
+    if regex is not None:
+        return re_batch_parse_transcript_ids(cls, regex)
+    def parse_transcript_ids(ids: Iterable[str]) -> pd.DataFrame:
+        if not isinstance(ids, pd.Series):
+            ids = pd.Series(list(ids), dtype=object)
+        codes, uniques = pd.factorize(ids)
+        parsed = pd.DataFrame(
+            [parse_transcript_id(u) for u in uniques],
+            columns=list(cls._fields)
+        ).astype(batch_dtypes)
+        return pd.DataFrame(
+            {f: parsed[f].to_numpy()[codes] for f in cls._fields},
+            index=ids.index
+        )
+    return parse_transcript_ids
+
 TranscriptID.parser_from_re = classmethod(re_parse_transcript_id)
+TranscriptID.batch_parser_from_re = classmethod(re_batch_parse_transcript_ids)
+TranscriptID.batch_parser = classmethod(batch_parser)
 
 default_parser = TranscriptID.parser_from_re(default_gene_re)
@@ -1,7 +1,8 @@
 from . import config as config_module
 from .similarity_computer import (
     ComparisonSimilarityComputer,
-    similarities_from_dfs
+    similarities_from_dfs,
+    similarity_sums_from_dfs
 )
 from .gene_matches_tables import get_table_files
 from .app import set_except_hook, eprint
@@ -14,6 +15,9 @@ class UnfilteredSimilarity(ComparisonSimilarityComputer):
     """
     def _similarity_helper(self):
         return similarities_from_dfs(self.comparison_dfs)
+
+    def _similarity_sum_helper(self):
+        return similarity_sums_from_dfs(self.comparison_dfs)
     
 def build_parser():
     arg_config = config_module.RNACliqueConfigArgumentManager(